@@ -0,0 +1,130 @@
+from flask import Blueprint, current_app, jsonify, request
+
+import cache
+import edits
+import pagination
+import profiles
+import search_index
+import stats
+from db import get_db_connection
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# every column a client may ask for with ?fields= (core and profile)
+PERSON_FIELDS = profiles.ALL_COLUMNS
+
+TYPEAHEAD_LIMIT = 10
+
+
+class BadRequest(ValueError):
+    pass
+
+
+@bp.errorhandler(BadRequest)
+def bad_request(e):
+    return jsonify(error=str(e)), 400
+
+# ========================
+# Helpers
+# ========================
+def _fields(default):
+    """Parse ?fields=a,b into a validated column list (id is always included)"""
+    raw = request.args.get('fields')
+    if not raw:
+        return list(default)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in PERSON_FIELDS]
+    if unknown:
+        raise BadRequest(f"Unknown field(s): {', '.join(unknown)}")
+    return ['id'] + [f for f in fields if f != 'id']
+
+
+def _conditional(payload):
+    """JSON response with a body ETag; answers If-None-Match with 304"""
+    response = jsonify(payload)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def _row(row, fields):
+    return {f: row[f] for f in fields}
+
+# ========================
+# Identities
+# ========================
+@bp.route('/identities')
+def list_identities():
+    fields = _fields(pagination.LIST_COLUMNS)
+    sort = request.args.get('sort', 'id')
+    if sort not in pagination.SORT_COLUMNS:
+        raise BadRequest(f"Cannot sort by {sort}")
+    direction = 'desc' if request.args.get('dir') == 'desc' else 'asc'
+    limit = pagination.clamp_page_size(request.args.get('limit'))
+    try:
+        rows, next_cursor = pagination.fetch_page(get_db_connection(), sort, direction,
+                                                  request.args.get('cursor'), limit, fields)
+    except pagination.InvalidCursor as e:
+        raise BadRequest(str(e))
+    return _conditional({'data': [_row(r, fields) for r in rows], 'next_cursor': next_cursor})
+
+
+@bp.route('/identities/<uid>')
+def get_identity(uid):
+    fields = _fields(PERSON_FIELDS)
+    row = cache.get_person(uid)
+    if not row:
+        return jsonify(error="Identity not found"), 404
+    return _conditional(_row(row, fields))
+
+
+@bp.route('/identities/batch', methods=['POST'])
+def batch_edit():
+    """Apply {"set": {...}} to {"ids": [...]} or to every identity matching {"where": {...}}"""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise BadRequest("Expected a JSON object")
+    try:
+        changed = edits.batch_edit(get_db_connection(), body.get('set'), ids=body.get('ids'), where=body.get('where'))
+    except edits.EditError as e:
+        raise BadRequest(str(e))
+    if changed:
+        cache.invalidate_identity(*changed)
+    return jsonify(updated=len(changed), ids=changed)
+
+# ========================
+# Search
+# ========================
+@bp.route('/search')
+async def search():
+    fields = _fields(search_index.RESULT_COLUMNS)
+    page = max(request.args.get('page', 1, type=int), 1)
+    limit = pagination.clamp_page_size(request.args.get('limit'), 20)
+    rows, total = await current_app.extensions['db_gateway'].run(
+        search_index.search_people,
+        query=request.args.get('q', '').strip(),
+        type_filter=request.args.get('type', ''),
+        status_filter=request.args.get('status', ''),
+        year_filter=request.args.get('year', '').strip(),
+        department_filter=request.args.get('department', '').strip(),
+        page=page, page_size=limit, columns=fields)
+    return _conditional({'data': [_row(r, fields) for r in rows], 'total': total, 'page': page,
+                         'pages': (total + limit - 1) // limit})
+
+
+@bp.route('/typeahead')
+async def typeahead():
+    """id + display name for name prefixes, for autocomplete widgets"""
+    limit = min(request.args.get('limit', TYPEAHEAD_LIMIT, type=int), 50)
+    rows = await current_app.extensions['db_gateway'].run(search_index.typeahead, request.args.get('q', ''),
+                                                          max(limit, 1))
+    response = _conditional([{'id': r['id'], 'name': f"{r['first_name']} {r['last_name']}"} for r in rows])
+    response.cache_control.max_age = 30
+    return response
+
+# ========================
+# Statistics
+# ========================
+@bp.route('/stats')
+def statistics():
+    """Head counts by type, status, department and entry year (see stats.py)"""
+    return _conditional(stats.load_stats(get_db_connection()))
@@ -0,0 +1,116 @@
+import re
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from db import get_db_connection
+
+AUDIT_COLUMNS = ['id', 'person_id', 'changed_at', 'field', 'old_value', 'new_value']
+ARCHIVE_PREFIX = 'AuditArchive_'
+
+# ========================
+# Indexes
+# ========================
+def init_audit_indexes(cur):
+    """Per-person history lookups and age-based archival both become index range scans"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_person_changed ON Audit(person_id, changed_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_changed_at ON Audit(changed_at)")
+
+# ========================
+# Writes
+# ========================
+def record_changes(conn, uid, changes, changed_at=None):
+    """Insert one Audit row per (field, old, new) change with a single executemany"""
+    changed_at = changed_at or datetime.now().isoformat()
+    conn.executemany("INSERT INTO Audit (person_id,changed_at,field,old_value,new_value) VALUES (?,?,?,?,?)",
+                     [(uid, changed_at, f, old, new) for f, old, new in changes])
+
+# ========================
+# History
+# ========================
+def archive_tables(conn):
+    """Names of the yearly archive tables, oldest first"""
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE ? ORDER BY name",
+                        (ARCHIVE_PREFIX + '%',)).fetchall()
+    return [r[0] for r in rows if re.fullmatch(ARCHIVE_PREFIX + r'\d{4}', r[0])]
+
+
+def load_history(conn, uid):
+    """Audit rows for uid across the live table and every archive, newest first"""
+    cols = ', '.join(AUDIT_COLUMNS)
+    tables = ['Audit'] + archive_tables(conn)
+    sql = ' UNION ALL '.join(f"SELECT {cols} FROM {t} WHERE person_id=?" for t in tables)
+    return conn.execute(sql + " ORDER BY changed_at DESC", [uid] * len(tables)).fetchall()
+
+# ========================
+# Retention
+# ========================
+def _ensure_archive(conn, year):
+    table = f"{ARCHIVE_PREFIX}{year}"
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    person_id TEXT,
+                    changed_at TEXT,
+                    field TEXT,
+                    old_value TEXT,
+                    new_value TEXT
+                )''')
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table.lower()}_person ON {table}(person_id, changed_at)")
+    return table
+
+
+def archive_audit(conn, older_than_days, chunk_size=5000):
+    """Move Audit rows older than the cutoff into AuditArchive_<year> tables.
+
+    Works in chunks of `chunk_size` rows, one short BEGIN IMMEDIATE transaction
+    each, so request traffic is never blocked for long. Returns {archive table: rows moved}.
+    """
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+    moved = {}
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS audit_batch (id INTEGER PRIMARY KEY)")
+    conn.commit()
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM temp.audit_batch")
+            conn.execute("INSERT INTO temp.audit_batch SELECT id FROM Audit WHERE changed_at < ? "
+                         "ORDER BY changed_at LIMIT ?", (cutoff, chunk_size))
+            years = [r[0] for r in conn.execute(
+                "SELECT DISTINCT substr(a.changed_at, 1, 4) FROM Audit a JOIN temp.audit_batch b ON a.id = b.id")]
+            if not years:
+                conn.rollback()
+                break
+            cols = ', '.join(AUDIT_COLUMNS)
+            for year in years:
+                # rows with an unparseable timestamp land in AuditArchive_0000
+                table = _ensure_archive(conn, year if re.fullmatch(r'\d{4}', year or '') else '0000')
+                cur = conn.execute(f"""INSERT INTO {table} ({cols})
+                                       SELECT {', '.join('a.' + c for c in AUDIT_COLUMNS)}
+                                       FROM Audit a JOIN temp.audit_batch b ON a.id = b.id
+                                       WHERE substr(a.changed_at, 1, 4) = ?""", (year,))
+                moved[table] = moved.get(table, 0) + cur.rowcount
+            conn.execute("DELETE FROM Audit WHERE id IN (SELECT id FROM temp.audit_batch)")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return moved
+
+# ========================
+# CLI
+# ========================
+@click.command("archive-audit")
+@click.option("--older-than-days", type=int, default=None,
+              help="Archive rows older than this (default AUDIT_RETENTION_DAYS).")
+@click.option("--chunk-size", default=5000, show_default=True, help="Rows moved per transaction.")
+@with_appcontext
+def archive_audit_command(older_than_days, chunk_size):
+    """Move old Audit rows into yearly archive tables."""
+    days = older_than_days if older_than_days is not None else current_app.config['AUDIT_RETENTION_DAYS']
+    moved = archive_audit(get_db_connection(), days, chunk_size)
+    if not moved:
+        click.echo(f"No audit rows older than {days} days")
+    for table, count in sorted(moved.items()):
+        click.echo(f"Archived {count} rows into {table}")
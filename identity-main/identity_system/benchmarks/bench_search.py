@@ -0,0 +1,75 @@
+"""Compare the FTS5 search path with the old LIKE scan.
+
+    python benchmarks/bench_search.py --rows 100000 --rows 1000000
+
+Each size is seeded into a throwaway database (DATABASE_PATH is pointed at a
+temp file before the app is imported), then both paths run the same queries.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import seed as seeding  # noqa: E402
+
+QUERIES = [('benal', ''), ('sara haddad', ''), ('zzzz', ''), ('', 'physics'), ('omar', 'computer')]
+
+# the pre-FTS /search query (against the profile tables), kept here for comparison
+LIKE_SQL = """SELECT * FROM People p
+    LEFT JOIN FacultyProfile f ON f.person_id = p.id
+    LEFT JOIN StaffProfile s ON s.person_id = p.id
+    WHERE 1=1{name}{dept} ORDER BY first_name, last_name"""
+
+
+def like_search(conn, query, dept):
+    params = []
+    name = dept_sql = ""
+    if query:
+        name = " AND (first_name LIKE ? OR last_name LIKE ? OR email LIKE ?)"
+        params.extend([f"%{query}%"] * 3)
+    if dept:
+        dept_sql = " AND (primary_department LIKE ? OR staff_department LIKE ?)"
+        params.extend([f"%{dept}%"] * 2)
+    return conn.execute(LIKE_SQL.format(name=name, dept=dept_sql), params).fetchall()
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, action='append', help='table sizes (default 100000 and 1000000)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for rows in args.rows or [100000, 1000000]:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ['DATABASE_PATH'] = os.path.join(tmp, 'bench.db')
+            import db
+            import search_index
+            started = time.perf_counter()
+            seeding.create_database(os.environ['DATABASE_PATH'], rows)
+            conn = db.connect(os.environ['DATABASE_PATH'])
+            print(f"\n{rows} rows seeded in {time.perf_counter() - started:.1f}s")
+            print(f"{'query':<24}{'LIKE ms':>10}{'FTS ms':>10}{'speedup':>10}")
+            for query, dept in QUERIES:
+                like_ms = timed(lambda: like_search(conn, query, dept), args.repeat)
+                fts_ms = timed(lambda: search_index.search_people(conn, query=query, department_filter=dept),
+                               args.repeat)
+                label = f"{query!r}/{dept!r}"
+                print(f"{label:<24}{like_ms:>10.1f}{fts_ms:>10.1f}{like_ms / fts_ms:>9.1f}x")
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""Throughput and latency of the main identity workflows.
+
+    python benchmarks/bench_workflows.py --rows 10000 --rows 100000 --output results.json
+    python benchmarks/bench_workflows.py --mode http --concurrency 1 --concurrency 16
+    python benchmarks/bench_workflows.py --response-cache off --compression off --output baseline.json
+    python benchmarks/compare.py baseline.json results.json
+
+Each population size is seeded into a throwaway database (see seed.py), then
+/create, /, /search, /view_all, /view/<uid> and /edit/<uid> are driven through
+the Flask test client (in-process, sequential) and/or over HTTP by concurrent
+clients against a threaded server. With --url the HTTP clients target an
+already running server instead; serve a database made by seed.py so the
+seeded ids exist. Results are written as JSON for compare.py.
+
+Besides latency, each scenario reports the response bytes received per request
+(compressed size when --accept-encoding is sent, 0 for a 304) and the CPU time
+of this process per request. In-process that covers server and clients
+together, so compare it between runs rather than reading it as server cost;
+with --url it is the clients' alone.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import seed as seeding  # noqa: E402
+
+SCENARIOS = ['create', 'index', 'search', 'view_all', 'view', 'edit']
+SEARCH_TERMS = ['benal', 'sara', 'haddad omar', 'physics', 'ines cherif', 'zzz']
+
+# ========================
+# Requests
+# ========================
+class Workload:
+    """Builds (method, path, form) for each scenario from the seeded ids.
+
+    Also holds the request headers: Accept-Encoding, and with `revalidate`
+    the last ETag seen for a path as If-None-Match, the way a browser
+    revisiting a page would send it.
+    """
+
+    def __init__(self, ids, random_seed=7, accept_encoding='', revalidate=False):
+        self.ids = ids
+        self.rnd = random.Random(random_seed)
+        self._lock = threading.Lock()
+        self._created = 0
+        self.accept_encoding = accept_encoding
+        self.revalidate = revalidate
+        self._etags = {}
+
+    def headers(self, method, path):
+        headers = {'Accept-Encoding': self.accept_encoding} if self.accept_encoding else {}
+        if self.revalidate and method == 'GET':
+            with self._lock:
+                etag = self._etags.get(path)
+            if etag:
+                headers['If-None-Match'] = etag
+        return headers
+
+    def seen(self, path, etag):
+        if self.revalidate and etag:
+            with self._lock:
+                self._etags[path] = etag
+
+    def request(self, scenario):
+        with self._lock:
+            if scenario == 'create':
+                self._created += 1
+                n = self._created
+                return 'POST', '/create', {
+                    'type': 'Staff', 'first_name': 'Bench' + _letters(n), 'last_name': 'Load',
+                    'dob': '1990-01-01', 'email': f"bench{n}.{os.getpid()}@load.example", 'phone': '0612345678',
+                    'staff_department': 'Finance', 'job_title': 'Accountant'}
+            if scenario == 'index':
+                return 'GET', '/', None
+            if scenario == 'search':
+                return 'GET', '/search?' + urllib.parse.urlencode({'query': self.rnd.choice(SEARCH_TERMS)}), None
+            if scenario == 'view_all':
+                return 'GET', '/view_all?sort=' + self.rnd.choice(['id', 'last_name', 'status']), None
+            uid = self.rnd.choice(self.ids)
+            if scenario == 'view':
+                return 'GET', f"/view/{uid}", None
+            return 'POST', f"/edit/{uid}", {'job_title': f"Title {self.rnd.randint(0, 10 ** 6)}"}
+
+
+def _letters(n):
+    """Names may only hold letters, so spell the counter in a-z"""
+    out = ''
+    while True:
+        n, r = divmod(n, 26)
+        out = chr(97 + r) + out
+        if not n:
+            return out
+
+# ========================
+# Drivers
+# ========================
+def run_client(app, workload, scenario, requests):
+    """Sequential requests through the Flask test client.
+
+    Returns (latencies, errors, seconds, bytes received, CPU seconds).
+    """
+    client = app.test_client()
+    latencies, errors, received = [], 0, 0
+    started, cpu = time.perf_counter(), time.process_time()
+    for _ in range(requests):
+        method, path, form = workload.request(scenario)
+        t0 = time.perf_counter()
+        response = client.open(path, method=method, data=form, headers=workload.headers(method, path))
+        latencies.append(time.perf_counter() - t0)
+        errors += response.status_code >= 400
+        received += len(response.get_data())
+        workload.seen(path, response.headers.get('ETag'))
+    return latencies, errors, time.perf_counter() - started, received, time.process_time() - cpu
+
+
+def _http_call(base_url, workload, method, path, form):
+    data = urllib.parse.urlencode(form).encode() if form else None
+    request = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers=workload.headers(method, path))
+    t0 = time.perf_counter()
+    received = 0
+    try:
+        # redirects after POST are not followed; the write is what is being measured.
+        # urllib does not decode Content-Encoding, so this counts the bytes on the wire
+        with _NO_REDIRECT.open(request, timeout=60) as response:
+            received = len(response.read())
+            ok = response.status < 400
+            workload.seen(path, response.headers.get('ETag'))
+    except urllib.error.HTTPError as e:
+        # 304 Not Modified arrives here too
+        ok = e.code < 400
+    except OSError:
+        ok = False
+    return time.perf_counter() - t0, ok, received
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+_NO_REDIRECT = urllib.request.build_opener(_NoRedirect)
+
+
+def run_http(base_url, workload, scenario, requests, concurrency):
+    """`requests` HTTP calls spread over `concurrency` client threads"""
+    calls = [workload.request(scenario) for _ in range(requests)]
+    started, cpu = time.perf_counter(), time.process_time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda call: _http_call(base_url, workload, *call), calls))
+    seconds, cpu = time.perf_counter() - started, time.process_time() - cpu
+    return [r[0] for r in results], sum(1 for r in results if not r[1]), seconds, sum(r[2] for r in results), cpu
+
+
+def start_server(app):
+    """Serve the app from a threaded werkzeug server on a free port; returns (base_url, server)"""
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+# ========================
+# Reporting
+# ========================
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(rows, scenario, mode, concurrency, latencies, errors, seconds, received, cpu):
+    ordered = sorted(latencies)
+    ms = lambda p: round(percentile(ordered, p) * 1000, 3)  # noqa: E731
+    count = len(latencies) or 1
+    return {'rows': rows, 'scenario': scenario, 'mode': mode, 'concurrency': concurrency,
+            'requests': len(latencies), 'errors': errors,
+            'throughput_rps': round(len(latencies) / seconds, 1) if seconds else 0.0,
+            'p50_ms': ms(50), 'p90_ms': ms(90), 'p95_ms': ms(95), 'p99_ms': ms(99),
+            'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+            'bytes_per_req': round(received / count), 'cpu_ms_per_req': round(cpu / count * 1000, 3)}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'timestamp': datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def print_table(results):
+    print(f"{'rows':>8} {'scenario':<9} {'mode':<6} {'conc':>4} {'req/s':>9} {'p50':>8} {'p95':>8} "
+          f"{'p99':>8} {'bytes/req':>9} {'cpu ms':>7} {'errors':>6}")
+    for r in results:
+        print(f"{r['rows']:>8} {r['scenario']:<9} {r['mode']:<6} {r['concurrency']:>4} {r['throughput_rps']:>9} "
+              f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['bytes_per_req']:>9} "
+              f"{r['cpu_ms_per_req']:>7} {r['errors']:>6}")
+
+# ========================
+# Main
+# ========================
+def bench_population(args, rows, tmp):
+    path = os.path.join(tmp, f"bench_{rows}.db")
+    started = time.perf_counter()
+    ids = seeding.create_database(path, rows, args.audit_per_person)
+    print(f"\nSeeded {rows} identities in {time.perf_counter() - started:.1f}s", flush=True)
+
+    os.environ.update(DATABASE_PATH=path, SMTP_BACKEND='fake', CACHE_BACKEND=args.cache,
+                      RESPONSE_CACHE='1' if args.response_cache == 'on' else '0',
+                      COMPRESSION='1' if args.compression == 'on' else '0')
+    import app as app_module
+    app = app_module.create_app('production')
+
+    results = []
+    scenarios = args.scenario or SCENARIOS
+    options = {'accept_encoding': args.accept_encoding, 'revalidate': args.revalidate}
+    if args.mode in ('client', 'both'):
+        for scenario in scenarios:
+            workload = Workload(ids, **options)
+            run_client(app, workload, scenario, min(args.warmup, args.requests))
+            results.append(summarize(rows, scenario, 'client', 1,
+                                     *run_client(app, workload, scenario, args.requests)))
+    if args.mode in ('http', 'both'):
+        base_url, server = (args.url, None) if args.url else start_server(app)
+        try:
+            for concurrency in args.concurrency or [1, 8, 32]:
+                for scenario in scenarios:
+                    workload = Workload(ids, **options)
+                    run_http(base_url, workload, scenario, min(args.warmup, args.requests), concurrency)
+                    results.append(summarize(rows, scenario, 'http', concurrency,
+                                             *run_http(base_url, workload, scenario, args.requests, concurrency)))
+        finally:
+            if server:
+                server.shutdown()
+    app.extensions['writer'].stop()
+    app.extensions['outbox'].stop()
+    app.extensions['db_gateway'].stop()
+    app.extensions['db_pool'].close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, action='append', help='population sizes (default 10000)')
+    parser.add_argument('--audit-per-person', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=500, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=50, help='unmeasured requests first')
+    parser.add_argument('--mode', choices=['client', 'http', 'both'], default='both')
+    parser.add_argument('--concurrency', type=int, action='append', help='HTTP client threads (default 1, 8, 32)')
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append', help='default: all')
+    parser.add_argument('--cache', default='memory', help="CACHE_BACKEND for the run ('none' measures SQLite)")
+    parser.add_argument('--response-cache', choices=['on', 'off'], default='on', help='RESPONSE_CACHE for the run')
+    parser.add_argument('--compression', choices=['on', 'off'], default='on', help='COMPRESSION for the run')
+    parser.add_argument('--accept-encoding', default='gzip, br', help="sent with every request ('' for none)")
+    parser.add_argument('--revalidate', action='store_true',
+                        help='send If-None-Match with the last ETag seen for the same path')
+    parser.add_argument('--url', help='drive a running server instead of an in-process one')
+    parser.add_argument('--output', help='write results as JSON (for compare.py)')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows or [10000]:
+            results.extend(bench_population(args, rows, tmp))
+    print()
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump({'environment': environment(), 'settings': {k: v for k, v in vars(args).items()},
+                       'results': results}, out, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Diff two bench_workflows.py result files and flag regressions.
+
+    python benchmarks/compare.py baseline.json results.json --threshold 15
+
+Rows are matched on (rows, scenario, mode, concurrency). The exit status is 1
+when any p95 latency grew, or throughput dropped, by more than the threshold
+percentage, so the script can gate a release. Bytes and CPU time per request
+are shown for information when both files have them.
+"""
+import argparse
+import json
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    return {(r['rows'], r['scenario'], r['mode'], r['concurrency']): r for r in data['results']}, data
+
+
+def change(old, new):
+    return (new - old) / old * 100 if old else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed change in percent')
+    args = parser.parse_args()
+
+    old, old_data = load(args.baseline)
+    new, new_data = load(args.candidate)
+    print(f"baseline  {old_data['environment'].get('commit', '')} {old_data['environment']['timestamp']}")
+    print(f"candidate {new_data['environment'].get('commit', '')} {new_data['environment']['timestamp']}\n")
+    print(f"{'rows':>8} {'scenario':<9} {'mode':<6} {'conc':>4} {'p95 old':>9} {'p95 new':>9} {'Δp95':>7} "
+          f"{'rps old':>9} {'rps new':>9} {'Δrps':>7} {'bytes old':>9} {'bytes new':>9} {'cpu old':>7} "
+          f"{'cpu new':>7}")
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        o, n = old[key], new[key]
+        d_p95 = change(o['p95_ms'], n['p95_ms'])
+        d_rps = change(o['throughput_rps'], n['throughput_rps'])
+        worse = d_p95 > args.threshold or -d_rps > args.threshold
+        regressions += worse
+        print(f"{key[0]:>8} {key[1]:<9} {key[2]:<6} {key[3]:>4} {o['p95_ms']:>9} {n['p95_ms']:>9} {d_p95:>+6.1f}% "
+              f"{o['throughput_rps']:>9} {n['throughput_rps']:>9} {d_rps:>+6.1f}% "
+              f"{o.get('bytes_per_req', '-'):>9} {n.get('bytes_per_req', '-'):>9} "
+              f"{o.get('cpu_ms_per_req', '-'):>7} {n.get('cpu_ms_per_req', '-'):>7}"
+              f"{'  REGRESSION' if worse else ''}")
+    for key in sorted(old.keys() ^ new.keys()):
+        print(f"only in {'baseline' if key in old else 'candidate'}: {key}")
+    if regressions:
+        print(f"\n{regressions} regression(s) beyond {args.threshold}%")
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
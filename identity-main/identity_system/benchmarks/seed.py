@@ -0,0 +1,138 @@
+"""Synthetic People/profile/Audit populations for the benchmarks.
+
+    python benchmarks/seed.py bench.db --rows 100000 --audit-per-person 3
+
+Rows are generated from a fixed random seed, so every run (and every release)
+benchmarks the same data. IDs use the year 2000 so they never collide with
+IDs the app allocates.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIRST = ['Amine', 'Sara', 'Yacine', 'Lina', 'Karim', 'Nour', 'Walid', 'Meriem', 'Omar', 'Ines', 'Adam', 'Aya']
+LAST = ['Benali', 'Haddad', 'Zerrouki', 'Mansouri', 'Bouzid', 'Khelifi', 'Saidi', 'Djebbar', 'Cherif', 'Rahmani']
+DEPTS = ['Computer Science', 'Mathematics', 'Physics', 'Chemistry', 'Biology', 'Human Resources', 'Finance']
+RANKS = ['Lecturer', 'Assistant Professor', 'Associate Professor', 'Professor']
+JOBS = ['Administrator', 'Accountant', 'Technician', 'Librarian', 'Secretary']
+STATUSES = ['Active'] * 7 + ['Pending', 'Suspended', 'Inactive']
+# (type, prefix, share of the population)
+TYPES = [('Student', 'STU', 60), ('PhD', 'PHD', 5), ('Faculty', 'FAC', 15), ('Staff', 'STF', 20)]
+AUDIT_FIELDS = ['first_name', 'last_name', 'status', 'job_title', 'primary_department']
+
+BATCH = 10000
+
+
+def seed(conn, rows, audit_per_person=2, random_seed=42):
+    """Insert `rows` identities with profiles and about `audit_per_person` audit rows each.
+
+    Search, change-tracking, match-key, stats and change-log triggers are
+    dropped during the load and recreated at the end (the indexes and counters
+    are rebuilt once), which is far faster than per-row maintenance. Returns the list of
+    seeded ids.
+    """
+    import changefeed
+    import dedupe
+    import exporter
+    import search_index
+    import stats
+
+    rnd = random.Random(random_seed)
+    now = datetime.now()
+    stamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    triggers = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='trigger' AND (name LIKE '%search%' OR name LIKE '%touch%'"
+        " OR name LIKE '%match%' OR name LIKE '%stats%' OR name LIKE '%changelog%')")]
+    for name in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    weights = [share for _, _, share in TYPES]
+    ids = []
+    people, student, phd, faculty, staff, audit = [], [], [], [], [], []
+    for i in range(rows):
+        user_type, prefix, _ = rnd.choices(TYPES, weights)[0]
+        uid = f"{prefix}2000{i:07d}"
+        ids.append(uid)
+        changed = (now - timedelta(days=rnd.randint(0, 3650))).isoformat()
+        people.append((uid, user_type, rnd.choice(FIRST), rnd.choice(LAST),
+                       f"{rnd.randint(1960, 2005)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+                       f"user{i}@bench.example", f"06{rnd.randint(0, 99999999):08d}", rnd.choice(STATUSES), changed, stamp))
+        if user_type in ('Student', 'PhD'):
+            year = rnd.randint(2010, 2025)
+            student.append((uid, f"N{i:09d}", 'BAC', year - 1, year, rnd.choice(DEPTS)))
+        if user_type == 'PhD':
+            phd.append((uid, rnd.choice(DEPTS) + ' research'))
+        if user_type == 'Faculty':
+            faculty.append((uid, rnd.choice(RANKS), rnd.choice(DEPTS)))
+        if user_type == 'Staff':
+            staff.append((uid, rnd.choice(DEPTS), rnd.choice(JOBS), changed[:10]))
+        for _ in range(rnd.randint(0, 2 * audit_per_person)):
+            audit.append((uid, (now - timedelta(days=rnd.randint(0, 1500))).isoformat(),
+                          rnd.choice(AUDIT_FIELDS), 'old', 'new'))
+        if len(people) >= BATCH:
+            _flush(conn, people, student, phd, faculty, staff, audit)
+    _flush(conn, people, student, phd, faculty, staff, audit)
+    cur = conn.cursor()
+    search_index.init_search_index(cur)
+    search_index.rebuild_search_index(cur)
+    exporter.init_change_tracking(cur)
+    dedupe.init_match_keys(cur)
+    dedupe.rebuild_keys(cur)
+    stats.init_stats(cur)
+    stats.rebuild_stats(cur)
+    changefeed.init_change_log(cur)
+    changefeed.backfill(cur)
+    conn.commit()
+    conn.execute("ANALYZE")
+    return ids
+
+
+def _flush(conn, people, student, phd, faculty, staff, audit):
+    conn.executemany("""INSERT INTO People (id,type,first_name,last_name,dob,email,phone,status,status_changed_at,
+                                            updated_at) VALUES (?,?,?,?,?,?,?,?,?,?)""", people)
+    conn.executemany("""INSERT INTO StudentProfile (person_id,national_id,diploma_type,diploma_year,entry_year,major)
+                        VALUES (?,?,?,?,?,?)""", student)
+    conn.executemany("INSERT INTO PhdProfile (person_id,research_areas) VALUES (?,?)", phd)
+    conn.executemany("INSERT INTO FacultyProfile (person_id,faculty_rank,primary_department) VALUES (?,?,?)",
+                     faculty)
+    conn.executemany("""INSERT INTO StaffProfile (person_id,staff_department,job_title,staff_entry_date)
+                        VALUES (?,?,?,?)""", staff)
+    conn.executemany("INSERT INTO Audit (person_id,changed_at,field,old_value,new_value) VALUES (?,?,?,?,?)",
+                     audit)
+    conn.commit()
+    for batch in (people, student, phd, faculty, staff, audit):
+        batch.clear()
+
+
+def create_database(path, rows, audit_per_person=2):
+    """Migrate a fresh database at `path` and seed it; returns the seeded ids"""
+    import app
+    import db
+
+    app.init_db(path)
+    conn = db.connect(path)
+    try:
+        return seed(conn, rows, audit_per_person)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='database file to create (must not exist)')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--audit-per-person', type=int, default=2)
+    args = parser.parse_args()
+    if os.path.exists(args.path):
+        parser.error(f"{args.path} already exists")
+    started = time.perf_counter()
+    create_database(args.path, args.rows, args.audit_per_person)
+    print(f"Seeded {args.rows} identities into {args.path} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import importlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+import audit
+import changefeed
+import profiles
+from db import get_db_connection
+
+# ========================
+# Backends
+# ========================
+class MemoryCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return (found, value)"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._data), 'max_entries': self.max_entries, 'ttl': self.ttl,
+                    'evictions': self.evictions, 'expirations': self.expirations}
+
+
+class NullCache:
+    """Backend that stores nothing, for turning caching off"""
+
+    def get(self, key):
+        return False, None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+def make_backend(name, max_entries=10000, ttl=300):
+    """Build a backend from a name: 'memory', 'none' or 'package.module:ClassName'.
+
+    A custom class is constructed with (max_entries=, ttl=) and must provide
+    get/set/delete/clear/stats like MemoryCache.
+    """
+    if name == 'memory':
+        return MemoryCache(max_entries, ttl)
+    if name == 'none':
+        return NullCache()
+    module_name, _, class_name = name.partition(':')
+    if not class_name:
+        raise ValueError(f"Unknown cache backend: {name}")
+    return getattr(importlib.import_module(module_name), class_name)(max_entries=max_entries, ttl=ttl)
+
+# ========================
+# Read-through Cache
+# ========================
+class ReadThroughCache:
+    """Counts hits/misses around a backend and loads missing entries on demand.
+
+    In-process writes invalidate their keys directly. Writes from other
+    processes and the CLI are found by a sync that the readers run at most
+    once per `sync_interval` seconds (see claim_sync), so hits in between
+    never touch SQLite.
+    """
+
+    def __init__(self, backend, sync_interval=1.0):
+        self.backend = backend
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale = 0
+        self.syncs = 0
+        # bumped by every invalidation; a load that raced with a write is not stored
+        self._generation = 0
+        self._last_sync = None
+        # ChangeLog seq the entries are known to be current at (None before the first sync)
+        self.synced_seq = None
+
+    def get_or_load(self, key, loader):
+        found, value = self.backend.get(key)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            generation = self._generation
+        if found:
+            return value
+        value = loader()
+        if value is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self.backend.set(key, value)
+        return value
+
+    def claim_sync(self):
+        """True for the one caller that should check for outside writes now"""
+        now = time.monotonic()
+        with self._lock:
+            if self._last_sync is not None and now - self._last_sync < self.sync_interval:
+                return False
+            self._last_sync = now
+            self.syncs += 1
+            return True
+
+    def invalidate(self, *keys, stale=False):
+        """Drop keys; `stale` counts them as changed by another process rather than by this one"""
+        with self._lock:
+            self._generation += 1
+            if stale:
+                self.stale += len(keys)
+            else:
+                self.invalidations += len(keys)
+            for key in keys:
+                self.backend.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            data = {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations,
+                    'stale': self.stale, 'syncs': self.syncs, 'synced_seq': self.synced_seq}
+        data.update(self.backend.stats())
+        return data
+
+# ========================
+# Identity Reads
+# ========================
+# further behind than this many change log entries, a sync drops everything instead of reading the ids
+MAX_SYNC_GAP = 1000
+
+
+def _cache():
+    return current_app.extensions['identity_cache']
+
+
+def _sync(conn):
+    """Drop the entries of identities written elsewhere since the last sync, if one is due.
+
+    Every create, audited edit (status transitions included) and delete
+    appends to ChangeLog, whichever process or command wrote it, so the ids
+    after the last seen seq are exactly the ones to drop. The seq range is
+    read on the primary key.
+    """
+    cache = _cache()
+    if not cache.claim_sync():
+        return
+    conn = conn or get_db_connection()
+    newest = changefeed.latest(conn)
+    seen = cache.synced_seq
+    if seen is None or newest < seen or newest - seen > MAX_SYNC_GAP:
+        # first sync, reset log or too far behind: whatever is cached may predate `newest`
+        cache.clear()
+    elif newest > seen:
+        uids = [r[0] for r in conn.execute("SELECT DISTINCT person_id FROM ChangeLog WHERE seq > ? AND seq <= ?",
+                                           (seen, newest))]
+        cache.invalidate(*_keys(uids), stale=True)
+    cache.synced_seq = newest
+
+
+def get_person(uid, conn=None):
+    """People row plus profile columns for uid as a dict (None if missing); hot reads never touch SQLite"""
+    _sync(conn)
+
+    def load():
+        return profiles.load_person(conn or get_db_connection(), uid)
+    return _cache().get_or_load(('person', uid), load)
+
+
+def get_history(uid, conn=None):
+    """Audit rows for uid (live and archived), newest first; hot reads never touch SQLite"""
+    _sync(conn)
+
+    def load():
+        return [dict(r) for r in audit.load_history(conn or get_db_connection(), uid)]
+    return _cache().get_or_load(('audit', uid), load)
+
+
+def _keys(uids):
+    keys = []
+    for uid in uids:
+        keys.extend([('person', uid), ('audit', uid)])
+    return keys
+
+
+def invalidate_identity(*uids):
+    """Drop cached person rows and history after any write to these identities"""
+    _cache().invalidate(*_keys(uids))
@@ -0,0 +1,291 @@
+import asyncio
+import json
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import Blueprint, Response, current_app, jsonify, request
+from flask.cli import with_appcontext
+
+import exporter
+import profiles
+from db import get_db_connection
+from db_gateway import GatewayUnavailable
+
+bp = Blueprint('changes', __name__)
+
+# ?limit= is clamped to this many entries per batch
+MAX_BATCH = 5000
+
+# seconds between SSE comments that keep idle proxies from closing the stream
+HEARTBEAT_SECONDS = 15
+
+
+class CursorError(ValueError):
+    status = 400
+
+
+class CursorExpired(CursorError):
+    """The entries after the cursor were pruned (or the log was reset); resync with an export"""
+    status = 410
+
+# ========================
+# Change Log
+# ========================
+def init_change_log(cur):
+    """Create ChangeLog and the triggers appending to it.
+
+    Every create, audited field change and delete gets one entry, whatever
+    path wrote it. `seq` only grows, and SQLite commits one writer at a time
+    in seq order, so a reader never sees seq N+1 before N: a consumer's
+    cursor is simply the last seq it applied.
+    """
+    cur.execute('''CREATE TABLE IF NOT EXISTS ChangeLog (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    person_id TEXT NOT NULL,
+                    op TEXT NOT NULL,
+                    changed_at TEXT NOT NULL,
+                    field TEXT,
+                    old_value TEXT,
+                    new_value TEXT
+                )''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_changelog_changed_at ON ChangeLog(changed_at)")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS people_changelog_insert AFTER INSERT ON People BEGIN
+                        INSERT INTO ChangeLog (person_id, op, changed_at)
+                        VALUES (NEW.id, 'create', {exporter.NOW_SQL});
+                    END""")
+    # edits, batch edits and lifecycle transitions all write Audit rows
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS audit_changelog_insert AFTER INSERT ON Audit BEGIN
+                        INSERT INTO ChangeLog (person_id, op, changed_at, field, old_value, new_value)
+                        VALUES (NEW.person_id, 'update', {exporter.NOW_SQL}, NEW.field, NEW.old_value,
+                                NEW.new_value);
+                    END""")
+    # BEFORE, so the profile rows are still there for the snapshot of the deleted record
+    snapshot = ', '.join(f"'{c}', {profiles.qualified(c, 'p')}" for c in profiles.ALL_COLUMNS)
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS people_changelog_delete BEFORE DELETE ON People BEGIN
+                        INSERT INTO ChangeLog (person_id, op, changed_at, old_value)
+                        SELECT OLD.id, 'delete', {exporter.NOW_SQL}, json_object({snapshot})
+                        FROM People p{profiles.joins(profiles.COLUMN_TABLES, 'p')} WHERE p.id = OLD.id;
+                    END""")
+
+
+def backfill(cur):
+    """One create entry per existing identity, so a consumer can start from seq 0"""
+    cur.execute(f"""INSERT INTO ChangeLog (person_id, op, changed_at)
+                    SELECT id, 'create', ifnull(updated_at, {exporter.NOW_SQL}) FROM People ORDER BY rowid""")
+
+
+def latest(conn):
+    """Seq of the newest entry ever written (0 for an empty log), pruned entries included"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'ChangeLog'").fetchone()
+    return row[0] if row else 0
+
+
+def prune_changes(conn, older_than_days, chunk_size=5000):
+    """Delete the entries older than the cutoff, oldest first, in short transactions.
+
+    Only a prefix of the log is removed (everything before the first entry
+    that is recent enough), so the remaining entries never have holes.
+    Returns the number of entries deleted.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    cutoff = cutoff.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    keep_from = conn.execute("SELECT min(seq) FROM ChangeLog WHERE changed_at >= ?", (cutoff,)).fetchone()[0]
+    if keep_from is None:
+        keep_from = latest(conn) + 1
+    removed = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute("DELETE FROM ChangeLog WHERE seq IN "
+                               "(SELECT seq FROM ChangeLog WHERE seq < ? ORDER BY seq LIMIT ?)",
+                               (keep_from, chunk_size))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        removed += cur.rowcount
+        if cur.rowcount < chunk_size:
+            return removed
+
+# ========================
+# Reading
+# ========================
+def parse_cursor(value):
+    """Validate ?since= or Last-Event-ID: a seq, or 'latest' for only what happens from now on"""
+    if value in (None, ''):
+        return 0
+    if value == 'latest':
+        return value
+    try:
+        cursor = int(value)
+    except ValueError:
+        cursor = -1
+    if cursor < 0:
+        raise CursorError(f"Invalid cursor: {value}")
+    return cursor
+
+
+def read_changes(conn, since, limit):
+    """(entries, next cursor, has_more) for up to `limit` entries after `since`.
+
+    Create entries carry the identity's current record (None if it was deleted
+    since), delete entries the record as it was when deleted, and update
+    entries the field with its old and new value.
+    """
+    newest = latest(conn)
+    if since == 'latest':
+        return [], newest, False
+    oldest = conn.execute("SELECT min(seq) FROM ChangeLog").fetchone()[0]
+    if since > newest or since + 1 < (oldest or newest + 1):
+        raise CursorExpired(f"Cursor {since} is no longer in the change log (entries {oldest or newest + 1}"
+                            f" to {newest} are); run a full export and continue from since=latest")
+    rows = conn.execute("SELECT seq, person_id, op, changed_at, field, old_value, new_value FROM ChangeLog "
+                        "WHERE seq > ? ORDER BY seq LIMIT ?", (since, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    created = [r['person_id'] for r in rows if r['op'] == 'create']
+    records = {}
+    if created:
+        cols = ', '.join(profiles.qualified(c, 'p') for c in profiles.ALL_COLUMNS)
+        for row in conn.execute(f"SELECT {cols} FROM People p{profiles.joins(profiles.COLUMN_TABLES, 'p')} "
+                                "WHERE p.id IN (SELECT value FROM json_each(?))", (json.dumps(created),)):
+            records[row['id']] = dict(row)
+
+    entries = []
+    for r in rows:
+        entry = {'seq': r['seq'], 'op': r['op'], 'id': r['person_id'], 'changed_at': r['changed_at']}
+        if r['op'] == 'update':
+            entry.update(field=r['field'], old_value=r['old_value'], new_value=r['new_value'])
+        elif r['op'] == 'create':
+            entry['record'] = records.get(r['person_id'])
+        else:
+            entry['record'] = json.loads(r['old_value']) if r['old_value'] else None
+        entries.append(entry)
+    return entries, rows[-1]['seq'] if rows else since, has_more
+
+
+def _batch(entries, cursor, has_more):
+    return {'changes': entries, 'next': cursor, 'has_more': has_more}
+
+# ========================
+# Endpoint
+# ========================
+@bp.errorhandler(CursorError)
+def bad_cursor(e):
+    return jsonify(error=str(e)), e.status
+
+
+def _limit():
+    try:
+        limit = int(request.args.get('limit', current_app.config['CHANGES_BATCH_SIZE']))
+    except ValueError:
+        raise CursorError(f"Invalid limit: {request.args.get('limit')}")
+    return max(1, min(limit, MAX_BATCH))
+
+
+def _wait():
+    """?wait= in seconds, clamped to [0, CHANGES_MAX_WAIT]"""
+    value = request.args.get('wait', '0')
+    try:
+        wait = float(value)
+    except ValueError:
+        wait = math.nan
+    if not math.isfinite(wait):
+        raise CursorError(f"Invalid wait: {value}")
+    return max(0.0, min(wait, current_app.config['CHANGES_MAX_WAIT']))
+
+
+@bp.route("/changes")
+async def changes():
+    """Entries after ?since= (a seq or 'latest'), oldest first.
+
+    JSON by default; ?wait=N holds the request up to N seconds until there is
+    something to return. With `Accept: text/event-stream` the batches are
+    pushed as Server-Sent Events instead, resuming from Last-Event-ID.
+    """
+    cfg = current_app.config
+    gateway = current_app.extensions['db_gateway']
+    limit = _limit()
+    since = parse_cursor(request.args.get('since'))
+
+    if request.accept_mimetypes.best == 'text/event-stream':
+        since = parse_cursor(request.headers.get('Last-Event-ID') or request.args.get('since'))
+        # the first batch is read here, so a bad cursor is still answered with a JSON error
+        first = await gateway.run(read_changes, since, limit)
+        # every open stream holds a server thread for its whole lifetime, so only a few may run at once
+        streams = current_app.extensions['changes_streams']
+        if not streams.acquire(blocking=False):
+            return jsonify(error="Too many open change streams; poll with ?wait= instead"), 503, \
+                {'Retry-After': str(int(cfg['CHANGES_POLL_INTERVAL']) + 1)}
+        response = Response(_stream(gateway, first, limit, cfg['CHANGES_POLL_INTERVAL'],
+                                    cfg['CHANGES_STREAM_SECONDS']),
+                            mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        # runs when the server closes the response, even if the body was never iterated
+        response.call_on_close(streams.release)
+        return response
+
+    deadline = time.monotonic() + _wait()
+    while True:
+        # each poll borrows a gateway connection only for the query, never across the sleep
+        entries, cursor, has_more = await gateway.run(read_changes, since, limit)
+        remaining = deadline - time.monotonic()
+        if entries or remaining <= 0:
+            return jsonify(_batch(entries, cursor, has_more))
+        since = cursor
+        await asyncio.sleep(min(cfg['CHANGES_POLL_INTERVAL'], remaining))
+
+
+def _event(entries, cursor, has_more):
+    return f"id: {cursor}\nevent: changes\ndata: {json.dumps(_batch(entries, cursor, has_more))}\n\n"
+
+
+def _stream(gateway, first, limit, interval, lifetime):
+    """SSE body: one `changes` event per batch, with the batch's cursor as the event id.
+
+    The stream ends after `lifetime` seconds (or when the gateway is
+    overloaded); EventSource clients reconnect with Last-Event-ID on their own.
+    """
+    end = time.monotonic() + lifetime
+    yield f"retry: {int(interval * 1000)}\n\n"
+    entries, cursor, has_more = first
+    idle_since = time.monotonic()
+    while True:
+        if entries:
+            yield _event(entries, cursor, has_more)
+            idle_since = time.monotonic()
+        elif time.monotonic() - idle_since >= HEARTBEAT_SECONDS:
+            yield ": keepalive\n\n"
+            idle_since = time.monotonic()
+        if time.monotonic() >= end:
+            return
+        if not has_more:
+            time.sleep(interval)
+        try:
+            entries, cursor, has_more = gateway.call(read_changes, cursor, limit)
+        except (GatewayUnavailable, CursorExpired):
+            return
+
+# ========================
+# Setup
+# ========================
+def init_app(app):
+    app.extensions['changes_streams'] = threading.BoundedSemaphore(app.config['CHANGES_MAX_STREAMS'])
+
+# ========================
+# CLI
+# ========================
+@click.command("prune-changes")
+@click.option("--older-than-days", type=int, default=None,
+              help="Delete entries older than this (default CHANGES_RETENTION_DAYS).")
+@click.option("--chunk-size", default=5000, show_default=True, help="Entries deleted per transaction.")
+@with_appcontext
+def prune_changes_command(older_than_days, chunk_size):
+    """Delete old change log entries; consumers further behind must resync."""
+    days = older_than_days if older_than_days is not None else current_app.config['CHANGES_RETENTION_DAYS']
+    removed = prune_changes(get_db_connection(), days, chunk_size)
+    click.echo(f"Deleted {removed} change log entries older than {days} days")
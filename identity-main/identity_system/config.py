@@ -0,0 +1,142 @@
+import os
+import tempfile
+
+# ========================
+# Config Profiles
+# ========================
+class Config:
+    """Settings shared by every profile, read from the environment when the app is created"""
+
+    DEBUG = False
+    TEMPLATES_AUTO_RELOAD = False
+    # apply pending migrations inside create_app (the production launcher migrates once, before forking)
+    AUTO_MIGRATE = True
+    # compile every template while the app starts instead of on first render
+    PRECOMPILE_TEMPLATES = False
+    # directory for Jinja's compiled-template bytecode cache (None disables it)
+    JINJA_CACHE_DIR = None
+
+    def __init__(self):
+        self.EMAIL_USER = os.getenv("EMAIL_USER")
+        self.EMAIL_PASS = os.getenv("EMAIL_PASS")
+
+        # outbound email (queued in the Outbox table, sent by background workers)
+        self.SMTP_BACKEND = os.getenv("SMTP_BACKEND", "ssl")  # "ssl" or "fake" (offline sink)
+        self.SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+        self.SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+        self.OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+        self.OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+        self.OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+        self.OUTBOX_BACKOFF_SECONDS = int(os.getenv("OUTBOX_BACKOFF_SECONDS", "30"))
+        # start the workers with the app, so mail left queued by a restart and due retries go out
+        # without waiting for the next /create; the debug server starts them in its serving child instead
+        default = "0" if self.DEBUG else "1"
+        self.OUTBOX_AUTOSTART = os.getenv("OUTBOX_AUTOSTART", default).lower() in ("1", "true", "yes")
+
+        # one pooled connection per request via get_db_connection(), returned at teardown
+        self.DATABASE_PATH = os.getenv("DATABASE_PATH", "database.db")
+        self.DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+        self.DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+        # read-only calls from async views run on these threads (see db_gateway.py);
+        # a full queue answers 503 at once instead of piling requests up
+        self.DB_GATEWAY_WORKERS = int(os.getenv("DB_GATEWAY_WORKERS", "4"))
+        self.DB_GATEWAY_QUEUE = int(os.getenv("DB_GATEWAY_QUEUE", "32"))
+        self.DB_GATEWAY_TIMEOUT = float(os.getenv("DB_GATEWAY_TIMEOUT", "5"))
+
+        # /create and /edit writes are group-committed by one writer thread per process (see writer.py)
+        self.WRITER_MAX_BATCH = int(os.getenv("WRITER_MAX_BATCH", "64"))
+        self.WRITER_MAX_DELAY_MS = float(os.getenv("WRITER_MAX_DELAY_MS", "2"))
+        self.WRITER_QUEUE = int(os.getenv("WRITER_QUEUE", "256"))
+        self.WRITER_TIMEOUT = float(os.getenv("WRITER_TIMEOUT", "10"))
+
+        # rows per transaction for bulk imports
+        self.IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+
+        # rows per /view_all page unless ?page_size= is given
+        self.VIEW_ALL_PAGE_SIZE = int(os.getenv("VIEW_ALL_PAGE_SIZE", "50"))
+
+        # identity detail / audit history cache
+        self.CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # "memory", "none" or "package.module:Class"
+        self.CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+        self.CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+        # how often readers check ChangeLog for writes made by other processes and the CLI
+        self.CACHE_SYNC_SECONDS = float(os.getenv("CACHE_SYNC_SECONDS", "1"))
+
+        # audit rows older than this are moved to yearly archive tables by `flask archive-audit`
+        self.AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "730"))
+
+        # results per search page
+        self.SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+
+        # rows per fetchmany for /export.<format> and `flask export-identities`
+        self.EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+        # /changes feed: entries per batch, long-poll and SSE timing, and `flask prune-changes` retention
+        self.CHANGES_BATCH_SIZE = int(os.getenv("CHANGES_BATCH_SIZE", "500"))
+        self.CHANGES_MAX_WAIT = float(os.getenv("CHANGES_MAX_WAIT", "30"))
+        self.CHANGES_POLL_INTERVAL = float(os.getenv("CHANGES_POLL_INTERVAL", "1"))
+        self.CHANGES_STREAM_SECONDS = float(os.getenv("CHANGES_STREAM_SECONDS", "60"))
+        # each open event stream holds a server thread; keep this well below workers * threads
+        self.CHANGES_MAX_STREAMS = int(os.getenv("CHANGES_MAX_STREAMS", "2"))
+        self.CHANGES_RETENTION_DAYS = int(os.getenv("CHANGES_RETENTION_DAYS", "90"))
+
+        # ANALYZE/optimize, checkpoints, incremental vacuum, integrity checks and backups (see maintenance.py);
+        # `flask maintenance` from cron, or the in-process scheduler with MAINTENANCE_SCHEDULER=1
+        self.MAINTENANCE_SCHEDULER = os.getenv("MAINTENANCE_SCHEDULER", "0").lower() in ("1", "true", "yes")
+        self.MAINTENANCE_WINDOWS = os.getenv("MAINTENANCE_WINDOWS", "01:00-05:00")  # local time, "" = any time
+        self.MAINTENANCE_QUIET_SECONDS = float(os.getenv("MAINTENANCE_QUIET_SECONDS", "60"))
+        self.MAINTENANCE_PAUSE_MS = float(os.getenv("MAINTENANCE_PAUSE_MS", "200"))
+        self.MAINTENANCE_VACUUM_PAGES = int(os.getenv("MAINTENANCE_VACUUM_PAGES", "1000"))
+        self.MAINTENANCE_BUSY_MS = int(os.getenv("MAINTENANCE_BUSY_MS", "100"))
+        self.MAINTENANCE_BACKUP_DIR = os.getenv("MAINTENANCE_BACKUP_DIR", "backups")
+        self.MAINTENANCE_BACKUP_KEEP = int(os.getenv("MAINTENANCE_BACKUP_KEEP", "7"))
+
+        # rendered /, /view_all, /view/<uid> and /search pages, reused until the identity data changes
+        # (see response_cache.py); off by default while templates auto-reload, so template edits show up
+        default = "0" if self.TEMPLATES_AUTO_RELOAD else "1"
+        self.RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", default).lower() in ("1", "true", "yes")
+        self.RESPONSE_CACHE_MAX_MB = int(os.getenv("RESPONSE_CACHE_MAX_MB", "64"))
+        # gzip (brotli if installed) for text bodies of at least COMPRESS_MIN_BYTES
+        self.COMPRESSION = os.getenv("COMPRESSION", "1").lower() in ("1", "true", "yes")
+        self.COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+        self.COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+
+        # per-request SQL/template/email timings, Server-Timing and /metrics (see instrumentation.py)
+        self.INSTRUMENTATION = os.getenv("INSTRUMENTATION", "0").lower() in ("1", "true", "yes")
+        self.SERVER_TIMING = os.getenv("SERVER_TIMING", "1").lower() in ("1", "true", "yes")
+        self.SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+        self.SLOW_QUERY_KEEP = int(os.getenv("SLOW_QUERY_KEEP", "100"))
+
+
+class DevelopmentConfig(Config):
+    """The built-in server with the debugger and template reloading"""
+
+    DEBUG = True
+    TEMPLATES_AUTO_RELOAD = True
+
+
+class ProductionConfig(Config):
+    """Multi-process serving: no debugger, templates compiled once and cached"""
+
+    AUTO_MIGRATE = False
+    PRECOMPILE_TEMPLATES = True
+
+    def __init__(self):
+        super().__init__()
+        self.JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR",
+                                         os.path.join(tempfile.gettempdir(), "identity-jinja-cache"))
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+}
+
+
+def load_config(name=None):
+    """Config object for `name`, or for IDENTITY_CONFIG (default development)"""
+    name = name or os.getenv("IDENTITY_CONFIG", "development")
+    if name not in CONFIGS:
+        raise ValueError(f"Unknown config profile: {name} (choose from {', '.join(CONFIGS)})")
+    return CONFIGS[name]()
@@ -0,0 +1,172 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, has_app_context
+
+# ========================
+# Pragmas
+# ========================
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',        # readers no longer block behind the writer
+    'synchronous': 'NORMAL',      # safe with WAL, one fsync per checkpoint instead of per commit
+    'busy_timeout': 5000,         # ms to wait for the write lock before "database is locked"
+    'mmap_size': 268435456,       # 256 MB memory-mapped reads
+    'cache_size': -16000,         # 16 MB page cache per connection
+    'temp_store': 'MEMORY',
+}
+
+
+def pragmas_from_env():
+    """Return DEFAULT_PRAGMAS overridden by SQLITE_<PRAGMA> environment variables"""
+    pragmas = dict(DEFAULT_PRAGMAS)
+    for name in pragmas:
+        value = os.getenv(f"SQLITE_{name.upper()}")
+        if value:
+            pragmas[name] = value
+    return pragmas
+
+
+def connect(path, pragmas=None):
+    """Open a new connection with Row results and the given pragmas applied once"""
+    pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+    timeout = int(pragmas.get('busy_timeout', 5000)) / 1000
+    conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+# ========================
+# Connection Pool
+# ========================
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared by request threads.
+
+    A hit reuses an idle connection, a miss opens a new one while the pool is
+    below max_size; once every connection is checked out callers wait up to
+    `timeout` seconds for one to be released.
+    """
+
+    def __init__(self, path, max_size=10, pragmas=None, timeout=10.0):
+        self.path = path
+        self.max_size = max_size
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.hits += 1
+            return conn
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._opened < self.max_size
+            if create:
+                self._opened += 1
+                self.misses += 1
+        if create:
+            try:
+                return connect(self.path, self.pragmas)
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"no database connection available after {self.timeout}s")
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds += time.perf_counter() - started
+        return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.ProgrammingError:
+            # closed by the caller, drop it and free its slot
+            with self._lock:
+                self._opened -= 1
+            return
+        self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self._opened,
+                'idle': self._idle.qsize(),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'wait_ms_total': round(self.wait_seconds * 1000, 2),
+            }
+
+# ========================
+# Request-scoped Connections
+# ========================
+def init_app(app, pool):
+    """Attach the pool to the app and return connections at app-context teardown"""
+    app.extensions['db_pool'] = pool
+    app.teardown_appcontext(close_db)
+
+
+def get_db_connection():
+    """Return the connection bound to the current app context.
+
+    Inside a request every call returns the same pooled connection, which goes
+    back to the pool at teardown, so handlers must not close it. Outside an app
+    context (scripts, worker threads) a new connection is returned and the
+    caller owns it. An app.extensions['db_wrapper'] callable (see
+    instrumentation.py) may wrap the pooled connection before it is handed out.
+    """
+    if has_app_context():
+        if 'db' not in g:
+            g.db = current_app.extensions['db_pool'].acquire()
+            wrap = current_app.extensions.get('db_wrapper')
+            g.db_handle = wrap(g.db) if wrap else g.db
+        return g.db_handle
+    return connect(_standalone_path(), pragmas_from_env())
+
+
+def close_db(exc=None):
+    g.pop('db_handle', None)
+    conn = g.pop('db', None)
+    if conn is not None:
+        current_app.extensions['db_pool'].release(conn)
+
+
+def _standalone_path():
+    return os.getenv("DATABASE_PATH", "database.db")
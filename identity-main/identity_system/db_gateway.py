@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from flask import jsonify, render_template, request
+
+from instrumentation import current_trace, traced_job
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayUnavailable(Exception):
+    """The gateway could not serve the call; answered with 503 and Retry-After"""
+    retry_after = 1
+
+
+class GatewayOverloaded(GatewayUnavailable):
+    """The queue is full; rejected at once instead of waiting behind it"""
+
+
+class GatewayTimeout(GatewayUnavailable):
+    """The call did not finish (queue wait included) within its timeout"""
+
+
+class GatewayFailed(GatewayUnavailable):
+    """A worker died (e.g. it could not connect); queued calls fail at once instead of timing out"""
+
+# ========================
+# Gateway
+# ========================
+class DBGateway:
+    """Runs read-only database calls on a few worker threads fed from a bounded queue.
+
+    Each worker owns one connection (opened with PRAGMA query_only), so
+    request threads and async views never block inside sqlite3 themselves:
+    they submit `fn(conn, *args)` and wait on a future. A full queue rejects
+    the call at once (GatewayOverloaded), and a call still queued or running
+    when its timeout expires is cancelled or interrupted (GatewayTimeout).
+    Writes stay on the request connection, inside their transaction.
+    """
+
+    def __init__(self, connect, workers=4, queue_size=32, timeout=5.0):
+        self._connect = connect
+        self.workers = workers
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._running = {}  # future -> connection executing it
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def start(self):
+        """Start the worker threads, replacing any that died (no-op if all are running)"""
+        with self._start_lock:
+            alive = [t for t in self._threads if t.is_alive()]
+            if self._threads:
+                self.restarts += len(self._threads) - len(alive)
+            for n in range(len(alive), self.workers):
+                t = threading.Thread(target=self._run, name=f"db-gateway-{n}", daemon=True)
+                t.start()
+                alive.append(t)
+            self._threads = alive
+
+    def stop(self, timeout=10):
+        with self._start_lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for _ in self._threads:
+                self._queue.put(None)
+            for t in self._threads:
+                t.join(timeout)
+            self._threads = []
+
+    def submit(self, fn, *args, timeout=None, **kwargs):
+        """Queue fn(conn, *args, **kwargs); returns a concurrent.futures.Future"""
+        self.start()
+        future = Future()
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        try:
+            self._queue.put_nowait((future, fn, args, kwargs, deadline, current_trace()))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise GatewayOverloaded(f"database busy: {self._queue.maxsize} calls already queued")
+        with self._lock:
+            self.submitted += 1
+        # a worker may have died between start() and put(); a new one picks the call up
+        self.start()
+        return future
+
+    def call(self, fn, *args, timeout=None, **kwargs):
+        """Run fn(conn, ...) on the gateway and wait for the result (for sync views)"""
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(fn, *args, timeout=timeout, **kwargs)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            self._abandon(future)
+            raise GatewayTimeout(f"database call did not finish within {timeout}s")
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        """Awaitable version of call() for async views; the event loop is never blocked"""
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(fn, *args, timeout=timeout, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            self._abandon(future)
+            raise GatewayTimeout(f"database call did not finish within {timeout}s")
+
+    def _abandon(self, future):
+        with self._lock:
+            self.timeouts += 1
+            if future.cancel():
+                return
+            # already executing: make SQLite abort the statement. Looked up and interrupted under the
+            # lock the worker takes to clear _running, so the connection's next job is never hit
+            conn = self._running.get(future)
+            if conn is not None:
+                conn.interrupt()
+
+    def _run(self):
+        try:
+            conn = self._connect()
+            conn.execute("PRAGMA query_only = 1")
+        except Exception as e:
+            logger.exception("DB gateway worker could not connect")
+            self._fail_queued(e)
+            return
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    return
+                future, fn, args, kwargs, deadline, trace = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if time.monotonic() > deadline:
+                    future.set_exception(GatewayTimeout("database call timed out while queued"))
+                    continue
+                with self._lock:
+                    self._running[future] = conn
+                try:
+                    with traced_job(conn, trace) as job_conn:
+                        result = fn(job_conn, *args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                finally:
+                    with self._lock:
+                        del self._running[future]
+                        self.completed += 1
+                    if conn.in_transaction:
+                        conn.rollback()
+        except Exception as e:
+            logger.exception("DB gateway worker failed")
+            self._fail_queued(e)
+        finally:
+            conn.close()
+
+    def _fail_queued(self, cause):
+        """Fail every waiting call at once; the next submit starts new workers"""
+        stops = 0
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                stops += 1
+            elif job[0].set_running_or_notify_cancel():
+                error = GatewayFailed(f"database gateway worker stopped: {cause}")
+                error.__cause__ = cause
+                job[0].set_exception(error)
+                with self._lock:
+                    self.failed += 1
+        # stop() is waiting on the other workers: hand their sentinels back
+        for _ in range(stops):
+            self._queue.put(None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': sum(t.is_alive() for t in self._threads),
+                'restarts': self.restarts,
+                'queued': self._queue.qsize(),
+                'queue_size': self._queue.maxsize,
+                'running': len(self._running),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+            }
+
+# ========================
+# Setup
+# ========================
+def _unavailable(e):
+    if request.path.startswith('/api/'):
+        response = jsonify(error=str(e))
+    else:
+        response = render_template("error.html", error="The server is busy, please try again in a moment.")
+    return response, 503, {'Retry-After': str(e.retry_after)}
+
+
+def init_app(app, gateway):
+    app.extensions['db_gateway'] = gateway
+    app.register_error_handler(GatewayUnavailable, _unavailable)
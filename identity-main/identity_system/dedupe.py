@@ -0,0 +1,318 @@
+import csv
+import functools
+import re
+import sys
+import unicodedata
+
+import click
+from flask.cli import with_appcontext
+
+from db import get_db_connection
+
+# pairs scoring at least this are reported / shown as possible duplicates
+MATCH_THRESHOLD = 0.75
+# keys shared by more identities than this are too common to tell anyone apart; the report skips them
+MAX_BLOCK_SIZE = 200
+# most stored identities scored against one new record
+CANDIDATE_LIMIT = 200
+# score weights; names carry most of the evidence, the email local part the least
+NAME_WEIGHT, DOB_WEIGHT, EMAIL_WEIGHT = 0.6, 0.3, 0.1
+
+VOWELS = set('aeiouy')
+# transliteration variants folded together before vowels are dropped (Oualid/Walid, Djamel/Jamel, ...)
+DIGRAPHS = [('ou', 'u'), ('w', 'u'), ('ph', 'f'), ('sh', 'x'), ('ch', 'x'), ('kh', 'k'), ('gh', 'g'),
+            ('dj', 'j'), ('dh', 'd'), ('th', 't'), ('ck', 'k'), ('q', 'k'), ('c', 'k')]
+
+# ========================
+# Key Index
+# ========================
+def init_match_keys(cur):
+    """Blocking-key table plus triggers queueing every written identity for re-keying.
+
+    Keys are computed in Python, so triggers only record which identities
+    changed (MatchKeysPending); refresh_pending() re-keys them, normally in
+    the transaction that wrote them.
+    """
+    cur.execute('''CREATE TABLE IF NOT EXISTS MatchKeys (
+                    key TEXT NOT NULL,
+                    person_id TEXT NOT NULL,
+                    PRIMARY KEY (key, person_id)
+                ) WITHOUT ROWID''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_match_keys_person ON MatchKeys(person_id)")
+    cur.execute("CREATE TABLE IF NOT EXISTS MatchKeysPending (person_id TEXT PRIMARY KEY) WITHOUT ROWID")
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS people_match_insert AFTER INSERT ON People BEGIN
+                        INSERT OR IGNORE INTO MatchKeysPending (person_id) VALUES (NEW.id);
+                    END''')
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS people_match_update
+                    AFTER UPDATE OF first_name, last_name, dob, email ON People BEGIN
+                        INSERT OR IGNORE INTO MatchKeysPending (person_id) VALUES (NEW.id);
+                    END''')
+    cur.execute('''CREATE TRIGGER IF NOT EXISTS people_match_delete AFTER DELETE ON People BEGIN
+                        DELETE FROM MatchKeys WHERE person_id = OLD.id;
+                        DELETE FROM MatchKeysPending WHERE person_id = OLD.id;
+                    END''')
+
+
+def rebuild_keys(cur, chunk_size=5000):
+    """Recompute every identity's keys in rowid chunks; the caller commits"""
+    cur.execute("DELETE FROM MatchKeys")
+    cur.execute("DELETE FROM MatchKeysPending")
+    last = 0
+    while True:
+        rows = cur.execute("""SELECT rowid, id, first_name, last_name, dob, email FROM People
+                              WHERE rowid > ? ORDER BY rowid LIMIT ?""", (last, chunk_size)).fetchall()
+        if not rows:
+            return
+        last = rows[-1][0]
+        cur.executemany("INSERT OR IGNORE INTO MatchKeys (key, person_id) VALUES (?, ?)",
+                        [(key, row[1]) for row in rows for key in match_keys(*row[2:])])
+
+
+def refresh_pending(conn):
+    """Re-key identities written since the last refresh; call inside the writing transaction"""
+    rows = conn.execute("""SELECT p.id, p.first_name, p.last_name, p.dob, p.email
+                           FROM MatchKeysPending k JOIN People p ON p.id = k.person_id""").fetchall()
+    if not rows:
+        return 0
+    conn.execute("DELETE FROM MatchKeys WHERE person_id IN (SELECT person_id FROM MatchKeysPending)")
+    conn.executemany("INSERT OR IGNORE INTO MatchKeys (key, person_id) VALUES (?, ?)",
+                     [(key, row[0]) for row in rows for key in match_keys(*row[1:])])
+    conn.execute("DELETE FROM MatchKeysPending")
+    return len(rows)
+
+
+def ensure_fresh(conn):
+    """Index identities left pending by other writers (batch edits, scripts) before a batch report"""
+    if not conn.execute("SELECT EXISTS(SELECT 1 FROM MatchKeysPending)").fetchone()[0]:
+        return
+    if conn.in_transaction:
+        refresh_pending(conn)
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        refresh_pending(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# ========================
+# Keys and Similarity
+# ========================
+@functools.lru_cache(maxsize=65536)
+def fold(text):
+    """Lowercase ASCII letters only: accents, spaces, hyphens and apostrophes removed"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return re.sub(r'[^a-z]', '', text.encode('ascii', 'ignore').decode().lower())
+
+
+@functools.lru_cache(maxsize=65536)
+def phonetic(name):
+    """Transliteration-tolerant code: Mohamed/Mohammed/Muhammad -> mhmd, Ben Ali/Benali -> bnl"""
+    s = fold(name)
+    for pattern, replacement in DIGRAPHS:
+        s = s.replace(pattern, replacement)
+    s = re.sub(r'(.)\1+', r'\1', s)
+    if len(s) > 1:
+        s = s.rstrip('h')
+    if not s:
+        return ''
+    return ('a' if s[0] in VOWELS else s[0]) + ''.join(ch for ch in s[1:] if ch not in VOWELS)
+
+
+def email_local(email):
+    """Comparable local part: no +tag, no dots, lowercase; '' if too short to mean anything"""
+    local = (email or '').strip().lower().split('@')[0].split('+')[0]
+    local = re.sub(r'[^a-z0-9]', '', local)
+    return local if len(local) >= 4 else ''
+
+
+def match_keys(first_name, last_name, dob, email):
+    """Blocking keys; two identities are compared only if they share one.
+
+    n: both names phonetically (order-free, so swapped names collide)
+    d: date of birth plus one name phonetically (a typo in the other name still collides)
+    i: date of birth plus both initials (typos in both names)
+    e: email local part
+    """
+    first, last = phonetic(first_name), phonetic(last_name)
+    keys = set()
+    if first or last:
+        keys.add('n:' + '|'.join(sorted((first, last))))
+    if dob:
+        keys.update(f"d:{dob}:{code}" for code in (first, last) if code)
+        initials = ''.join(sorted(fold(n)[:1] for n in (first_name, last_name) if fold(n)))
+        if initials:
+            keys.add(f"i:{dob}:{initials}")
+    local = email_local(email)
+    if local:
+        keys.add('e:' + local)
+    return keys
+
+
+@functools.lru_cache(maxsize=65536)
+def _trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def name_similarity(a, b):
+    """Dice coefficient of character trigrams, 0..1"""
+    a, b = fold(a), fold(b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    ga, gb = _trigrams(a), _trigrams(b)
+    return 2 * len(ga & gb) / (len(ga) + len(gb))
+
+
+def dob_similarity(a, b):
+    """1 if equal, 0.7 for one mistyped or two swapped digits or day/month swapped, else 0"""
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    if len(a) == len(b):
+        diff = [i for i, (x, y) in enumerate(zip(a, b)) if x != y]
+        if len(diff) == 1:
+            return 0.7
+        if len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]:
+            return 0.7
+    pa, pb = a.split('-'), b.split('-')
+    if len(pa) == len(pb) == 3 and pa[0] == pb[0] and pa[1] == pb[2] and pa[2] == pb[1]:
+        return 0.7
+    return 0.0
+
+
+def score(a, b):
+    """Similarity of two identities (mappings with first_name, last_name, dob, email), 0..1"""
+    straight = (name_similarity(a['first_name'], b['first_name']) + name_similarity(a['last_name'], b['last_name']))
+    swapped = (name_similarity(a['first_name'], b['last_name']) + name_similarity(a['last_name'], b['first_name']))
+    name = max(straight, swapped) / 2
+    if sorted((phonetic(a['first_name']), phonetic(a['last_name']))) == \
+            sorted((phonetic(b['first_name']), phonetic(b['last_name']))):
+        # same pronunciation, spelled differently (transliteration)
+        name = max(name, 0.9)
+    local = email_local(a['email'])
+    email = 1.0 if local and local == email_local(b['email']) else 0.0
+    return round(NAME_WEIGHT * name + DOB_WEIGHT * dob_similarity(a['dob'], b['dob']) + EMAIL_WEIGHT * email, 3)
+
+# ========================
+# Matching
+# ========================
+def find_matches(conn, record, threshold=MATCH_THRESHOLD, exclude=None):
+    """Stored identities that look like `record`, best first, as dicts with a 'score'.
+
+    Read-only, so it can run on a request connection: identities still
+    pending re-keying are keyed in Python here instead of being written back.
+    """
+    keys = match_keys(record.get('first_name'), record.get('last_name'), record.get('dob'), record.get('email'))
+    if not keys:
+        return []
+    placeholders = ','.join('?' * len(keys))
+    rows = conn.execute(f"""SELECT p.id, p.type, p.first_name, p.last_name, p.dob, p.email, p.status FROM People p
+                            WHERE p.id IN (SELECT DISTINCT person_id FROM MatchKeys WHERE key IN ({placeholders})
+                                           LIMIT ?)""", [*keys, CANDIDATE_LIMIT]).fetchall()
+    pending = conn.execute("""SELECT p.id, p.type, p.first_name, p.last_name, p.dob, p.email, p.status
+                              FROM MatchKeysPending k JOIN People p ON p.id = k.person_id""").fetchall()
+    keys = set(keys)
+    rows += [row for row in pending if keys.intersection(match_keys(*row[2:6]))]
+    matches, seen = [], set()
+    for row in rows:
+        if row['id'] == exclude or row['id'] in seen:
+            continue
+        seen.add(row['id'])
+        similarity = score(record, row)
+        if similarity >= threshold:
+            matches.append(dict(row, score=similarity))
+    matches.sort(key=lambda m: -m['score'])
+    return matches
+
+
+def candidate_pairs(conn, max_block_size=MAX_BLOCK_SIZE):
+    """Yield each (row_a, row_b) sharing a key once, block by block.
+
+    Only keys held by 2..max_block_size identities are read, so the work is
+    bounded by the block sizes rather than the square of the table size.
+    Every row carries the eligible keys of its identity, and a pair sharing
+    several of them is only yielded from the block of the lowest one, so
+    no set of pairs already yielded is kept.
+    """
+    cursor = conn.execute("""WITH blocks AS (SELECT key FROM MatchKeys GROUP BY key HAVING count(*) BETWEEN 2 AND ?)
+                             SELECT m.key, p.id, p.type, p.first_name, p.last_name, p.dob, p.email,
+                                    (SELECT group_concat(k.key, char(31)) FROM MatchKeys k
+                                     WHERE k.person_id = p.id AND k.key IN blocks) AS block_keys
+                             FROM MatchKeys m JOIN People p ON p.id = m.person_id
+                             WHERE m.key IN blocks
+                             ORDER BY m.key""", (max_block_size,))
+    block, block_key = [], None
+    while True:
+        rows = cursor.fetchmany(5000)
+        for row in rows:
+            if row['key'] != block_key:
+                yield from _block_pairs(block, block_key)
+                block, block_key = [], row['key']
+            block.append((row, frozenset(row['block_keys'].split('\x1f'))))
+        if not rows:
+            yield from _block_pairs(block, block_key)
+            return
+
+
+def _block_pairs(block, key):
+    for i, (a, a_keys) in enumerate(block):
+        for b, b_keys in block[i + 1:]:
+            if min(a_keys & b_keys) == key:
+                yield a, b
+
+
+def duplicate_report(conn, threshold=MATCH_THRESHOLD, max_block_size=MAX_BLOCK_SIZE):
+    """Return (matches, stats); matches are (score, row_a, row_b), best first"""
+    ensure_fresh(conn)
+    matches, compared = [], 0
+    for a, b in candidate_pairs(conn, max_block_size):
+        compared += 1
+        similarity = score(a, b)
+        if similarity >= threshold:
+            matches.append((similarity, a, b))
+    matches.sort(key=lambda m: (-m[0], m[1]['id'], m[2]['id']))
+    skipped = conn.execute("SELECT COUNT(*) FROM (SELECT 1 FROM MatchKeys GROUP BY key HAVING count(*) > ?)",
+                           (max_block_size,)).fetchone()[0]
+    return matches, {'compared': compared, 'matches': len(matches), 'skipped_blocks': skipped}
+
+# ========================
+# CLI
+# ========================
+REPORT_FIELDS = ['id', 'type', 'first_name', 'last_name', 'dob', 'email']
+
+
+@click.command("dedupe-report")
+@click.option("--output", type=click.Path(dir_okay=False), help="CSV file (default: stdout).")
+@click.option("--threshold", type=float, default=MATCH_THRESHOLD, show_default=True)
+@click.option("--max-block-size", type=int, default=MAX_BLOCK_SIZE, show_default=True,
+              help="Skip keys shared by more identities than this.")
+@click.option("--rebuild-keys", "rebuild", is_flag=True, help="Recompute every identity's keys first.")
+@with_appcontext
+def dedupe_report_command(output, threshold, max_block_size, rebuild):
+    """List likely duplicate identities as scored pairs."""
+    conn = get_db_connection()
+    if rebuild:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rebuild_keys(conn.cursor())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    matches, stats = duplicate_report(conn, threshold, max_block_size)
+    out = open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(['score'] + [f + '_a' for f in REPORT_FIELDS] + [f + '_b' for f in REPORT_FIELDS])
+        for similarity, a, b in matches:
+            writer.writerow([similarity] + [a[f] for f in REPORT_FIELDS] + [b[f] for f in REPORT_FIELDS])
+    finally:
+        if output:
+            out.close()
+    click.echo(f"{stats['matches']} likely duplicate pairs out of {stats['compared']} compared "
+               f"({stats['skipped_blocks']} oversized blocks skipped)", err=True)
@@ -0,0 +1,134 @@
+import json
+from datetime import datetime
+
+import audit
+import profiles
+
+# fields the edit form may change
+EDITABLE_FIELDS = ['first_name', 'last_name', 'status', 'national_id', 'diploma_type', 'diploma_year',
+                   'entry_year', 'faculty_rank', 'primary_department', 'staff_department', 'job_title',
+                   'staff_entry_date']
+
+# fields a batch edit may set or filter on; status goes through the transition rules instead
+BATCH_FIELDS = [f for f in EDITABLE_FIELDS if f != 'status']
+
+
+class EditConflict(Exception):
+    """The identity changed (or was deleted) since the editor loaded it"""
+
+
+class EditError(ValueError):
+    pass
+
+
+# JSON values a batch edit may set or filter on; lists and objects cannot be bound as SQLite parameters
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+# ========================
+# Single Identity
+# ========================
+def diff_changes(person, form):
+    """(field, old, new) for every editable field the form actually changed.
+
+    Fields missing from the form (disabled inputs, the untouched status select)
+    count as unchanged rather than as a change to 'None'.
+    """
+    changes = []
+    for f in EDITABLE_FIELDS:
+        new = form.get(f)
+        if new is None:
+            continue
+        old = person[f] if person[f] is not None else ''
+        if str(new) != str(old):
+            changes.append((f, old, new))
+    return changes
+
+
+def write_edit(conn, uid, changes, expected_version):
+    """Write all changed columns plus their audit rows inside the caller's transaction.
+
+    Core columns go out as one UPDATE of People, profile columns as one upsert
+    per extension table.
+
+    The UPDATE only matches while People.version still equals expected_version;
+    otherwise nothing is written and EditConflict is raised. Returns the new version.
+    """
+    now = datetime.now().isoformat()
+    core = [(f, new) for f, _, new in changes if f not in profiles.COLUMN_TABLES]
+    assignments = [f"{f}=?, " for f, _ in core]
+    params = [new for _, new in core]
+    if any(f == 'status' for f, _ in core):
+        assignments.append("status_changed_at=?, ")
+        params.append(now)
+    # bumps the version even when only profile columns change
+    cur = conn.execute(f"UPDATE People SET {''.join(assignments)}version=version+1 "
+                       "WHERE id=? AND version=?", params + [uid, expected_version])
+    if cur.rowcount != 1:
+        raise EditConflict(uid)
+    profiles.save_profiles(conn, uid, {f: new for f, _, new in changes if f in profiles.COLUMN_TABLES})
+    audit.record_changes(conn, uid, changes, now)
+    return expected_version + 1
+
+# ========================
+# Batch Edits
+# ========================
+def _check_fields(values, what):
+    if not isinstance(values, dict) or not values:
+        raise EditError(f"'{what}' must be a non-empty object")
+    unknown = [f for f in values if f not in BATCH_FIELDS]
+    if unknown:
+        raise EditError(f"Cannot {what} field(s): {', '.join(unknown)}")
+    invalid = [f for f, v in values.items() if not isinstance(v, SCALAR_TYPES)]
+    if invalid:
+        raise EditError(f"Cannot {what} a list or object: {', '.join(invalid)}")
+
+
+def batch_edit(conn, values, ids=None, where=None):
+    """Set the same values on many identities with set-based statements.
+
+    Targets are the given ids, or every identity matching the `where` equalities
+    (e.g. {'primary_department': 'Physics'} for a department rename). Archived
+    identities and rows that already hold the values are skipped. Returns the
+    list of ids that changed.
+    """
+    _check_fields(values, 'set')
+    if ids is None and where is None:
+        raise EditError("Give either 'ids' or 'where'")
+    now = datetime.now().isoformat()
+    fields = list(values)
+    col = profiles.qualified
+    differs = ' OR '.join(f"{col(f)} IS NOT ?" for f in fields)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if ids is not None:
+            if not isinstance(ids, list):
+                raise EditError("'ids' must be a list")
+            target = "People.id IN (SELECT value FROM json_each(?))"
+            target_params = [json.dumps([str(i) for i in ids])]
+            source = "People" + profiles.joins(fields)
+        else:
+            _check_fields(where, 'filter on')
+            target = ' AND '.join(f"{col(f)} = ?" for f in where)
+            target_params = list(where.values())
+            source = "People" + profiles.joins(fields + list(where))
+        changed = [r[0] for r in conn.execute(
+            f"SELECT People.id FROM {source} WHERE {target} AND People.status IS NOT 'Archived' AND ({differs})",
+            target_params + [values[f] for f in fields])]
+        if changed:
+            # pin the rows to change, then audit and update them with one statement each
+            batch = json.dumps(changed)
+            for f in fields:
+                conn.execute(f"""INSERT INTO Audit (person_id,changed_at,field,old_value,new_value)
+                                 SELECT People.id, ?, ?, ifnull({col(f)},''), ? FROM People{profiles.joins([f])}
+                                 WHERE People.id IN (SELECT value FROM json_each(?)) AND {col(f)} IS NOT ?""",
+                             (now, f, values[f], batch, values[f]))
+            core = [f for f in fields if f not in profiles.COLUMN_TABLES]
+            conn.execute(f"UPDATE People SET {''.join(f'{f}=?, ' for f in core)}version=version+1 "
+                         "WHERE id IN (SELECT value FROM json_each(?))",
+                         [values[f] for f in core] + [batch])
+            profiles.set_for_ids(conn, {f: values[f] for f in fields if f in profiles.COLUMN_TABLES}, batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return changed
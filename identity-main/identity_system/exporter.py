@@ -0,0 +1,309 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import zlib
+from datetime import datetime
+
+import click
+from flask import Blueprint, Response, current_app, jsonify, request, send_file, stream_with_context
+from flask.cli import with_appcontext
+
+import profiles
+import search_index
+from db import get_db_connection
+
+bp = Blueprint('export', __name__)
+
+# every People and profile column, the modification stamp, and the deletion stamp of tombstone rows
+EXPORT_COLUMNS = profiles.ALL_COLUMNS + ['updated_at', 'deleted_at']
+
+# same names as the /search form
+FILTER_FIELDS = ('query', 'type_filter', 'status_filter', 'year_filter', 'department_filter')
+
+# format -> (mimetype, file extension)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# UTC, sortable as text; every updated_at/deleted_at value uses this format
+NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+# the watermark handed back for the next incremental run is this far behind the export start,
+# so a write that was still committing when the export began is picked up next time
+OVERLAP_SECONDS = 5
+
+
+class ExportError(ValueError):
+    pass
+
+# ========================
+# Change Tracking
+# ========================
+def init_change_tracking(cur):
+    """Maintain People.updated_at and tombstones for deleted identities with triggers.
+
+    Editing a profile row touches its person too, so one timestamp covers
+    every exported column. Writers never set updated_at themselves.
+    """
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_people_updated_at ON People(updated_at, id)")
+    cur.execute('''CREATE TABLE IF NOT EXISTS DeletedPeople (
+                    id TEXT PRIMARY KEY,
+                    deleted_at TEXT NOT NULL
+                ) WITHOUT ROWID''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_deleted_people_at ON DeletedPeople(deleted_at)")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS people_touch_insert AFTER INSERT ON People BEGIN
+                        UPDATE People SET updated_at = {NOW_SQL} WHERE rowid = NEW.rowid AND updated_at IS NULL;
+                        DELETE FROM DeletedPeople WHERE id = NEW.id;
+                    END""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS people_touch_update AFTER UPDATE ON People
+                    WHEN NEW.updated_at IS OLD.updated_at BEGIN
+                        UPDATE People SET updated_at = {NOW_SQL} WHERE rowid = NEW.rowid;
+                    END""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS people_tombstone AFTER DELETE ON People BEGIN
+                        INSERT OR REPLACE INTO DeletedPeople (id, deleted_at) VALUES (OLD.id, {NOW_SQL});
+                    END""")
+    for table in profiles.PROFILE_TABLES:
+        for event in ('INSERT', 'UPDATE'):
+            cur.execute(f"""CREATE TRIGGER IF NOT EXISTS {table.lower()}_touch_{event.lower()}
+                            AFTER {event} ON {table} BEGIN
+                                UPDATE People SET updated_at = {NOW_SQL} WHERE id = NEW.person_id;
+                            END""")
+
+
+def watermark(conn):
+    """The `since` value to pass to the next incremental export started after this one"""
+    return conn.execute(f"SELECT strftime('%Y-%m-%dT%H:%M:%fZ', 'now', '-{OVERLAP_SECONDS} seconds')").fetchone()[0]
+
+
+def parse_since(value):
+    """Validate an ISO timestamp and normalize it to the stored UTC format"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise ExportError(f"Invalid since timestamp: {value}")
+    if parsed.utcoffset():
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    return parsed.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+# ========================
+# Reading
+# ========================
+def iter_chunks(conn, filters=None, since=None, chunk_size=1000):
+    """Yield lists of EXPORT_COLUMNS tuples, `chunk_size` rows at a time.
+
+    Rows are read with fetchmany, so memory stays flat. Unless the caller is
+    already in a transaction, everything is read inside one read transaction,
+    so the rows and the tombstones come from one consistent snapshot even if
+    writers commit between chunks. With `since`, only identities changed after
+    it are read (oldest change first) and then a tombstone row (id and
+    deleted_at only) for each identity deleted after it, whatever the filters.
+    """
+    own = not conn.in_transaction
+    if own:
+        conn.execute("BEGIN")
+    try:
+        yield from _read_chunks(conn, filters, since, chunk_size)
+    finally:
+        if own:
+            conn.commit()
+
+
+def _read_chunks(conn, filters, since, chunk_size):
+    filters = {k: v for k, v in (filters or {}).items() if k in FILTER_FIELDS}
+    source, where, params, _ = search_index.search_filter(**filters)
+    columns = EXPORT_COLUMNS[:-1]
+    sql = (f"SELECT {', '.join(profiles.qualified(c, 'p') for c in columns)}, NULL"
+           f"{source}{profiles.joins(columns, 'p')}{where}")
+    if since:
+        sql += " AND p.updated_at > ? ORDER BY p.updated_at, p.id"
+        params.append(since)
+    else:
+        sql += " ORDER BY p.id"
+    yield from _fetch_chunks(conn.execute(sql, params), chunk_size)
+    if since:
+        blanks = ', '.join('NULL' for _ in EXPORT_COLUMNS[1:-1])
+        yield from _fetch_chunks(conn.execute(
+            f"SELECT id, {blanks}, deleted_at FROM DeletedPeople WHERE deleted_at > ? ORDER BY deleted_at, id",
+            (since,)), chunk_size)
+
+
+def _fetch_chunks(cursor, chunk_size):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield [tuple(row) for row in rows]
+
+# ========================
+# Writers
+# ========================
+def csv_pieces(chunks, columns=EXPORT_COLUMNS):
+    """CSV text, one piece per chunk, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonl_pieces(chunks, columns=EXPORT_COLUMNS):
+    """One JSON object per line, one piece per chunk"""
+    for rows in chunks:
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows)
+
+
+def gzip_pieces(pieces):
+    """Compress a stream of byte pieces into one gzip member as it goes"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        data = compressor.compress(piece)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def write_parquet(chunks, out, columns=EXPORT_COLUMNS):
+    """Write a zstd-compressed Parquet file, one row group per chunk (needs pyarrow).
+
+    Every column is a string, as in the CSV export; SQLite does not enforce
+    the declared column types, so numbers entered through forms may be text.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet export needs pyarrow (pip install pyarrow); use csv or jsonl with gzip instead")
+    schema = pa.schema([(c, pa.string()) for c in columns])
+    with pq.ParquetWriter(out, schema, compression='zstd') as writer:
+        for rows in chunks:
+            arrays = [pa.array([None if r[i] is None else str(r[i]) for r in rows], pa.string())
+                      for i in range(len(columns))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+def write_export(conn, out, fmt, filters=None, since=None, chunk_size=1000, compress=False):
+    """Write one export to the binary file object `out`; returns the number of rows written"""
+    written = 0
+
+    def counted(chunks):
+        nonlocal written
+        for rows in chunks:
+            written += len(rows)
+            yield rows
+
+    chunks = counted(iter_chunks(conn, filters, since, chunk_size))
+    if fmt == 'parquet':
+        write_parquet(chunks, out)
+        return written
+    pieces = (piece.encode() for piece in (csv_pieces if fmt == 'csv' else jsonl_pieces)(chunks))
+    for data in gzip_pieces(pieces) if compress else pieces:
+        out.write(data)
+    return written
+
+# ========================
+# Endpoint
+# ========================
+@bp.errorhandler(ExportError)
+def bad_export(e):
+    return jsonify(error=str(e)), 400
+
+
+@bp.route("/export.<fmt>")
+def export_identities(fmt):
+    """Stream every identity matching the /search filters; ?since= for changes only"""
+    if fmt not in FORMATS:
+        return jsonify(error=f"Unknown export format: {fmt} (choose from {', '.join(FORMATS)})"), 404
+    filters = {field: request.args.get(field, '').strip() for field in FILTER_FIELDS}
+    since = parse_since(request.args.get('since'))
+    conn = get_db_connection()
+    mimetype, extension = FORMATS[fmt]
+    headers = {'X-Export-Watermark': watermark(conn)}
+    chunks = iter_chunks(conn, filters, since, current_app.config['EXPORT_CHUNK_SIZE'])
+
+    if fmt == 'parquet':
+        # the footer is written last, so the file is built before it is sent
+        spool = tempfile.TemporaryFile()
+        write_parquet(chunks, spool)
+        spool.seek(0)
+        response = send_file(spool, mimetype=mimetype, as_attachment=True,
+                             download_name=f"identities.{extension}")
+        response.headers.update(headers)
+        return response
+
+    pieces = (piece.encode() for piece in (csv_pieces if fmt == 'csv' else jsonl_pieces)(chunks))
+    filename = f"identities.{extension}"
+    if request.args.get('compress') == 'gzip':
+        pieces = gzip_pieces(pieces)
+        mimetype, filename = 'application/gzip', filename + '.gz'
+    headers['Content-Disposition'] = f"attachment; filename={filename}"
+    return Response(stream_with_context(pieces), mimetype=mimetype, headers=headers)
+
+# ========================
+# CLI
+# ========================
+@click.command("export-identities")
+@click.argument("output", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option("--format", "fmt", type=click.Choice(list(FORMATS)),
+              help="Default: taken from the OUTPUT extension, else csv.")
+@click.option("--gzip", "compress", is_flag=True, help="gzip csv/jsonl output.")
+@click.option("--since", help="Only identities changed (or deleted) after this ISO timestamp.")
+@click.option("--state-file", type=click.Path(dir_okay=False),
+              help="Read --since from this file and store the next watermark in it after a successful run.")
+@click.option("--query", default='', help="Same filters as /search.")
+@click.option("--type", "type_filter", default='')
+@click.option("--status", "status_filter", default='')
+@click.option("--year", "year_filter", default='')
+@click.option("--department", "department_filter", default='')
+@click.option("--chunk-size", type=int, default=None, help="Rows per fetchmany (default EXPORT_CHUNK_SIZE).")
+@with_appcontext
+def export_identities_command(output, fmt, compress, since, state_file, query, type_filter, status_filter,
+                              year_filter, department_filter, chunk_size):
+    """Export identities to CSV, JSONL or Parquet, in full or incrementally."""
+    if fmt is None:
+        name = output[:-3] if output.endswith('.gz') else output
+        fmt = next((f for f, (_, ext) in FORMATS.items() if name.endswith('.' + ext)), 'csv')
+        compress = compress or output.endswith('.gz')
+    if state_file and not since and os.path.exists(state_file):
+        with open(state_file) as f:
+            since = f.read().strip() or None
+    try:
+        since = parse_since(since)
+    except ExportError as e:
+        raise click.BadParameter(str(e), param_hint='--since')
+
+    conn = get_db_connection()
+    next_since = watermark(conn)
+    filters = {'query': query, 'type_filter': type_filter, 'status_filter': status_filter,
+               'year_filter': year_filter, 'department_filter': department_filter}
+    chunk_size = chunk_size or current_app.config['EXPORT_CHUNK_SIZE']
+    try:
+        if output == '-':
+            count = write_export(conn, click.get_binary_stream('stdout'), fmt, filters, since, chunk_size,
+                                 compress)
+        else:
+            # written next to the target and renamed, so readers never see a partial file
+            partial = output + '.partial'
+            try:
+                with open(partial, 'wb') as out:
+                    count = write_export(conn, out, fmt, filters, since, chunk_size, compress)
+            except BaseException:
+                os.remove(partial)
+                raise
+            os.replace(partial, output)
+    except ExportError as e:
+        raise click.ClickException(str(e))
+    if state_file:
+        with open(state_file, 'w') as f:
+            f.write(next_since + '\n')
+    click.echo(f"Exported {count} rows{f' changed since {since}' if since else ''}; next watermark {next_since}",
+               err=True)
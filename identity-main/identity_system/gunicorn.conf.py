@@ -0,0 +1,41 @@
+"""gunicorn settings for production: `gunicorn -c gunicorn.conf.py` from this directory"""
+import multiprocessing
+import os
+
+wsgi_app = "wsgi:app"
+bind = os.getenv("BIND", "127.0.0.1:8000")
+
+# several processes, each with a few threads sharing its connection pool;
+# keep DB_POOL_SIZE >= threads so a request never waits for a connection
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# every worker builds its own SQLite connections and outbox threads after the fork;
+# neither may be inherited from the master, so the app is never preloaded
+preload_app = False
+
+timeout = 30
+graceful_timeout = 30
+max_requests = 10000
+max_requests_jitter = 1000
+accesslog = "-"
+
+
+def on_starting(server):
+    """Migrate the schema once in the master, before any worker opens the database"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    import app
+    app.init_db()
+
+
+def worker_exit(server, worker):
+    """Stop the writer, outbox, gateway and maintenance threads and close pooled connections when a worker exits"""
+    import wsgi
+    if 'maintenance' in wsgi.app.extensions:
+        wsgi.app.extensions['maintenance'].stop()
+    wsgi.app.extensions['writer'].stop()
+    wsgi.app.extensions['outbox'].stop()
+    wsgi.app.extensions['db_gateway'].stop()
+    wsgi.app.extensions['db_pool'].close()
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+ID_PREFIXES = {"Student": "STU", "PhD": "PHD", "Faculty": "FAC", "Staff": "STF"}
+
+# ========================
+# Sequence Table
+# ========================
+def init_sequences(cur):
+    """Create the per-type, per-year ID sequence table"""
+    cur.execute('''CREATE TABLE IF NOT EXISTS IdSequence (
+                    prefix TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    next_value INTEGER NOT NULL,
+                    PRIMARY KEY (prefix, year)
+                ) WITHOUT ROWID''')
+
+
+def id_prefix(user_type):
+    return ID_PREFIXES.get(user_type, "TMP")
+
+
+def format_id(prefix, year, number):
+    return f"{prefix}{year}{number:05d}"
+
+# ========================
+# Allocation
+# ========================
+def reserve_ids(conn, user_type, count=1, year=None):
+    """Reserve `count` consecutive IDs for user_type on the caller's connection.
+
+    The sequence row is advanced with a single UPDATE, which takes SQLite's write
+    lock, so the reservation is atomic with whatever the caller inserts before it
+    commits. Numbers are never handed out twice, even after deletes.
+    """
+    if count < 1:
+        return []
+    prefix = id_prefix(user_type)
+    year = year or datetime.now().year
+    cur = conn.execute("UPDATE IdSequence SET next_value = next_value + ? WHERE prefix=? AND year=?",
+                       (count, prefix, year))
+    if cur.rowcount == 0:
+        # first ID of this type this year: continue after any IDs issued before the sequence existed
+        first = _highest_issued(conn, prefix, year) + 1
+        conn.execute("INSERT INTO IdSequence (prefix, year, next_value) VALUES (?,?,?)",
+                     (prefix, year, first + count))
+    else:
+        first = conn.execute("SELECT next_value FROM IdSequence WHERE prefix=? AND year=?",
+                             (prefix, year)).fetchone()[0] - count
+    return [format_id(prefix, year, n) for n in range(first, first + count)]
+
+
+def allocate_id(conn, user_type):
+    """Allocate a single ID in the caller's transaction"""
+    return reserve_ids(conn, user_type, 1)[0]
+
+
+def _highest_issued(conn, prefix, year):
+    # primary-key range scan over this prefix/year only, instead of counting the whole table
+    start = f"{prefix}{year}"
+    row = conn.execute("SELECT MAX(CAST(substr(id, ?) AS INTEGER)) FROM People WHERE id >= ? AND id < ?",
+                       (len(start) + 1, start, f"{prefix}{year + 1}")).fetchone()
+    return row[0] or 0
@@ -0,0 +1,173 @@
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+import dedupe
+import id_allocator
+import outbox
+import profiles
+from db import get_db_connection
+from validation import validate_many
+
+# columns accepted from an import file (id, status and timestamps are assigned here)
+IMPORT_FIELDS = ['type', 'first_name', 'last_name', 'dob', 'place_of_birth', 'nationality', 'gender',
+                 'email', 'phone', 'national_id', 'diploma_type', 'diploma_year', 'entry_year',
+                 'faculty_rank', 'primary_department', 'staff_department', 'job_title', 'staff_entry_date']
+
+# People takes the core fields; the rest go to the profile tables
+CORE_FIELDS = [f for f in IMPORT_FIELDS if f not in profiles.COLUMN_TABLES]
+PROFILE_FIELDS = [f for f in IMPORT_FIELDS if f in profiles.COLUMN_TABLES]
+
+INSERT_SQL = (f"INSERT INTO People (id,status,status_changed_at,{','.join(CORE_FIELDS)}) "
+              f"VALUES ({','.join('?' * (len(CORE_FIELDS) + 3))})")
+
+REPORT_HEADER = ['line', 'email', 'errors']
+
+# ========================
+# Parsing
+# ========================
+def detect_format(filename):
+    """Guess the import format from a file name"""
+    name = (filename or '').lower()
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return 'jsonl'
+    return 'csv'
+
+
+def iter_records(stream, fmt):
+    """Yield (line_number, record, parse_error) from a text stream, one row at a time"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, "Each line must be a JSON object"
+                continue
+            yield line_number, record, None
+    else:
+        raise ValueError(f"Unknown import format: {fmt}")
+
+
+def clean_record(record):
+    """Keep known fields as stripped strings and map blanks to None.
+
+    JSONL numbers are turned into strings; booleans, arrays and objects
+    raise ValueError, which rejects the row.
+    """
+    cleaned = {}
+    for field in IMPORT_FIELDS:
+        value = record.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"{field} must be text, not {type(value).__name__}")
+        if value is not None:
+            value = value.strip()
+        cleaned[field] = None if value == '' else value
+    if cleaned['email']:
+        cleaned['email'] = cleaned['email'].lower()
+    return cleaned
+
+# ========================
+# Import
+# ========================
+def import_records(conn, stream, fmt, report, chunk_size=500, on_created=None):
+    """Stream records from `stream` into People in chunked transactions.
+
+    Each chunk is validated with validate_many, given a block of IDs per type and
+    inserted with one executemany, all inside a single BEGIN IMMEDIATE transaction,
+    so only one chunk is ever held in memory. Rejected rows are written to the
+    `report` file as CSV. `on_created(conn, email, uid)` runs in the same
+    transaction for every inserted row (used to queue confirmation emails).
+    Returns a dict with imported/rejected counts.
+    """
+    writer = csv.writer(report)
+    writer.writerow(REPORT_HEADER)
+    summary = {'imported': 0, 'rejected': 0}
+    records = iter_records(stream, fmt)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        rows = []
+        for line_number, record, error in chunk:
+            if not error:
+                try:
+                    rows.append((line_number, clean_record(record)))
+                except ValueError as e:
+                    error = str(e)
+            if error:
+                writer.writerow([line_number, '', error])
+                summary['rejected'] += 1
+        if rows:
+            imported, rejected = _import_chunk(conn, rows, writer, on_created)
+            summary['imported'] += imported
+            summary['rejected'] += rejected
+    return summary
+
+
+def _import_chunk(conn, rows, writer, on_created):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # validate under the write lock so nothing can slip in between check and insert
+        results = validate_many([data for _, data in rows], conn)
+        valid = []
+        for (line_number, data), errors in zip(rows, results):
+            if errors:
+                writer.writerow([line_number, data['email'] or '', '; '.join(errors)])
+            else:
+                valid.append(data)
+
+        by_type = {}
+        for data in valid:
+            by_type.setdefault(data['type'], []).append(data)
+        now = datetime.now().isoformat()
+        params = []
+        for user_type, group in by_type.items():
+            for uid, data in zip(id_allocator.reserve_ids(conn, user_type, len(group)), group):
+                data['id'] = uid
+                params.append([uid, 'Pending', now] + [data[f] for f in CORE_FIELDS])
+        conn.executemany(INSERT_SQL, params)
+        profiles.save_many(conn, [(data['id'], {f: data[f] for f in PROFILE_FIELDS}) for data in valid], new=True)
+        dedupe.refresh_pending(conn)
+        if on_created:
+            for data in valid:
+                on_created(conn, data['email'], data['id'])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(valid), len(rows) - len(valid)
+
+# ========================
+# CLI
+# ========================
+@click.command("import-identities")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), help="Defaults to the file extension.")
+@click.option("--report", default="import_errors.csv", show_default=True, type=click.Path(dir_okay=False),
+              help="Where to write rejected rows.")
+@click.option("--chunk-size", type=int, default=None, help="Rows per transaction (default IMPORT_CHUNK_SIZE).")
+@click.option("--no-email", is_flag=True, help="Do not queue confirmation emails.")
+@with_appcontext
+def import_identities_command(path, fmt, report, chunk_size, no_email):
+    """Bulk import identities from a CSV or JSONL file."""
+    chunk_size = chunk_size or current_app.config['IMPORT_CHUNK_SIZE']
+    with open(path, encoding="utf-8-sig", newline="") as stream, open(report, "w", newline="") as out:
+        summary = import_records(get_db_connection(), stream, fmt or detect_format(path),
+                                 out, chunk_size, None if no_email else outbox.send_confirmation)
+    click.echo(f"Imported {summary['imported']} identities, rejected {summary['rejected']} rows (see {report})")
@@ -0,0 +1,431 @@
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, current_app, g, has_request_context, jsonify, request
+from flask.signals import before_render_template, template_rendered
+
+from db import get_db_connection
+
+slow_query_logger = logging.getLogger(__name__ + '.slow_query')
+
+# the trace of the request whose job a gateway or writer thread is running (see traced_job)
+_job = threading.local()
+
+bp = Blueprint('instrumentation', __name__)
+
+# request and query latency buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# statements worth an EXPLAIN QUERY PLAN when they are slow
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+# ========================
+# Metric Registry (Prometheus text format)
+# ========================
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}  # label key -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    row[i] += 1
+            row[-2] += 1
+            row[-1] += seconds
+
+    def snapshot(self, **labels):
+        """{'buckets': {bound: cumulative count}, 'count', 'sum'} for one label set, as JSON-ready values"""
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            row = list(self._values.get(key) or [0] * (len(self.buckets) + 1) + [0.0])
+        return {'buckets': {str(bound): count for bound, count in zip(self.buckets, row)},
+                'count': row[-2], 'sum': round(row[-1], 6)}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, row in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, row):
+                    lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (bound,))} {count}")
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + ('+Inf',))} {row[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {row[-2]}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {round(row[-1], 6)}")
+        return lines
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Process-wide series fed by every traced request"""
+
+    def __init__(self):
+        self.requests = Counter('identity_http_requests_total', 'HTTP requests served',
+                                ('method', 'endpoint', 'status'))
+        self.request_seconds = Histogram('identity_http_request_duration_seconds',
+                                         'Time from request start to response', ('endpoint',))
+        self.queries = Counter('identity_db_queries_total', 'SQL statements executed by request handlers',
+                               ('endpoint',))
+        self.query_seconds = Histogram('identity_db_query_duration_seconds',
+                                       'Execute plus fetch time per statement', ('endpoint',))
+        self.slow_queries = Counter('identity_db_slow_queries_total',
+                                    'Statements slower than SLOW_QUERY_MS', ('endpoint',))
+        self.span_seconds = Histogram('identity_span_duration_seconds',
+                                      'Template rendering and email queueing time', ('span', 'endpoint'))
+
+    def series(self):
+        return (self.requests, self.request_seconds, self.queries, self.query_seconds,
+                self.slow_queries, self.span_seconds)
+
+# ========================
+# Per-request Trace
+# ========================
+class QueryRecord:
+    __slots__ = ('sql', 'params', 'seconds', 'rows')
+
+    def __init__(self, sql, params, seconds, rows):
+        self.sql = sql
+        self.params = params  # None for executemany
+        self.seconds = seconds
+        self.rows = rows
+
+
+class RequestTrace:
+    """Queries, spans and statement counts collected while one request runs"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.spans = {}
+        self.statements = 0  # every statement SQLite ran, including implicit BEGIN/COMMIT and triggers
+        self.triggers = 0
+        self._template_started = []
+
+    def add_span(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def on_statement(self, sql):
+        """sqlite3 trace callback"""
+        self.statements += 1
+        if sql.startswith('-- TRIGGER'):
+            self.triggers += 1
+
+    def db_seconds(self):
+        return sum(q.seconds for q in self.queries)
+
+
+def current_trace():
+    """The active RequestTrace, or None outside a traced request or a job submitted from one"""
+    trace = getattr(_job, 'trace', None)
+    if trace is not None:
+        return trace
+    if has_request_context():
+        return g.get('trace')
+    return None
+
+
+def timed(span):
+    """Decorator adding the call's duration to the current request's `span`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = current_trace()
+            if trace is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                trace.add_span(span, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+# ========================
+# Traced Connection
+# ========================
+class TracedCursor:
+    """sqlite3 cursor that times execute and fetch calls and counts rows"""
+
+    def __init__(self, cursor, trace):
+        self._cursor = cursor
+        self._trace = trace
+        self._record = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        self._cursor.execute(sql, params)
+        self._record = QueryRecord(sql, params, time.perf_counter() - started, max(self._cursor.rowcount, 0))
+        self._trace.queries.append(self._record)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        started = time.perf_counter()
+        self._cursor.executemany(sql, seq_of_params)
+        self._record = QueryRecord(sql, None, time.perf_counter() - started, max(self._cursor.rowcount, 0))
+        self._trace.queries.append(self._record)
+        return self
+
+    def _fetched(self, started, rows):
+        if self._record is not None:
+            self._record.seconds += time.perf_counter() - started
+            self._record.rows += rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(size or self._cursor.arraysize)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+
+class TracedConnection:
+    """Wraps a pooled connection for one request; everything but statement execution passes through"""
+
+    def __init__(self, conn, trace):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_trace', trace)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def cursor(self, *args):
+        return TracedCursor(self._conn.cursor(*args), self._trace)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+def wrap_connection(conn):
+    """db_wrapper hook: trace the request's connection, pass it through elsewhere"""
+    trace = current_trace()
+    if trace is None:
+        return conn
+    conn.set_trace_callback(trace.on_statement)
+    return TracedConnection(conn, trace)
+
+@contextmanager
+def traced_job(conn, trace):
+    """Run a job on a gateway or writer thread as part of the request that submitted it.
+
+    Its statements go into that request's trace through a TracedConnection,
+    and timed() spans inside it (e.g. 'mail') count toward the request.
+    With trace None the connection is yielded as it is.
+    """
+    if trace is None:
+        yield conn
+        return
+    _job.trace = trace
+    conn.set_trace_callback(trace.on_statement)
+    try:
+        yield TracedConnection(conn, trace)
+    finally:
+        conn.set_trace_callback(None)
+        _job.trace = None
+
+# ========================
+# Slow Query Log
+# ========================
+def explain(conn, sql, params):
+    """EXPLAIN QUERY PLAN lines for a statement, or [] if it cannot be explained"""
+    if params is None or not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    try:
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    except Exception as e:
+        return [f"(no plan: {e})"]
+
+
+def log_slow_queries(conn, trace, endpoint, threshold):
+    metrics = current_app.extensions['instrumentation']
+    recent = current_app.extensions['slow_queries']
+    for query in trace.queries:
+        if query.seconds < threshold:
+            continue
+        if conn is None:
+            # the query ran on a gateway or writer connection; any connection can explain it
+            conn = get_db_connection()
+        plan = explain(conn, query.sql, query.params)
+        metrics.slow_queries.inc(endpoint=endpoint)
+        entry = {'at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'endpoint': endpoint,
+                 'ms': round(query.seconds * 1000, 2), 'rows': query.rows,
+                 'sql': ' '.join(query.sql.split()), 'plan': plan}
+        recent.append(entry)
+        slow_query_logger.warning("Slow query on %s (%.1f ms, %d rows): %s | plan: %s",
+                                  endpoint, entry['ms'], query.rows, entry['sql'], '; '.join(plan) or '-')
+
+# ========================
+# Request Hooks
+# ========================
+def _start_trace():
+    g.trace = RequestTrace()
+
+
+def _untrace_connection(exc=None):
+    """Runs before the connection goes back to the pool, also when the view raised"""
+    conn = g.get('db')
+    if conn is not None:
+        conn.set_trace_callback(None)
+
+
+def _template_started(sender, template, context, **extra):
+    trace = current_trace()
+    if trace is not None:
+        trace._template_started.append(time.perf_counter())
+
+
+def _template_finished(sender, template, context, **extra):
+    trace = current_trace()
+    if trace is not None and trace._template_started:
+        trace.add_span('tpl', time.perf_counter() - trace._template_started.pop())
+
+
+def _finish_trace(response):
+    trace = g.pop('trace', None)
+    if trace is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    metrics = current_app.extensions['instrumentation']
+    total = time.perf_counter() - trace.started
+    db_seconds = trace.db_seconds()
+
+    metrics.requests.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+    metrics.request_seconds.observe(total, endpoint=endpoint)
+    metrics.queries.inc(len(trace.queries), endpoint=endpoint)
+    for query in trace.queries:
+        metrics.query_seconds.observe(query.seconds, endpoint=endpoint)
+    for span, seconds in trace.spans.items():
+        metrics.span_seconds.observe(seconds, span=span, endpoint=endpoint)
+
+    log_slow_queries(g.get('db'), trace, endpoint, current_app.config['SLOW_QUERY_MS'] / 1000)
+
+    if current_app.config['SERVER_TIMING']:
+        timings = [f'db;dur={db_seconds * 1000:.2f};desc="{len(trace.queries)} queries, '
+                   f'{trace.statements} statements"']
+        timings += [f"{span};dur={seconds * 1000:.2f}" for span, seconds in sorted(trace.spans.items())]
+        timings.append(f"total;dur={total * 1000:.2f}")
+        response.headers.add('Server-Timing', ', '.join(timings))
+    return response
+
+# ========================
+# Endpoints
+# ========================
+@bp.route("/metrics")
+def prometheus_metrics():
+    metrics = current_app.extensions['instrumentation']
+    lines = []
+    for series in metrics.series():
+        lines.extend(series.render())
+    pool = current_app.extensions['db_pool'].stats()
+    lines += ["# HELP identity_db_pool_connections Open pooled connections",
+              "# TYPE identity_db_pool_connections gauge",
+              f"identity_db_pool_connections{{state=\"open\"}} {pool['size']}",
+              f"identity_db_pool_connections{{state=\"idle\"}} {pool['idle']}"]
+    for series in current_app.extensions['writer'].series():
+        lines.extend(series.render())
+    outbox = current_app.extensions['outbox'].metrics.snapshot()
+    lines += ["# HELP identity_outbox_messages_total Outbox deliveries by result",
+              "# TYPE identity_outbox_messages_total counter"]
+    lines += [f"identity_outbox_messages_total{{result=\"{result}\"}} {outbox[result]}"
+              for result in ('sent', 'retried', 'failed')]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+@bp.route("/metrics/slow-queries")
+def slow_queries():
+    return jsonify(list(current_app.extensions['slow_queries']))
+
+# ========================
+# Setup
+# ========================
+def init_app(app):
+    """Trace every request if INSTRUMENTATION is on (see config.py)"""
+    if not app.config['INSTRUMENTATION']:
+        return
+    app.extensions['instrumentation'] = Metrics()
+    app.extensions['slow_queries'] = deque(maxlen=app.config['SLOW_QUERY_KEEP'])
+    app.extensions['db_wrapper'] = wrap_connection
+    app.before_request(_start_trace)
+    app.after_request(_finish_trace)
+    app.teardown_request(_untrace_connection)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    app.register_blueprint(bp)
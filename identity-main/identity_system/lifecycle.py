@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta
+
+import click
+from flask import has_app_context
+from flask.cli import with_appcontext
+
+import cache
+from db import get_db_connection
+
+VALID_TRANSITIONS = {
+    'Pending': ['Active'],  # Pending can only go to Active
+    'Active': ['Suspended', 'Inactive'],  # Active can go to Suspended or Inactive
+    'Suspended': ['Active', 'Inactive'],  # Suspended can go to Active or Inactive
+    'Inactive': ['Archived'],  # Inactive can only go to Archived
+    'Archived': []  # Archived cannot transition anywhere (final state)
+}
+
+# minimum days in the old status before a transition is allowed
+MIN_AGE_DAYS = {
+    ('Inactive', 'Archived'): 365 * 5,
+}
+
+# transitions the scheduled job applies on its own: (from, to, days in the old status)
+SCHEDULED_TRANSITIONS = [
+    ('Inactive', 'Archived', MIN_AGE_DAYS[('Inactive', 'Archived')]),
+]
+
+
+def is_valid_transition(current_status, new_status, status_changed_at=None):
+    """Check if transition from current_status to new_status is allowed"""
+    if current_status == new_status:
+        return True  # Same status is allowed
+    if current_status not in VALID_TRANSITIONS:
+        return False  # Invalid current status
+    if new_status not in VALID_TRANSITIONS[current_status]:
+        return False  # Not in allowed transitions
+
+    # Special rule: Inactive → Archived only after 5 years
+    min_days = MIN_AGE_DAYS.get((current_status, new_status))
+    if min_days and status_changed_at:
+        try:
+            changed_date = datetime.fromisoformat(status_changed_at)
+            age_days = (datetime.now() - changed_date).days
+            if age_days < min_days:
+                return False
+        except:
+            pass
+    return True
+
+# ========================
+# Indexes
+# ========================
+def init_lifecycle_indexes(cur):
+    """Finding every identity in a status since before a cutoff is an index range scan"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_people_status_changed ON People(status, status_changed_at)")
+
+# ========================
+# Bulk Transitions
+# ========================
+def check_transition(from_status, to_status, older_than_days):
+    """Raise ValueError unless the rules allow this bulk transition"""
+    if to_status not in VALID_TRANSITIONS.get(from_status, []):
+        raise ValueError(f"Invalid status transition: {from_status} → {to_status} is not allowed")
+    min_days = MIN_AGE_DAYS.get((from_status, to_status), 0)
+    if older_than_days < min_days:
+        raise ValueError(f"{from_status} → {to_status} requires at least {min_days} days in {from_status}")
+
+
+def pending_transition(conn, from_status, to_status, older_than_days):
+    """(count, oldest status_changed_at) of identities the transition would move"""
+    check_transition(from_status, to_status, older_than_days)
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+    row = conn.execute("SELECT COUNT(*), MIN(status_changed_at) FROM People "
+                       "WHERE status=? AND status_changed_at < ?", (from_status, cutoff)).fetchone()
+    return row[0], row[1]
+
+
+def apply_transition(conn, from_status, to_status, older_than_days, chunk_size=5000):
+    """Move identities in from_status since before the cutoff to to_status.
+
+    Each chunk is one short BEGIN IMMEDIATE transaction that picks the next
+    `chunk_size` ids from the (status, status_changed_at) index, writes their
+    audit rows with INSERT ... SELECT and updates them with a single UPDATE.
+    Only the moved ids are read back, to drop them from this process's
+    identity cache after commit; other processes notice through ChangeLog.
+    Returns the number of identities moved.
+    """
+    check_transition(from_status, to_status, older_than_days)
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+    moved = 0
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS lifecycle_batch (id TEXT PRIMARY KEY)")
+    conn.commit()
+    while True:
+        now = datetime.now().isoformat()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM temp.lifecycle_batch")
+            count = conn.execute("INSERT INTO temp.lifecycle_batch SELECT id FROM People "
+                                 "WHERE status=? AND status_changed_at < ? ORDER BY status_changed_at LIMIT ?",
+                                 (from_status, cutoff, chunk_size)).rowcount
+            if not count:
+                conn.rollback()
+                break
+            conn.execute("""INSERT INTO Audit (person_id,changed_at,field,old_value,new_value)
+                            SELECT id, ?, 'status', ?, ? FROM temp.lifecycle_batch""",
+                         (now, from_status, to_status))
+            conn.execute("UPDATE People SET status=?, status_changed_at=?, version=version+1 "
+                         "WHERE id IN (SELECT id FROM temp.lifecycle_batch)", (to_status, now))
+            ids = [r[0] for r in conn.execute("SELECT id FROM temp.lifecycle_batch")]
+            conn.commit()
+            moved += count
+        except Exception:
+            conn.rollback()
+            raise
+        if has_app_context():
+            cache.invalidate_identity(*ids)
+    return moved
+
+# ========================
+# CLI
+# ========================
+@click.command("apply-lifecycle")
+@click.option("--from-status", default=None, help="Run one transition instead of the scheduled set.")
+@click.option("--to-status", default=None)
+@click.option("--older-than-days", type=int, default=None,
+              help="Days in --from-status (default: the rule's minimum).")
+@click.option("--chunk-size", default=5000, show_default=True, help="Identities moved per transaction.")
+@click.option("--dry-run", is_flag=True, help="Only report how many identities would move.")
+@with_appcontext
+def apply_lifecycle_command(from_status, to_status, older_than_days, chunk_size, dry_run):
+    """Apply scheduled status transitions (e.g. archive identities Inactive for 5 years)."""
+    if from_status or to_status:
+        if not (from_status and to_status):
+            raise click.UsageError("--from-status and --to-status go together")
+        days = older_than_days if older_than_days is not None else MIN_AGE_DAYS.get((from_status, to_status), 0)
+        transitions = [(from_status, to_status, days)]
+    else:
+        transitions = [(f, t, older_than_days if older_than_days is not None else d)
+                       for f, t, d in SCHEDULED_TRANSITIONS]
+    conn = get_db_connection()
+    for from_s, to_s, days in transitions:
+        try:
+            if dry_run:
+                count, oldest = pending_transition(conn, from_s, to_s, days)
+                click.echo(f"{from_s} → {to_s} (> {days} days): {count} identities would move"
+                           + (f", oldest since {oldest}" if count else ""))
+            else:
+                count = apply_transition(conn, from_s, to_s, days, chunk_size)
+                click.echo(f"{from_s} → {to_s} (> {days} days): moved {count} identities")
+        except ValueError as e:
+            raise click.ClickException(str(e))
@@ -0,0 +1,470 @@
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+import db
+import search_index
+
+logger = logging.getLogger(__name__)
+
+# rows ANALYZE reads per index, so statistics refresh in milliseconds even on large tables
+ANALYSIS_LIMIT = 1000
+
+# FTS5 pages written per 'merge' step
+FTS_MERGE_PAGES = 500
+
+# pages the backup copies per step; the source is only read-locked for one step at a time
+BACKUP_PAGES = 1000
+
+# a failed job is tried again after this long, whatever its interval
+RETRY_SECONDS = 3600
+
+INTEGRITY_MESSAGES_KEPT = 20
+
+
+class Interrupted(Exception):
+    """The maintenance window closed (or the scheduler stopped) before the job finished"""
+
+# ========================
+# Run Log
+# ========================
+def init_maintenance(cur):
+    """MaintenanceRuns: one row per job run, for scheduling across processes and for `--status`"""
+    cur.execute('''CREATE TABLE IF NOT EXISTS MaintenanceRuns (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job TEXT NOT NULL,
+                    started_at TEXT NOT NULL,
+                    finished_at TEXT,
+                    seconds REAL,
+                    reclaimed_bytes INTEGER,
+                    result TEXT NOT NULL DEFAULT 'running',
+                    detail TEXT
+                )''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_maintenance_runs_job ON MaintenanceRuns(job, id)")
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _stamp(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def _claim(conn, job, interval, force=False):
+    """Insert a 'running' row if the job is due; returns its id, or None when another run is recent.
+
+    Checked and inserted under the write lock, so several processes
+    running the scheduler never start the same job twice.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        last = conn.execute("SELECT started_at, result FROM MaintenanceRuns WHERE job = ? ORDER BY id DESC LIMIT 1",
+                            (job,)).fetchone()
+        if not force and last is not None:
+            started = datetime.fromisoformat(last['started_at'].replace('Z', '+00:00'))
+            wait = min(interval, RETRY_SECONDS) if last['result'] == 'error' else interval
+            if _utcnow() - started < timedelta(seconds=wait):
+                conn.rollback()
+                return None
+        run_id = conn.execute("INSERT INTO MaintenanceRuns (job, started_at) VALUES (?, ?)",
+                              (job, _stamp(_utcnow()))).lastrowid
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return run_id
+
+
+def _finish(conn, run_id, seconds, result, reclaimed=None, detail=None):
+    conn.execute("""UPDATE MaintenanceRuns SET finished_at = ?, seconds = ?, result = ?, reclaimed_bytes = ?,
+                    detail = ? WHERE id = ?""", (_stamp(_utcnow()), round(seconds, 3), result, reclaimed, detail,
+                                                 run_id))
+    conn.commit()
+
+
+def last_runs(conn):
+    """Latest MaintenanceRuns row per job"""
+    return conn.execute("""SELECT * FROM MaintenanceRuns WHERE id IN (SELECT max(id) FROM MaintenanceRuns GROUP BY job)
+                           ORDER BY job""").fetchall()
+
+# ========================
+# Helpers
+# ========================
+def database_path(conn):
+    return conn.execute("PRAGMA database_list").fetchone()['file']
+
+
+def file_sizes(conn):
+    """(database bytes, WAL bytes) on disk"""
+    path = database_path(conn)
+    wal = path + '-wal'
+    return os.path.getsize(path), os.path.getsize(wal) if os.path.exists(wal) else 0
+
+
+def parse_windows(value):
+    """'01:00-05:00,13:00-13:30' -> [((1, 0), (5, 0)), ...]; empty means any time"""
+    windows = []
+    for part in (value or '').split(','):
+        if not part.strip():
+            continue
+        try:
+            start, end = (tuple(int(n) for n in t.strip().split(':')) for t in part.split('-'))
+            if not all(len(t) == 2 and 0 <= t[0] < 24 and 0 <= t[1] < 60 for t in (start, end)):
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"Invalid maintenance window: {part.strip()} (expected HH:MM-HH:MM)")
+        windows.append((start, end))
+    return windows
+
+
+def in_window(windows, moment=None):
+    """True if the local time falls in one of the windows (a window may wrap past midnight)"""
+    if not windows:
+        return True
+    now = (moment or datetime.now()).timetuple()[3:5]
+    for start, end in windows:
+        if start <= end and start <= now < end or start > end and (now >= start or now < end):
+            return True
+    return False
+
+# ========================
+# Jobs
+# ========================
+# each job takes (conn, settings, check) and returns (reclaimed bytes or None, detail);
+# `check()` raises Interrupted when the job should stop between slices
+
+def run_checkpoint(conn, settings, check):
+    """Copy the WAL back into the database; truncate the WAL file once it has been fully applied.
+
+    PASSIVE never waits on readers or writers. TRUNCATE is only attempted
+    when nothing is left to copy, so it returns at once.
+    """
+    _, wal_before = file_sizes(conn)
+    busy, frames, copied = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    if not busy and frames == copied:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    _, wal_after = file_sizes(conn)
+    return wal_before - wal_after, f"{copied} of {frames} WAL frames copied"
+
+
+def run_optimize(conn, settings, check):
+    """Refresh planner statistics (ANALYZE with a row limit, then PRAGMA optimize) and merge FTS segments"""
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+    steps = 0
+    while True:
+        check()
+        before = conn.total_changes
+        conn.execute("INSERT INTO PeopleSearch(PeopleSearch, rank) VALUES ('merge', ?)", (FTS_MERGE_PAGES,))
+        conn.commit()
+        steps += 1
+        # fewer than two changes: the index had nothing left to merge
+        if conn.total_changes - before < 2:
+            break
+        time.sleep(settings['pause'])
+    return None, f"statistics refreshed, {steps} FTS merge steps"
+
+
+def run_vacuum(conn, settings, check):
+    """Give free pages back to the file system, `vacuum_pages` per transaction.
+
+    Needs auto_vacuum=INCREMENTAL, which only a full VACUUM can switch on
+    (`flask maintenance vacuum --full`, in a window); until then the job
+    only reports how much could be reclaimed.
+    """
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return None, (f"skipped: auto_vacuum is not INCREMENTAL ({free * page_size} bytes free); "
+                      "run `flask maintenance vacuum --full` once")
+    pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+    while free:
+        check()
+        # executescript steps the pragma to completion; execute() would free a single page
+        conn.executescript(f"PRAGMA incremental_vacuum({settings['vacuum_pages']})")
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free:
+            time.sleep(settings['pause'])
+    # the file only shrinks once the truncated pages are checkpointed
+    run_checkpoint(conn, settings, check)
+    pages_after = conn.execute("PRAGMA page_count").fetchone()[0]
+    return (pages_before - pages_after) * page_size, f"{pages_before - pages_after} pages released"
+
+
+def full_vacuum(conn):
+    """Rewrite the whole database with auto_vacuum=INCREMENTAL, keeping the search index keyed right.
+
+    Blocks every writer for as long as it runs, so it is only started from
+    the CLI. The FTS index is keyed on People rowids, which VACUUM is allowed
+    to renumber, and no lock can be held across VACUUM itself. So each
+    identity's rowid is noted first (in the temp schema, which VACUUM leaves
+    alone) and compared afterwards: if none moved, the index is still right
+    and there is no moment in which it is wrong. If some did, the index is
+    rebuilt in the very next write transaction.
+    """
+    size_before = sum(file_sizes(conn))
+    conn.execute("DROP TABLE IF EXISTS temp.vacuum_rowids")
+    conn.execute("CREATE TEMP TABLE vacuum_rowids (id TEXT PRIMARY KEY, old_rowid INTEGER) WITHOUT ROWID")
+    conn.execute("INSERT INTO temp.vacuum_rowids SELECT id, rowid FROM People")
+    conn.commit()
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        moved = conn.execute("SELECT COUNT(*) FROM People p JOIN temp.vacuum_rowids v ON v.id = p.id "
+                             "WHERE v.old_rowid != p.rowid").fetchone()[0]
+        if moved:
+            logger.warning("VACUUM renumbered %d People rowids; rebuilding the search index", moved)
+            search_index.rebuild_search_index(conn.cursor())
+        conn.execute("DROP TABLE temp.vacuum_rowids")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    detail = f"full VACUUM, {moved} rowids renumbered, search index rebuilt" if moved else \
+        "full VACUUM, rowids unchanged"
+    return size_before - sum(file_sizes(conn)), detail
+
+
+def run_integrity_check(conn, settings, check):
+    """PRAGMA integrity_check; a read transaction, so writers are never blocked"""
+    messages = [r[0] for r in conn.execute(f"PRAGMA integrity_check({INTEGRITY_MESSAGES_KEPT})")]
+    if messages != ['ok']:
+        raise RuntimeError("integrity_check failed: " + "; ".join(messages))
+    return None, "ok"
+
+
+def run_backup(conn, settings, check):
+    """Online copy through the sqlite3 backup API into `backup_dir`, keeping the newest `backup_keep`.
+
+    The copy is checked with quick_check and only then renamed into place.
+    """
+    os.makedirs(settings['backup_dir'], exist_ok=True)
+    target = os.path.join(settings['backup_dir'], f"identity-{datetime.now():%Y%m%d-%H%M%S}.db")
+    partial = target + '.partial'
+    dest = sqlite3.connect(partial)
+    try:
+        conn.backup(dest, pages=BACKUP_PAGES, sleep=settings['pause'], progress=lambda *_: check())
+        result = dest.execute("PRAGMA quick_check").fetchone()[0]
+        if result != 'ok':
+            raise RuntimeError(f"backup failed quick_check: {result}")
+    except BaseException:
+        dest.close()
+        os.remove(partial)
+        raise
+    dest.close()
+    os.replace(partial, target)
+    backups = sorted(glob.glob(os.path.join(settings['backup_dir'], 'identity-*.db')))
+    for old in backups[:-settings['backup_keep']] if settings['backup_keep'] else []:
+        os.remove(old)
+    return None, f"{target} ({os.path.getsize(target)} bytes)"
+
+
+# (name, default interval in seconds, job); due jobs run in this order
+JOBS = [
+    ('checkpoint', 3600, run_checkpoint),
+    ('optimize', 86400, run_optimize),
+    ('vacuum', 86400, run_vacuum),
+    ('integrity_check', 7 * 86400, run_integrity_check),
+    ('backup', 86400, run_backup),
+]
+
+# ========================
+# Runner
+# ========================
+def settings_from_config(cfg):
+    return {
+        'windows': parse_windows(cfg['MAINTENANCE_WINDOWS']),
+        'quiet_seconds': cfg['MAINTENANCE_QUIET_SECONDS'],
+        'pause': cfg['MAINTENANCE_PAUSE_MS'] / 1000,
+        'vacuum_pages': cfg['MAINTENANCE_VACUUM_PAGES'],
+        'busy_ms': cfg['MAINTENANCE_BUSY_MS'],
+        'backup_dir': cfg['MAINTENANCE_BACKUP_DIR'],
+        'backup_keep': cfg['MAINTENANCE_BACKUP_KEEP'],
+    }
+
+
+def connect(path, settings):
+    """Maintenance connection: gives up on the write lock after `busy_ms` rather than queue behind requests"""
+    return db.connect(path, dict(db.pragmas_from_env(), busy_timeout=settings['busy_ms']))
+
+
+def run_job(conn, name, settings, check=None, force=False, full=False):
+    """Claim and run one job, logging its duration and the space it reclaimed.
+
+    Returns the finished MaintenanceRuns row, or None if the job was not due.
+    """
+    interval, job = next((i, j) for n, i, j in JOBS if n == name)
+    run_id = _claim(conn, name, interval, force)
+    if run_id is None:
+        return None
+    started = time.perf_counter()
+    try:
+        if full:
+            reclaimed, detail = full_vacuum(conn)
+        else:
+            reclaimed, detail = job(conn, settings, check or (lambda: None))
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        seconds = time.perf_counter() - started
+        result = 'interrupted' if isinstance(e, Interrupted) else 'error'
+        log = logger.warning if result == 'interrupted' else logger.error
+        log("maintenance %s %s after %.2fs: %s", name, result, seconds, e)
+        _finish(conn, run_id, seconds, result, detail=str(e))
+    else:
+        seconds = time.perf_counter() - started
+        logger.info("maintenance %s finished in %.2fs, %s bytes reclaimed%s", name, seconds,
+                    reclaimed if reclaimed is not None else 'no', f": {detail}" if detail else '')
+        _finish(conn, run_id, seconds, 'ok', reclaimed, detail)
+    return conn.execute("SELECT * FROM MaintenanceRuns WHERE id = ?", (run_id,)).fetchone()
+
+
+def run_due(conn, settings, check):
+    """Run every due job in order while check() allows it; returns the finished rows"""
+    done = []
+    for name, _, _ in JOBS:
+        check()
+        row = run_job(conn, name, settings, check)
+        if row is not None:
+            done.append(row)
+    return done
+
+# ========================
+# Scheduler
+# ========================
+class MaintenanceScheduler:
+    """Background thread that runs due jobs while the window is open and the database is quiet.
+
+    Quiet means no other connection has committed for `quiet_seconds`
+    (PRAGMA data_version did not change). Every process may run one; the
+    MaintenanceRuns claim makes sure each job runs once per interval.
+    """
+
+    def __init__(self, path, settings, check_seconds=30):
+        self.path = path
+        self.settings = settings
+        self.check_seconds = check_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _check(self):
+        if self._stop.is_set() or not in_window(self.settings['windows']):
+            raise Interrupted("maintenance window closed" if not self._stop.is_set() else "scheduler stopped")
+
+    def _run(self):
+        conn = connect(self.path, self.settings)
+        try:
+            version, quiet_since = None, time.monotonic()
+            while not self._stop.wait(self.check_seconds):
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current != version:
+                    version, quiet_since = current, time.monotonic()
+                    continue
+                if time.monotonic() - quiet_since < self.settings['quiet_seconds']:
+                    continue
+                try:
+                    run_due(conn, self.settings, self._check)
+                except Interrupted:
+                    pass
+                except Exception:
+                    logger.exception("maintenance run failed")
+                version = conn.execute("PRAGMA data_version").fetchone()[0]
+        finally:
+            conn.close()
+
+
+def init_app(app):
+    """Start the background scheduler if MAINTENANCE_SCHEDULER is on (see config.py)"""
+    if not app.config['MAINTENANCE_SCHEDULER']:
+        return
+    scheduler = MaintenanceScheduler(app.config['DATABASE_PATH'], settings_from_config(app.config))
+    app.extensions['maintenance'] = scheduler
+    scheduler.start()
+
+# ========================
+# CLI
+# ========================
+def _wait_for_quiet(conn, seconds):
+    """Watch PRAGMA data_version for `seconds`; False as soon as another connection commits"""
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(min(1, seconds))
+        if conn.execute("PRAGMA data_version").fetchone()[0] != version:
+            return False
+    return True
+
+
+@click.command("maintenance")
+@click.argument("jobs", nargs=-1, type=click.Choice([name for name, _, _ in JOBS]))
+@click.option("--full", is_flag=True, help="With `vacuum`: full VACUUM that switches on incremental vacuum.")
+@click.option("--status", is_flag=True, help="Only show the last run of every job.")
+@with_appcontext
+def maintenance_command(jobs, full, status):
+    """Run database maintenance.
+
+    Without JOBS, runs every due job, but only inside MAINTENANCE_WINDOWS and
+    once no write has been committed for MAINTENANCE_QUIET_SECONDS (meant for
+    cron). Named JOBS run at once.
+    """
+    settings = settings_from_config(current_app.config)
+    conn = connect(current_app.config['DATABASE_PATH'], settings)
+    try:
+        if status:
+            for row in last_runs(conn):
+                click.echo(f"{row['job']:<16} {row['started_at']}  {row['result']:<11} "
+                           f"{row['seconds'] if row['seconds'] is not None else '-'}s  "
+                           f"reclaimed {row['reclaimed_bytes'] or 0}  {row['detail'] or ''}")
+            return
+        if full and list(jobs) != ['vacuum']:
+            raise click.UsageError("--full only applies to `vacuum`")
+        if jobs:
+            rows = [run_job(conn, name, settings, force=True, full=full) for name in jobs]
+        else:
+            if not in_window(settings['windows']):
+                click.echo("Outside MAINTENANCE_WINDOWS; nothing run")
+                return
+            if not _wait_for_quiet(conn, settings['quiet_seconds']):
+                click.echo("Database is busy; nothing run")
+                return
+
+            def check():
+                if not in_window(settings['windows']):
+                    raise Interrupted("maintenance window closed")
+            try:
+                rows = run_due(conn, settings, check)
+            except Interrupted as e:
+                click.echo(f"Stopped: {e}")
+                rows = []
+        for row in rows:
+            click.echo(f"{row['job']}: {row['result']} in {row['seconds']}s, "
+                       f"reclaimed {row['reclaimed_bytes'] or 0} bytes. {row['detail'] or ''}".rstrip())
+        if not rows:
+            click.echo("No job was due")
+    finally:
+        conn.close()
@@ -0,0 +1,201 @@
+import click
+from flask.cli import with_appcontext
+
+import audit
+import changefeed
+import dedupe
+import exporter
+import id_allocator
+import lifecycle
+import maintenance
+import outbox
+import pagination
+import profiles
+import search_index
+import stats
+import validation
+from db import get_db_connection
+
+# ========================
+# Helpers
+# ========================
+def _columns(cur, table):
+    return {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_missing_columns(cur, table, definitions):
+    """ALTER TABLE ADD COLUMN for each "name TYPE" definition the table lacks"""
+    existing = _columns(cur, table)
+    for definition in definitions:
+        if definition.split()[0] not in existing:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {definition}")
+
+# ========================
+# Migrations
+# ========================
+def _0001_baseline(cur):
+    """Schema as it stood before versioned migrations: one wide People table"""
+    cur.execute('''CREATE TABLE IF NOT EXISTS People (
+                    id TEXT PRIMARY KEY,
+                    type TEXT,
+                    first_name TEXT,
+                    last_name TEXT,
+                    dob TEXT,
+                    place_of_birth TEXT,
+                    nationality TEXT,
+                    gender TEXT,
+                    email TEXT UNIQUE,
+                    phone TEXT,
+                    status TEXT,
+                    status_changed_at TEXT
+                )''')
+    # category columns and the edit version, added over time with ALTER TABLE
+    _add_missing_columns(cur, 'People', [c for cols in profiles.PROFILE_TABLES.values() for c in cols]
+                         + ['version INTEGER NOT NULL DEFAULT 0'])
+
+    # audit table for tracking changes
+    cur.execute('''CREATE TABLE IF NOT EXISTS Audit (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    person_id TEXT,
+                    changed_at TEXT,
+                    field TEXT,
+                    old_value TEXT,
+                    new_value TEXT
+                )''')
+    audit.init_audit_indexes(cur)
+    validation.init_indexes(cur)
+    lifecycle.init_lifecycle_indexes(cur)
+    pagination.init_indexes(cur)
+    id_allocator.init_sequences(cur)
+    outbox.init_outbox(cur)
+
+
+def _0002_category_profiles(cur):
+    """Move category columns into StudentProfile/PhdProfile/FacultyProfile/StaffProfile.
+
+    People is rebuilt with only the core columns, keeping every rowid so the
+    full-text index stays valid. Profile rows are only created for identities
+    that have at least one value in that group.
+    """
+    for trigger in ('people_search_insert', 'people_search_update', 'people_search_delete'):
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cur.execute("ALTER TABLE People RENAME TO People_wide")
+    cur.execute('''CREATE TABLE People (
+                    id TEXT PRIMARY KEY,
+                    type TEXT,
+                    first_name TEXT,
+                    last_name TEXT,
+                    dob TEXT,
+                    place_of_birth TEXT,
+                    nationality TEXT,
+                    gender TEXT,
+                    email TEXT UNIQUE,
+                    phone TEXT,
+                    status TEXT,
+                    status_changed_at TEXT,
+                    version INTEGER NOT NULL DEFAULT 0
+                )''')
+    core = ', '.join(profiles.CORE_COLUMNS)
+    cur.execute(f"INSERT INTO People (rowid, {core}) SELECT rowid, {core} FROM People_wide")
+
+    profiles.init_profiles(cur)
+    for table, cols in profiles.PROFILE_FIELDS.items():
+        has_value = ', '.join(f"nullif({c}, '')" for c in cols)
+        cur.execute(f"INSERT INTO {table} (person_id, {', '.join(cols)}) SELECT id, {', '.join(cols)} "
+                    f"FROM People_wide WHERE coalesce({has_value}, NULL) IS NOT NULL")
+    cur.execute("DROP TABLE People_wide")
+
+    validation.init_indexes(cur)
+    lifecycle.init_lifecycle_indexes(cur)
+    pagination.init_indexes(cur)
+    search_index.init_search_index(cur)
+
+
+def _0003_change_tracking(cur):
+    """People.updated_at and DeletedPeople tombstones for incremental exports"""
+    _add_missing_columns(cur, 'People', ['updated_at TEXT'])
+    cur.execute(f"UPDATE People SET updated_at = {exporter.NOW_SQL} WHERE updated_at IS NULL")
+    exporter.init_change_tracking(cur)
+
+
+def _0004_match_keys(cur):
+    """Blocking keys for the fuzzy duplicate matcher, computed for every identity"""
+    dedupe.init_match_keys(cur)
+    dedupe.rebuild_keys(cur)
+
+
+def _0005_stats_counters(cur):
+    """Trigger-maintained head counts for the /stats dashboard"""
+    stats.init_stats(cur)
+    stats.rebuild_stats(cur)
+
+
+def _0006_change_log(cur):
+    """ChangeLog behind the /changes feed, starting with a create entry per existing identity"""
+    changefeed.init_change_log(cur)
+    changefeed.backfill(cur)
+
+
+def _0007_maintenance_runs(cur):
+    """MaintenanceRuns, the run log of `flask maintenance` and the background scheduler"""
+    maintenance.init_maintenance(cur)
+
+
+# (user_version, name, step); append only, never edit a released step
+MIGRATIONS = [
+    (1, 'baseline', _0001_baseline),
+    (2, 'category profiles', _0002_category_profiles),
+    (3, 'change tracking', _0003_change_tracking),
+    (4, 'match keys', _0004_match_keys),
+    (5, 'stats counters', _0005_stats_counters),
+    (6, 'change log', _0006_change_log),
+    (7, 'maintenance runs', _0007_maintenance_runs),
+]
+
+# ========================
+# Runner
+# ========================
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations in order, each in its own transaction.
+
+    The schema version lives in PRAGMA user_version and is re-read under the
+    write lock, so several processes starting at once apply each step once.
+    Returns the (version, name) pairs applied.
+    """
+    applied = []
+    for version, name, step in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, name))
+    return applied
+
+# ========================
+# CLI
+# ========================
+@click.command("migrate")
+@click.option("--status", is_flag=True, help="Only show the current and latest schema version.")
+@with_appcontext
+def migrate_command(status):
+    """Bring the database schema up to date."""
+    conn = get_db_connection()
+    if status:
+        click.echo(f"Schema version {current_version(conn)} (latest {MIGRATIONS[-1][0]})")
+        return
+    applied = migrate(conn)
+    for version, name in applied:
+        click.echo(f"Applied {version:04d} {name}")
+    if not applied:
+        click.echo(f"Schema is up to date (version {current_version(conn)})")
@@ -0,0 +1,410 @@
+import logging
+import smtplib
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+import click
+from flask.cli import with_appcontext
+
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# ========================
+# Outbox Table
+# ========================
+def init_outbox(cur):
+    """Create the durable outbox table used to queue outgoing emails"""
+    cur.execute('''CREATE TABLE IF NOT EXISTS Outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipient TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    next_attempt_at TEXT NOT NULL,
+                    claimed_at TEXT,
+                    sent_at TEXT,
+                    last_error TEXT
+                )''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status_due ON Outbox(status, next_attempt_at)")
+
+
+def enqueue(conn, recipient, subject, body):
+    """Queue an email on the caller's connection; it is sent once the caller commits"""
+    now = datetime.now().isoformat()
+    cur = conn.execute(
+        "INSERT INTO Outbox (recipient,subject,body,status,created_at,next_attempt_at) VALUES (?,?,?,'queued',?,?)",
+        (recipient, subject, body, now, now))
+    return cur.lastrowid
+
+
+@instrumentation.timed('mail')
+def send_confirmation(conn, address, uid):
+    """Queue the confirmation email in the caller's transaction"""
+    enqueue(conn, address, 'Identity Created', f"""Hello,
+
+Your university identity has been successfully created.
+
+Your ID: {uid}
+
+If you did not request this identity, please contact administration.
+
+University Identity Management System
+""")
+
+
+def queue_depth(conn):
+    """Return the number of outbox rows per status"""
+    rows = conn.execute("SELECT status, COUNT(*) FROM Outbox GROUP BY status").fetchall()
+    return {status: count for status, count in rows}
+
+# ========================
+# Fake SMTP Sink
+# ========================
+class FakeSMTP:
+    """In-memory stand-in for smtplib.SMTP_SSL so the outbox can run offline.
+
+    Every message sent through any session lands in FakeSMTP.messages.
+    Set FakeSMTP.fail_next to make the next N sends raise, to exercise retries.
+    """
+    messages = []
+    fail_next = 0
+    _lock = threading.Lock()
+
+    def __init__(self, host=None, port=None, timeout=None):
+        self.host = host
+        self.port = port
+        self.closed = False
+
+    def login(self, user, password):
+        return (235, b'Authentication successful')
+
+    def noop(self):
+        if self.closed:
+            raise smtplib.SMTPServerDisconnected("session closed")
+        return (250, b'OK')
+
+    def send_message(self, msg):
+        with FakeSMTP._lock:
+            if FakeSMTP.fail_next > 0:
+                FakeSMTP.fail_next -= 1
+                raise smtplib.SMTPServerDisconnected("fake failure")
+            FakeSMTP.messages.append(msg)
+        return {}
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.messages = []
+            cls.fail_next = 0
+
+
+def smtp_factory(backend, host, port, timeout=30):
+    """Return a callable opening a new SMTP session for the configured backend"""
+    if backend == 'fake':
+        return lambda: FakeSMTP(host, port, timeout)
+    if backend == 'ssl':
+        return lambda: smtplib.SMTP_SSL(host, port, timeout=timeout)
+    raise ValueError(f"Unknown SMTP backend: {backend}")
+
+# ========================
+# SMTP Session Pool
+# ========================
+class SMTPPool:
+    """Keeps logged-in SMTP sessions alive and hands them out for reuse"""
+
+    def __init__(self, factory, user=None, password=None, size=2, idle_timeout=60):
+        self._factory = factory
+        self._user = user
+        self._password = password
+        self._idle_timeout = idle_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self.connects = 0
+        self.reuses = 0
+
+    def acquire(self):
+        self._slots.acquire()
+        while True:
+            with self._lock:
+                item = self._idle.pop() if self._idle else None
+            if item is None:
+                break
+            session, last_used = item
+            if time.monotonic() - last_used <= self._idle_timeout:
+                try:
+                    if session.noop()[0] == 250:
+                        self.reuses += 1
+                        return session
+                except (smtplib.SMTPException, OSError):
+                    pass
+            self._discard(session)
+        try:
+            session = self._factory()
+            if self._user:
+                session.login(self._user, self._password)
+        except Exception:
+            self._slots.release()
+            raise
+        self.connects += 1
+        return session
+
+    def release(self, session, broken=False):
+        if broken:
+            self._discard(session)
+        else:
+            with self._lock:
+                self._idle.append((session, time.monotonic()))
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session, _ in idle:
+            self._discard(session)
+
+    @staticmethod
+    def _discard(session):
+        try:
+            session.quit()
+        except Exception:
+            pass
+
+# ========================
+# Send Metrics
+# ========================
+class OutboxMetrics:
+    """Counters and recent latency samples for the outbox workers"""
+
+    def __init__(self, window=1024):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._send_ms = deque(maxlen=window)
+        self._queued_ms = deque(maxlen=window)
+
+    def record_sent(self, send_ms, queued_ms):
+        with self._lock:
+            self.sent += 1
+            self._send_ms.append(send_ms)
+            self._queued_ms.append(queued_ms)
+
+    def record_failure(self, final):
+        with self._lock:
+            if final:
+                self.failed += 1
+            else:
+                self.retried += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'sent': self.sent,
+                'retried': self.retried,
+                'failed': self.failed,
+                'send_latency_ms': _summary(self._send_ms),
+                'queue_latency_ms': _summary(self._queued_ms),
+            }
+
+
+def _summary(samples):
+    if not samples:
+        return {'p50': None, 'p95': None, 'max': None}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'max': round(ordered[-1], 2)}
+
+# ========================
+# Background Workers
+# ========================
+# messages ready to send: queued and due, or claimed by a worker whose lease ran out
+_DUE = "(status='queued' AND next_attempt_at <= ?) OR (status='sending' AND claimed_at < ?)"
+
+
+class OutboxWorkerPool:
+    """Background threads that drain the outbox in batches with retry/backoff"""
+
+    def __init__(self, connect, smtp_pool, sender, workers=2, batch_size=20, max_attempts=5,
+                 backoff_seconds=30, poll_interval=5, lease_seconds=300):
+        self._connect = connect
+        self.smtp_pool = smtp_pool
+        self.sender = sender
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.metrics = OutboxMetrics()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads (no-op if already running)"""
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for n in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"outbox-worker-{n}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout=10):
+        with self._start_lock:
+            self._stopping.set()
+            self._wakeup.set()
+            for t in self._threads:
+                t.join(timeout)
+            self._threads = []
+        self.smtp_pool.close()
+
+    def notify(self):
+        """Wake idle workers after new mail was committed"""
+        self._wakeup.set()
+
+    def stats(self, conn):
+        data = self.metrics.snapshot()
+        data['queue_depth'] = queue_depth(conn)
+        data['workers'] = len(self._threads)
+        data['smtp_connects'] = self.smtp_pool.connects
+        data['smtp_reuses'] = self.smtp_pool.reuses
+        return data
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    processed = self.process_batch(conn)
+                except Exception:
+                    logger.exception("Outbox worker iteration failed")
+                    processed = 0
+                if not processed:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+        finally:
+            conn.close()
+
+    def process_batch(self, conn):
+        """Claim and send one batch; returns the number of messages processed"""
+        batch = self._claim(conn)
+        if not batch:
+            return 0
+        results = []
+        session = None
+        try:
+            for row in batch:
+                if session is None:
+                    try:
+                        session = self.smtp_pool.acquire()
+                    except Exception as e:
+                        results.append((row, None, e))
+                        continue
+                started = time.perf_counter()
+                try:
+                    session.send_message(self._build_message(row))
+                except Exception as e:
+                    results.append((row, None, e))
+                    if isinstance(e, (smtplib.SMTPServerDisconnected, OSError)):
+                        self.smtp_pool.release(session, broken=True)
+                        session = None
+                    continue
+                results.append((row, (time.perf_counter() - started) * 1000, None))
+        finally:
+            if session is not None:
+                self.smtp_pool.release(session)
+        self._record(conn, results)
+        return len(batch)
+
+    def _claim(self, conn):
+        now = datetime.now()
+        lease_expired = (now - timedelta(seconds=self.lease_seconds)).isoformat()
+        # idle polls only read, so they never take the write lock away from the app
+        if not conn.execute(f"SELECT 1 FROM Outbox WHERE {_DUE} LIMIT 1", (now.isoformat(), lease_expired)).fetchone():
+            return []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"""SELECT id, recipient, subject, body, attempts, created_at FROM Outbox
+                    WHERE {_DUE} ORDER BY next_attempt_at LIMIT ?""",
+                (now.isoformat(), lease_expired, self.batch_size)).fetchall()
+            conn.executemany("UPDATE Outbox SET status='sending', claimed_at=? WHERE id=?",
+                             [(now.isoformat(), row[0]) for row in rows])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return rows
+
+    def _build_message(self, row):
+        msg = EmailMessage()
+        msg['Subject'] = row[2]
+        msg['From'] = self.sender
+        msg['To'] = row[1]
+        msg.set_content(row[3])
+        return msg
+
+    def _record(self, conn, results):
+        now = datetime.now()
+        sent, retry, failed = [], [], []
+        for row, send_ms, error in results:
+            msg_id, recipient, attempts = row[0], row[1], row[4] + 1
+            if error is None:
+                queued_ms = (now - datetime.fromisoformat(row[5])).total_seconds() * 1000
+                self.metrics.record_sent(send_ms, queued_ms)
+                sent.append((now.isoformat(), attempts, msg_id))
+                logger.info("Email sent to %s", recipient)
+            elif attempts >= self.max_attempts:
+                self.metrics.record_failure(final=True)
+                failed.append((attempts, str(error), msg_id))
+                logger.error("Email sending failed to %s after %d attempts: %s", recipient, attempts, error)
+            else:
+                self.metrics.record_failure(final=False)
+                delay = self.backoff_seconds * 2 ** (attempts - 1)
+                retry.append((attempts, str(error), (now + timedelta(seconds=delay)).isoformat(), msg_id))
+                logger.warning("Email sending failed to %s (attempt %d), retrying in %ss: %s",
+                               recipient, attempts, delay, error)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("UPDATE Outbox SET status='sent', sent_at=?, attempts=?, last_error=NULL WHERE id=?", sent)
+            conn.executemany("UPDATE Outbox SET status='queued', attempts=?, last_error=?, next_attempt_at=? WHERE id=?", retry)
+            conn.executemany("UPDATE Outbox SET status='failed', attempts=?, last_error=? WHERE id=?", failed)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+# ========================
+# CLI
+# ========================
+@click.command("outbox-worker")
+@with_appcontext
+def outbox_worker_command():
+    """Run the outbox workers in the foreground until interrupted."""
+    from flask import current_app
+    workers = current_app.extensions['outbox']
+    workers.start()
+    click.echo(f"Outbox workers running ({workers.workers} threads), Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        workers.stop()
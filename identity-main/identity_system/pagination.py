@@ -0,0 +1,116 @@
+import base64
+import binascii
+import json
+
+import profiles
+
+# sortable columns -> SQL sort expression; NULLs sort as '' so every key is comparable
+SORT_COLUMNS = {
+    'id': 'id',
+    'type': "ifnull(type,'')",
+    'first_name': "ifnull(first_name,'')",
+    'last_name': "ifnull(last_name,'')",
+    'status': "ifnull(status,'')",
+}
+
+# only what the listing template displays
+LIST_COLUMNS = ['id', 'type', 'first_name', 'last_name', 'status']
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+# JSON values a cursor may carry; anything else would reach SQLite as an unsupported parameter
+CURSOR_TYPES = (str, int, float, type(None))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+# ========================
+# Sort Indexes
+# ========================
+def init_indexes(cur):
+    """One (sort expression, id) index per sortable column for keyset scans"""
+    for col, expr in SORT_COLUMNS.items():
+        if col != 'id':
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_people_sort_{col} ON People({expr}, id)")
+
+# ========================
+# Cursors
+# ========================
+def encode_cursor(sort_value, uid):
+    raw = json.dumps([sort_value, uid], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_value, uid = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor("Invalid page cursor")
+    if not all(isinstance(v, CURSOR_TYPES) and not isinstance(v, bool) for v in (sort_value, uid)):
+        raise InvalidCursor("Invalid page cursor")
+    return sort_value, uid
+
+
+def clamp_page_size(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+# ========================
+# Keyset Queries
+# ========================
+def keyset_query(sort='id', direction='asc', cursor=None, columns=None, limit=None):
+    """Build (sql, params) listing People after `cursor` in (sort, id) order"""
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort by {sort}")
+    expr = SORT_COLUMNS[sort]
+    desc = direction == 'desc'
+    columns = columns or LIST_COLUMNS
+    # column names are unique across People and the profile tables, so no qualifying is needed
+    sql = f"SELECT {', '.join(columns)}, {expr} AS _sort_key FROM People{profiles.joins(columns)}"
+    params = []
+    if cursor:
+        sort_value, uid = decode_cursor(cursor)
+        op = '<' if desc else '>'
+        if sort == 'id':
+            sql += f" WHERE id {op} ?"
+            params.append(uid)
+        else:
+            # the leading range term lets SQLite seek into the (expr, id) index
+            sql += f" WHERE {expr} {op}= ? AND ({expr} {op} ? OR id {op} ?)"
+            params.extend([sort_value, sort_value, uid])
+    order = 'DESC' if desc else 'ASC'
+    sql += f" ORDER BY {expr} {order}" if sort == 'id' else f" ORDER BY {expr} {order}, id {order}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def fetch_page(conn, sort='id', direction='asc', cursor=None, page_size=DEFAULT_PAGE_SIZE, columns=None):
+    """Return (rows, next_cursor) for one page; next_cursor is None on the last page"""
+    sql, params = keyset_query(sort, direction, cursor, columns, page_size + 1)
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(last['_sort_key'], last['id'])
+    return rows, next_cursor
+
+
+def iter_rows(conn, sort='id', direction='asc', columns=None, chunk_size=500):
+    """Yield every row in sort order, fetching `chunk_size` rows at a time"""
+    sql, params = keyset_query(sort, direction, None, columns)
+    cur = conn.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from rows
@@ -0,0 +1,118 @@
+# columns kept on the narrow People row, read by listing, search and every hot path
+CORE_COLUMNS = ['id', 'type', 'first_name', 'last_name', 'dob', 'place_of_birth', 'nationality', 'gender',
+                'email', 'phone', 'status', 'status_changed_at', 'version']
+
+# category-specific columns, one extension table per group, keyed by person_id.
+# Column names are unique across People and all profile tables.
+PROFILE_TABLES = {
+    'StudentProfile': ['national_id TEXT', 'diploma_type TEXT', 'diploma_year INTEGER', 'major TEXT',
+                       'entry_year INTEGER', 'student_status TEXT'],
+    'PhdProfile': ['phd_institution TEXT', 'research_areas TEXT'],
+    'FacultyProfile': ['faculty_rank TEXT', 'appointment_start TEXT', 'primary_department TEXT',
+                       'secondary_departments TEXT', 'office_location TEXT', 'contract_type TEXT',
+                       'contract_start TEXT', 'contract_end TEXT', 'teaching_hours INTEGER'],
+    'StaffProfile': ['staff_department TEXT', 'job_title TEXT', 'grade TEXT', 'staff_entry_date TEXT'],
+}
+
+PROFILE_FIELDS = {table: [c.split()[0] for c in cols] for table, cols in PROFILE_TABLES.items()}
+# profile column -> table holding it
+COLUMN_TABLES = {col: table for table, cols in PROFILE_FIELDS.items() for col in cols}
+ALL_COLUMNS = CORE_COLUMNS + list(COLUMN_TABLES)
+
+# ========================
+# Tables
+# ========================
+def init_profiles(cur):
+    """Create the extension tables, their lookup indexes and the delete cascade.
+
+    The cascade is a trigger rather than a foreign key so it works without
+    PRAGMA foreign_keys and survives People being rebuilt by a migration.
+    """
+    for table, cols in PROFILE_TABLES.items():
+        cur.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+                        person_id TEXT PRIMARY KEY,
+                        {', '.join(cols)}
+                    ) WITHOUT ROWID""")
+    # department filters and batch renames
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_faculty_department ON FacultyProfile(primary_department)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_staff_department ON StaffProfile(staff_department)")
+    deletes = ' '.join(f"DELETE FROM {t} WHERE person_id = OLD.id;" for t in PROFILE_TABLES)
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS people_profiles_delete AFTER DELETE ON People BEGIN {deletes} END")
+
+# ========================
+# Query Helpers
+# ========================
+def tables_for(columns):
+    """Profile tables needed to read `columns`, in PROFILE_TABLES order"""
+    needed = {COLUMN_TABLES[c] for c in columns if c in COLUMN_TABLES}
+    return [t for t in PROFILE_TABLES if t in needed]
+
+
+def joins(columns, alias='People'):
+    """LEFT JOIN clauses bringing the profile tables for `columns` onto People (as `alias`)"""
+    return ''.join(f" LEFT JOIN {t} ON {t}.person_id = {alias}.id" for t in tables_for(columns))
+
+
+def qualified(column, alias='People'):
+    """Column reference that stays unambiguous next to other tables (e.g. PeopleSearch)"""
+    return f"{COLUMN_TABLES.get(column, alias)}.{column}"
+
+
+def load_person(conn, uid):
+    """Core row plus every profile column for uid, as one dict (None if missing)"""
+    row = conn.execute(f"SELECT {', '.join(qualified(c, 'p') for c in ALL_COLUMNS)} FROM People p"
+                       f"{joins(COLUMN_TABLES, 'p')} WHERE p.id=?", (uid,)).fetchone()
+    return dict(row) if row else None
+
+# ========================
+# Writes
+# ========================
+def _upsert_sql(table, cols):
+    updates = ', '.join(f"{c}=excluded.{c}" for c in cols)
+    return (f"INSERT INTO {table} (person_id, {', '.join(cols)}) VALUES ({', '.join('?' * (len(cols) + 1))}) "
+            f"ON CONFLICT(person_id) DO UPDATE SET {updates}")
+
+
+def _is_empty(value):
+    return value is None or value == ''
+
+
+def save_profiles(conn, uid, values, new=False):
+    """Write the profile columns present in `values` for one identity.
+
+    A profile row is only created once one of its columns holds a value;
+    blanking the columns of an existing row updates it in place.
+    """
+    save_many(conn, [(uid, values)], new)
+
+
+def save_many(conn, records, new=False):
+    """save_profiles for many (uid, values) pairs with one executemany per table and column set.
+
+    With new=True the identities were just inserted, so all-blank groups are skipped outright.
+    """
+    for table, fields in PROFILE_FIELDS.items():
+        upserts = {}
+        for uid, values in records:
+            present = tuple(c for c in fields if c in values)
+            if not present:
+                continue
+            if all(_is_empty(values[c]) for c in present):
+                if new:
+                    continue
+                conn.execute(f"UPDATE {table} SET {', '.join(f'{c}=?' for c in present)} WHERE person_id=?",
+                             [values[c] for c in present] + [uid])
+            else:
+                upserts.setdefault(present, []).append([uid] + [values[c] for c in present])
+        for cols, params in upserts.items():
+            conn.executemany(_upsert_sql(table, cols), params)
+
+
+def set_for_ids(conn, values, ids_json):
+    """Set the same profile values on every id in a JSON array (used by batch edits)"""
+    for table in tables_for(values):
+        cols = [c for c in PROFILE_FIELDS[table] if c in values]
+        conn.execute(f"INSERT INTO {table} (person_id, {', '.join(cols)}) "
+                     f"SELECT value, {', '.join('?' * len(cols))} FROM json_each(?) WHERE true "
+                     f"ON CONFLICT(person_id) DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in cols)}",
+                     [values[c] for c in cols] + [ids_json])
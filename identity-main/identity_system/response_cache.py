@@ -0,0 +1,269 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import Response, current_app, g, request
+
+import changefeed
+from db import get_db_connection
+
+# HTML pages whose GET responses are cached; each depends only on its URL and the identity data
+CACHED_ENDPOINTS = {'views.index', 'views.view_all', 'views.view', 'views.search'}
+
+# of those, pages that show no identity data at all: cached without reading the data version
+STATIC_ENDPOINTS = {'views.index'}
+
+# bodies worth compressing
+COMPRESSIBLE = {'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript', 'application/json'}
+
+# ========================
+# Data Version
+# ========================
+def data_version(conn):
+    """(version, modified) of the identity data: the newest ChangeLog seq and its UTC timestamp.
+
+    Every create, audited edit and delete appends to ChangeLog, so a
+    rendered page stays valid exactly as long as this does not change.
+    `modified` is None once the log has been pruned empty.
+    """
+    seq, changed_at = conn.execute("SELECT max(seq), changed_at FROM ChangeLog").fetchone()
+    if seq is None:
+        return changefeed.latest(conn), None
+    return seq, datetime.fromisoformat(changed_at.replace('Z', '+00:00'))
+
+# ========================
+# Compression
+# ========================
+def load_brotli():
+    """The brotli module if it is installed (pip install brotli), else None"""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class Compressor:
+    """gzip, and brotli when available, for bodies of at least `min_size` bytes"""
+
+    def __init__(self, min_size=1024, level=6, brotli=None):
+        self.min_size = min_size
+        self.level = level
+        self.brotli = brotli
+
+    def choose(self, accept_encodings):
+        """Content-Encoding to use for this request, or None"""
+        if self.brotli is not None and accept_encodings['br']:
+            return 'br'
+        if accept_encodings['gzip']:
+            return 'gzip'
+        return None
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            # quality 5 compresses HTML about as well as gzip -9 at gzip -6 speed
+            return self.brotli.compress(data, quality=5)
+        # mtime=0 keeps the output identical for identical input
+        return gzip.compress(data, self.level, mtime=0)
+
+    def wanted(self, response):
+        return (response.status_code == 200 and not response.is_streamed and not response.direct_passthrough
+                and response.mimetype in COMPRESSIBLE and 'Content-Encoding' not in response.headers
+                and response.content_length is not None and response.content_length >= self.min_size)
+
+# ========================
+# Cache
+# ========================
+class CachedPage:
+    __slots__ = ('body', 'mimetype', 'etag', 'modified', 'encoded')
+
+    def __init__(self, body, mimetype, etag, modified):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.modified = modified
+        self.encoded = {}  # Content-Encoding -> compressed body, filled on first request for it
+
+    def size(self):
+        return len(self.body) + sum(len(b) for b in self.encoded.values())
+
+
+class ResponseCache:
+    """In-process LRU of rendered pages, bounded by total bytes and keyed on the data version.
+
+    Entries of an older version can never be hit again, so the whole cache
+    is dropped as soon as a newer version is seen. Static pages are stored
+    with version None and are only dropped along with everything else.
+    """
+
+    def __init__(self, compressor=None, max_bytes=64 * 1024 * 1024):
+        self.compressor = compressor
+        self.max_bytes = max_bytes
+        self._pages = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.bytes_rendered = 0
+        self.bytes_sent = 0
+
+    def _see(self, version):
+        if version is None or (self._version is not None and version <= self._version):
+            return
+        if self._version is not None:
+            self._pages.clear()
+            self._bytes = 0
+        self._version = version
+
+    def get(self, key, version):
+        with self._lock:
+            self._see(version)
+            page = self._pages.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key, version, page):
+        with self._lock:
+            self._see(version)
+            if version not in (None, self._version) or page.size() > self.max_bytes:
+                return
+            old = self._pages.pop(key, None)
+            self._bytes += page.size() - (old.size() if old else 0)
+            self._pages[key] = page
+            self._evict()
+
+    def encoded(self, key, page, encoding):
+        """page.body compressed with `encoding`, compressed once and then kept with the page"""
+        data = page.encoded.get(encoding)
+        if data is None:
+            data = self.compressor.compress(page.body, encoding)
+            with self._lock:
+                if encoding not in page.encoded:
+                    page.encoded[encoding] = data
+                    if self._pages.get(key) is page:
+                        self._bytes += len(data)
+                        self._evict()
+        return data
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._pages:
+            _, page = self._pages.popitem(last=False)
+            self._bytes -= page.size()
+            self.evictions += 1
+
+    def count_sent(self, rendered, sent, not_modified=False):
+        with self._lock:
+            self.bytes_rendered += rendered
+            self.bytes_sent += sent
+            self.not_modified += not_modified
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._pages), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'version': self._version, 'hits': self.hits, 'misses': self.misses,
+                    'not_modified': self.not_modified, 'evictions': self.evictions,
+                    'bytes_rendered': self.bytes_rendered, 'bytes_sent': self.bytes_sent,
+                    'compression': self.compressor is not None,
+                    'brotli': self.compressor is not None and self.compressor.brotli is not None}
+
+# ========================
+# Request Hooks
+# ========================
+def _key():
+    return (request.endpoint, tuple(sorted((request.view_args or {}).items())),
+            tuple(sorted(request.args.items(multi=True))))
+
+
+def _encoding(compressor, size):
+    if compressor is None or size < compressor.min_size:
+        return None
+    return compressor.choose(request.accept_encodings)
+
+
+def _not_modified(page):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(page.etag)
+    since = request.if_modified_since
+    return since is not None and page.modified is not None and page.modified.replace(microsecond=0) <= since
+
+
+def _finish(response, key, page, encoding, cache):
+    """Validators, Vary and (when negotiated) the compressed body; a bare 304 if the client's copy is current"""
+    if _not_modified(page):
+        response = Response(status=304)
+    elif encoding:
+        response.set_data(cache.encoded(key, page, encoding))
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(page.etag, weak=True)
+    if page.modified is not None:
+        response.last_modified = page.modified
+    response.vary.add('Accept-Encoding')
+    cache.count_sent(len(page.body), response.content_length or 0, response.status_code == 304)
+    return response
+
+
+def _serve_cached():
+    """before_request: answer a cached page without running the view"""
+    if request.method not in ('GET', 'HEAD') or request.endpoint not in CACHED_ENDPOINTS:
+        return None
+    cache = current_app.extensions['response_cache']
+    if request.endpoint in STATIC_ENDPOINTS:
+        version, modified = None, None
+    else:
+        version, modified = data_version(get_db_connection())
+    key = _key()
+    page = cache.get(key, version)
+    if page is None:
+        g.response_cache = (key, version, modified)
+        return None
+    encoding = _encoding(cache.compressor, len(page.body)) if page.mimetype in COMPRESSIBLE else None
+    return _finish(Response(page.body, mimetype=page.mimetype), key, page, encoding, cache)
+
+
+def _store_or_compress(response):
+    """after_request: keep freshly rendered cacheable pages, and compress any large text body"""
+    cache = current_app.extensions.get('response_cache')
+    compressor = current_app.extensions.get('compressor')
+    pending = g.pop('response_cache', None)
+    if pending and response.status_code == 200 and not response.is_streamed \
+            and 'Set-Cookie' not in response.headers:
+        key, version, modified = pending
+        body = response.get_data()
+        page = CachedPage(body, response.mimetype, hashlib.sha1(body).hexdigest(), modified)
+        cache.put(key, version, page)
+        encoding = _encoding(compressor, len(body)) if response.mimetype in COMPRESSIBLE else None
+        return _finish(response, key, page, encoding, cache)
+    if compressor and compressor.wanted(response):
+        encoding = compressor.choose(request.accept_encodings)
+        if encoding:
+            etag, weak = response.get_etag()
+            response.set_data(compressor.compress(response.get_data(), encoding))
+            response.headers['Content-Encoding'] = encoding
+            if etag and not weak:
+                # the ETag was computed on the uncompressed body
+                response.set_etag(etag, weak=True)
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    """Cache rendered pages if RESPONSE_CACHE is on and compress responses if COMPRESSION is on (see config.py)"""
+    cfg = app.config
+    compressor = None
+    if cfg['COMPRESSION']:
+        compressor = Compressor(cfg['COMPRESS_MIN_BYTES'], cfg['COMPRESS_LEVEL'], load_brotli())
+        app.extensions['compressor'] = compressor
+    if cfg['RESPONSE_CACHE']:
+        app.extensions['response_cache'] = ResponseCache(compressor, cfg['RESPONSE_CACHE_MAX_MB'] * 1024 * 1024)
+        app.before_request(_serve_cached)
+    if compressor or cfg['RESPONSE_CACHE']:
+        app.after_request(_store_or_compress)
@@ -0,0 +1,176 @@
+import re
+
+import click
+from flask.cli import with_appcontext
+
+import profiles
+from db import get_db_connection
+
+# columns indexed for full-text search; departments merges faculty and staff departments
+INDEXED_COLUMNS = ['first_name', 'last_name', 'email', 'departments', 'major', 'research_areas']
+# bm25 weights, same order as INDEXED_COLUMNS: name hits rank above department hits
+COLUMN_WEIGHTS = (10.0, 10.0, 5.0, 2.0, 1.0, 1.0)
+
+# columns the search results template displays
+RESULT_COLUMNS = ['id', 'type', 'first_name', 'last_name', 'email', 'phone', 'status', 'entry_year',
+                  'national_id', 'faculty_rank', 'primary_department', 'staff_department', 'job_title']
+
+# profile columns feeding the index, per extension table
+PROFILE_SOURCES = {
+    'StudentProfile': ['major'],
+    'PhdProfile': ['research_areas'],
+    'FacultyProfile': ['primary_department', 'secondary_departments'],
+    'StaffProfile': ['staff_department'],
+}
+
+# one index document per identity, shared by the triggers and the rebuild
+_DOC_SELECT = """SELECT p.rowid, p.first_name, p.last_name, p.email,
+    trim(ifnull(f.primary_department,'') || ' ' || ifnull(f.secondary_departments,'') || ' ' || ifnull(s.staff_department,'')),
+    st.major, ph.research_areas
+    FROM People p
+    LEFT JOIN FacultyProfile f ON f.person_id = p.id
+    LEFT JOIN StaffProfile s ON s.person_id = p.id
+    LEFT JOIN StudentProfile st ON st.person_id = p.id
+    LEFT JOIN PhdProfile ph ON ph.person_id = p.id"""
+
+
+def _refresh(key):
+    """Trigger body re-indexing the identity whose id is `key`"""
+    cols = ', '.join(INDEXED_COLUMNS)
+    return f"""DELETE FROM PeopleSearch WHERE rowid = (SELECT rowid FROM People WHERE id = {key});
+               INSERT INTO PeopleSearch(rowid, {cols}) {_DOC_SELECT} WHERE p.id = {key};"""
+
+# ========================
+# Index Table & Triggers
+# ========================
+def init_search_index(cur):
+    """Create the FTS5 table and the triggers that keep it in sync.
+
+    The FTS rowid is the People rowid. Triggers on People and on the profile
+    tables re-index an identity inside the transaction that changed it, so
+    create/edit/delete and bulk imports never leave the index stale.
+    """
+    existed = cur.execute("SELECT 1 FROM sqlite_master WHERE name='PeopleSearch'").fetchone()
+    cur.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS PeopleSearch USING fts5(
+                    {', '.join(INDEXED_COLUMNS)},
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3'
+                )""")
+    cols = ', '.join(INDEXED_COLUMNS)
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS people_search_insert AFTER INSERT ON People BEGIN
+                    INSERT INTO PeopleSearch(rowid, {cols}) {_DOC_SELECT} WHERE p.id = NEW.id;
+                END""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS people_search_update
+                AFTER UPDATE OF first_name, last_name, email ON People BEGIN
+                    {_refresh('NEW.id')}
+                END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS people_search_delete AFTER DELETE ON People BEGIN
+                    DELETE FROM PeopleSearch WHERE rowid = OLD.rowid;
+                END""")
+    for table, sources in PROFILE_SOURCES.items():
+        name = table.lower()
+        cur.execute(f"""CREATE TRIGGER IF NOT EXISTS {name}_search_insert AFTER INSERT ON {table} BEGIN
+                        {_refresh('NEW.person_id')}
+                    END""")
+        cur.execute(f"""CREATE TRIGGER IF NOT EXISTS {name}_search_update
+                    AFTER UPDATE OF {', '.join(sources)} ON {table} BEGIN
+                        {_refresh('NEW.person_id')}
+                    END""")
+        cur.execute(f"""CREATE TRIGGER IF NOT EXISTS {name}_search_delete AFTER DELETE ON {table} BEGIN
+                        {_refresh('OLD.person_id')}
+                    END""")
+    if not existed:
+        rebuild_search_index(cur)
+
+
+def rebuild_search_index(cur):
+    """Repopulate the index from People (needed after VACUUM renumbers rowids)"""
+    cols = ', '.join(INDEXED_COLUMNS)
+    cur.execute("DELETE FROM PeopleSearch")
+    cur.execute(f"INSERT INTO PeopleSearch(rowid, {cols}) {_DOC_SELECT}")
+    cur.execute("INSERT INTO PeopleSearch(PeopleSearch) VALUES('optimize')")
+
+# ========================
+# Queries
+# ========================
+def match_expression(text, column=None):
+    """Turn free text into an FTS5 query: every word must match as a prefix"""
+    words = re.findall(r'\w+', text or '')
+    if column:
+        return ' AND '.join(f'{column} : "{w}"*' for w in words)
+    return ' AND '.join(f'"{w}"*' for w in words)
+
+
+def search_filter(query='', type_filter='', status_filter='', year_filter='', department_filter=''):
+    """Return (source, where, params, ranked) for the /search filters, with People aliased as p.
+
+    Text and department terms go through PeopleSearch (ranked is True and bm25
+    can be selected); filters without any text run directly against People.
+    """
+    terms = [t for t in (match_expression(query), match_expression(department_filter, 'departments')) if t]
+    params = []
+    if terms:
+        source = " FROM PeopleSearch JOIN People p ON p.rowid = PeopleSearch.rowid"
+        where = " WHERE PeopleSearch MATCH ?"
+        params.append(' AND '.join(terms))
+    else:
+        source = " FROM People p"
+        where = " WHERE 1=1"
+
+    if type_filter:
+        where += " AND p.type=?"
+        params.append(type_filter)
+    if status_filter:
+        where += " AND p.status=?"
+        params.append(status_filter)
+    if year_filter:
+        where += (" AND EXISTS(SELECT 1 FROM StudentProfile y WHERE y.person_id = p.id"
+                  " AND (y.entry_year=? OR y.diploma_year=?))")
+        params.extend([year_filter] * 2)
+    return source, where, params, bool(terms)
+
+
+def search_people(conn, query='', type_filter='', status_filter='', year_filter='', department_filter='',
+                  page=1, page_size=20, columns=None):
+    """Return (rows, total) for one page of search results, best bm25 match first"""
+    columns = columns or RESULT_COLUMNS
+    source, where, params, ranked = search_filter(query, type_filter, status_filter, year_filter,
+                                                  department_filter)
+    select = f"SELECT {', '.join(profiles.qualified(c, 'p') for c in columns)}"
+    if ranked:
+        weights = ', '.join(str(w) for w in COLUMN_WEIGHTS)
+        select += f", bm25(PeopleSearch, {weights}) AS score"
+        order = " ORDER BY score, p.id"
+    else:
+        order = " ORDER BY p.first_name, p.last_name, p.id"
+
+    total = conn.execute("SELECT COUNT(*)" + source + where, params).fetchone()[0]
+    # profile columns are only joined for the rows on this page
+    rows = conn.execute(select + source + profiles.joins(columns, 'p') + where + order + " LIMIT ? OFFSET ?",
+                        params + [page_size, (max(page, 1) - 1) * page_size]).fetchall()
+    return rows, total
+
+
+def typeahead(conn, text, limit=10):
+    """Return (id, first_name, last_name) rows whose names start with the typed words"""
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return []
+    names = ' AND '.join(f'{{first_name last_name}} : "{w}"*' for w in words)
+    return conn.execute(
+        """SELECT p.id, p.first_name, p.last_name FROM PeopleSearch
+           JOIN People p ON p.rowid = PeopleSearch.rowid
+           WHERE PeopleSearch MATCH ? ORDER BY rank LIMIT ?""", (names, limit)).fetchall()
+
+# ========================
+# CLI
+# ========================
+@click.command("rebuild-search-index")
+@with_appcontext
+def rebuild_search_index_command():
+    """Rebuild the full-text search index from People."""
+    conn = get_db_connection()
+    rebuild_search_index(conn.cursor())
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM PeopleSearch").fetchone()[0]
+    click.echo(f"Indexed {count} identities")
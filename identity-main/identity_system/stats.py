@@ -0,0 +1,175 @@
+import click
+from flask.cli import with_appcontext
+
+from db import get_db_connection
+
+# profile columns counted per identity type, as (dimension, table, column)
+STAT_SOURCES = [
+    ('department', 'FacultyProfile', 'primary_department'),
+    ('department', 'StaffProfile', 'staff_department'),
+    ('entry_year', 'StudentProfile', 'entry_year'),
+]
+
+DIMENSIONS = ['status'] + sorted({dimension for dimension, _, _ in STAT_SOURCES})
+
+# every (person_id, dimension, value) an identity is counted under; blank values are not counted
+_KEYS_SELECT = " UNION ALL ".join(
+    ["SELECT id AS person_id, 'status' AS dimension, CAST(status AS TEXT) AS value FROM People "
+     "WHERE status IS NOT NULL"] +
+    [f"SELECT person_id, '{dimension}', CAST({column} AS TEXT) FROM {table} "
+     f"WHERE {column} IS NOT NULL AND {column} != ''" for dimension, table, column in STAT_SOURCES])
+
+_BUMP = """INSERT INTO StatsCounters (dimension, value, type, count)
+           SELECT {dimension}, CAST({value} AS TEXT), {type}, 1 {source}
+           ON CONFLICT(dimension, value, type) DO UPDATE SET count = count + 1"""
+
+_DROP = """UPDATE StatsCounters SET count = count - 1
+           WHERE dimension = {dimension} AND value = CAST({value} AS TEXT) AND type = {type}"""
+
+# ========================
+# Counters Table
+# ========================
+def init_stats(cur):
+    """Create StatsCounters and the triggers keeping it current.
+
+    Each write adjusts the counters in its own transaction, whatever path it
+    comes from (forms, API, import, lifecycle job), so reading the dashboard
+    costs one row per group instead of a scan of People.
+    """
+    cur.execute('''CREATE TABLE IF NOT EXISTS StatsCounters (
+                    dimension TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    type TEXT NOT NULL DEFAULT '',
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (dimension, value, type)
+                ) WITHOUT ROWID''')
+    cur.execute(f"CREATE VIEW IF NOT EXISTS PersonStatKeys AS {_KEYS_SELECT}")
+
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS people_stats_insert AFTER INSERT ON People
+                    WHEN NEW.status IS NOT NULL BEGIN
+                        {_BUMP.format(dimension="'status'", value='NEW.status', type="ifnull(NEW.type, '')",
+                                      source='WHERE 1')};
+                    END""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS people_stats_status AFTER UPDATE OF status ON People
+                    WHEN NEW.status IS NOT OLD.status AND NEW.type IS OLD.type BEGIN
+                        {_DROP.format(dimension="'status'", value='OLD.status', type="ifnull(OLD.type, '')")};
+                        {_BUMP.format(dimension="'status'", value='NEW.status', type="ifnull(NEW.type, '')",
+                                      source='WHERE NEW.status IS NOT NULL')};
+                    END""")
+    # a type change moves every counter of the identity (status and profile values) to the new type
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS people_stats_type AFTER UPDATE OF type, status ON People
+                    WHEN NEW.type IS NOT OLD.type BEGIN
+                        UPDATE StatsCounters SET count = count - 1
+                        WHERE type = ifnull(OLD.type, '') AND dimension = 'status' AND value = CAST(OLD.status AS TEXT);
+                        UPDATE StatsCounters SET count = count - 1
+                        WHERE type = ifnull(OLD.type, '') AND (dimension, value) IN (
+                            SELECT dimension, value FROM PersonStatKeys
+                            WHERE person_id = NEW.id AND dimension != 'status');
+                        {_BUMP.format(dimension='k.dimension', value='k.value', type="ifnull(NEW.type, '')",
+                                      source='FROM PersonStatKeys k WHERE k.person_id = NEW.id')};
+                    END""")
+    # BEFORE, so the profile rows are still there; the profile triggers skip the cascade that follows
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS people_stats_delete BEFORE DELETE ON People BEGIN
+                        UPDATE StatsCounters SET count = count - 1
+                        WHERE type = ifnull(OLD.type, '') AND (dimension, value) IN (
+                            SELECT dimension, value FROM PersonStatKeys WHERE person_id = OLD.id);
+                    END""")
+
+    for dimension, table, column in STAT_SOURCES:
+        name = f"{table.lower()}_stats_{column}"
+        bump = _BUMP.format(dimension=f"'{dimension}'", value=f'NEW.{column}', type="ifnull(p.type, '')",
+                            source=f"FROM People p WHERE p.id = NEW.person_id "
+                                   f"AND NEW.{column} IS NOT NULL AND NEW.{column} != ''")
+        drop = _DROP.format(dimension=f"'{dimension}'", value=f'OLD.{column}',
+                            type="ifnull((SELECT type FROM People WHERE id = OLD.person_id), '')")
+        cur.execute(f"""CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {table} BEGIN
+                            {bump};
+                        END""")
+        cur.execute(f"""CREATE TRIGGER IF NOT EXISTS {name}_update AFTER UPDATE OF {column} ON {table}
+                        WHEN NEW.{column} IS NOT OLD.{column} BEGIN
+                            {drop};
+                            {bump};
+                        END""")
+        cur.execute(f"""CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {table}
+                        WHEN EXISTS(SELECT 1 FROM People WHERE id = OLD.person_id) BEGIN
+                            {drop};
+                        END""")
+
+
+def rebuild_stats(cur):
+    """Recount every group from People and the profile tables; the caller commits"""
+    cur.execute("DELETE FROM StatsCounters")
+    cur.execute("""INSERT INTO StatsCounters (dimension, value, type, count)
+                   SELECT k.dimension, k.value, ifnull(p.type, ''), COUNT(*) FROM PersonStatKeys k
+                   JOIN People p ON p.id = k.person_id
+                   GROUP BY 1, 2, 3""")
+
+
+def drift(conn):
+    """(dimension, value, type, stored, actual) for every group whose counter is wrong"""
+    return conn.execute("""WITH actual AS (
+                               SELECT k.dimension, k.value, ifnull(p.type, '') AS type, COUNT(*) AS n
+                               FROM PersonStatKeys k JOIN People p ON p.id = k.person_id
+                               GROUP BY 1, 2, 3)
+                           SELECT s.dimension, s.value, s.type, s.count, ifnull(a.n, 0) FROM StatsCounters s
+                           LEFT JOIN actual a USING (dimension, value, type) WHERE s.count != ifnull(a.n, 0)
+                           UNION ALL
+                           SELECT a.dimension, a.value, a.type, 0, a.n FROM actual a
+                           WHERE NOT EXISTS(SELECT 1 FROM StatsCounters s WHERE s.dimension = a.dimension
+                                            AND s.value = a.value AND s.type = a.type)""").fetchall()
+
+# ========================
+# Reading
+# ========================
+def load_stats(conn):
+    """Head counts from StatsCounters only.
+
+    Returns {'total', 'types': [...], 'by_type': {type: n},
+    '<dimension>': [{'value', 'total', 'by_type': {type: n}}, ...]} for every
+    dimension in DIMENSIONS.
+    """
+    rows = conn.execute("SELECT dimension, value, type, count FROM StatsCounters WHERE count > 0").fetchall()
+    groups = {dimension: {} for dimension in DIMENSIONS}
+    for dimension, value, user_type, count in rows:
+        group = groups.setdefault(dimension, {}).setdefault(value, {'value': value, 'total': 0, 'by_type': {}})
+        group['total'] += count
+        group['by_type'][user_type] = count
+    # every identity has exactly one status, so the status rows give the per-type totals
+    by_type = {}
+    for group in groups['status'].values():
+        for user_type, count in group['by_type'].items():
+            by_type[user_type] = by_type.get(user_type, 0) + count
+    result = {'total': sum(by_type.values()), 'types': sorted(by_type), 'by_type': by_type}
+    for dimension, values in groups.items():
+        values = list(values.values())
+        if dimension == 'entry_year':
+            values.sort(key=lambda g: g['value'], reverse=True)
+        else:
+            values.sort(key=lambda g: (-g['total'], g['value']))
+        result[dimension] = values
+    return result
+
+# ========================
+# CLI
+# ========================
+@click.command("rebuild-stats")
+@click.option("--check", is_flag=True, help="Only report counters that differ from a full recount.")
+@with_appcontext
+def rebuild_stats_command(check):
+    """Recount the dashboard counters from scratch."""
+    conn = get_db_connection()
+    if check:
+        wrong = drift(conn)
+        for dimension, value, user_type, stored, actual in wrong:
+            click.echo(f"{dimension}={value} type={user_type}: stored {stored}, actual {actual}")
+        click.echo(f"{len(wrong)} counters out of date")
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rebuild_stats(conn.cursor())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    groups = conn.execute("SELECT COUNT(*) FROM StatsCounters").fetchone()[0]
+    click.echo(f"Rebuilt {groups} counters")
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+
+# the modules import each other by bare name (import db, import cache, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+import db  # noqa: E402
+from outbox import FakeSMTP  # noqa: E402
+
+STAFF = {'type': 'Staff', 'first_name': 'Mohamed', 'last_name': 'Benali', 'dob': '1990-01-01',
+         'email': 'mohamed.benali@example.com', 'phone': '0612345678', 'staff_department': 'Finance',
+         'job_title': 'Accountant'}
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'identity.db')
+    monkeypatch.setenv('DATABASE_PATH', path)
+    monkeypatch.setenv('SMTP_BACKEND', 'fake')
+    monkeypatch.setenv('EMAIL_USER', 'noreply@example.com')
+    return path
+
+
+@pytest.fixture
+def app(db_path):
+    """A development app on a fresh database; background threads are stopped afterwards"""
+    FakeSMTP.reset()
+    application = app_module.create_app('development')
+    application.config['TESTING'] = True
+    yield application
+    application.extensions['writer'].stop()
+    application.extensions['outbox'].stop()
+    application.extensions['db_gateway'].stop()
+    application.extensions['db_pool'].close()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def conn(app, db_path):
+    """A connection of its own, like another process or a CLI command would have"""
+    connection = db.connect(db_path, db.pragmas_from_env())
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def create(client, conn):
+    """POST /create with STAFF plus overrides; returns the new id"""
+    def create_identity(**fields):
+        before = {r[0] for r in conn.execute("SELECT id FROM People")}
+        response = client.post('/create', data=dict(STAFF, confirm_not_duplicate='1', **fields))
+        assert response.status_code == 200
+        created = {r[0] for r in conn.execute("SELECT id FROM People")} - before
+        assert len(created) == 1, response.get_data(as_text=True)
+        return created.pop()
+    return create_identity
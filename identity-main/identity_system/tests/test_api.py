@@ -0,0 +1,34 @@
+def test_list_with_fields_and_cursor(client, create):
+    for name in ['Adam', 'Bilal', 'Sara']:
+        create(last_name=name, email=f"{name.lower()}@example.com")
+    body = client.get('/api/v1/identities?sort=last_name&limit=2&fields=last_name,job_title').get_json()
+    assert [r['last_name'] for r in body['data']] == ['Adam', 'Bilal']
+    assert set(body['data'][0]) == {'id', 'last_name', 'job_title'}
+    body = client.get(f"/api/v1/identities?sort=last_name&limit=2&cursor={body['next_cursor']}").get_json()
+    assert [r['last_name'] for r in body['data']] == ['Sara'] and body['next_cursor'] is None
+
+
+def test_bad_parameters_are_400(client):
+    assert client.get('/api/v1/identities?fields=password').status_code == 400
+    assert client.get('/api/v1/identities?sort=dob').status_code == 400
+    assert client.get('/api/v1/search?fields=nope').status_code == 400
+
+
+def test_identity_detail_and_etag(client, create):
+    uid = create()
+    response = client.get(f'/api/v1/identities/{uid}?fields=first_name,staff_department')
+    assert response.get_json() == {'id': uid, 'first_name': 'Mohamed', 'staff_department': 'Finance'}
+    again = client.get(f'/api/v1/identities/{uid}?fields=first_name,staff_department',
+                       headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+    assert client.get('/api/v1/identities/NOPE').status_code == 404
+
+
+def test_search_and_typeahead(client, create):
+    uid = create()
+    create(first_name='Karim', last_name='Haddad', email='k@example.com')
+    body = client.get('/api/v1/search?q=benali&fields=last_name').get_json()
+    assert body['total'] == 1 and body['data'] == [{'id': uid, 'last_name': 'Benali'}]
+    response = client.get('/api/v1/typeahead?q=moh ben')
+    assert response.get_json() == [{'id': uid, 'name': 'Mohamed Benali'}]
+    assert response.cache_control.max_age == 30
@@ -0,0 +1,42 @@
+import audit
+
+
+def _audit(conn, uid, *stamps):
+    for n, stamp in enumerate(stamps):
+        audit.record_changes(conn, uid, [('job_title', f'v{n}', f'v{n + 1}')], stamp)
+    conn.commit()
+
+
+def test_history_lookup_uses_the_person_index(conn):
+    plan = ' '.join(r[3] for r in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM Audit WHERE person_id=? ORDER BY changed_at DESC", ('X',)))
+    assert 'idx_audit_person_changed' in plan
+
+
+def test_archive_moves_old_rows_into_yearly_tables(create, conn):
+    uid = create()
+    _audit(conn, uid, '2019-03-01T00:00:00', '2019-12-31T00:00:00', '2020-06-01T00:00:00', '2099-01-01T00:00:00')
+    moved = audit.archive_audit(conn, older_than_days=365, chunk_size=1)
+    assert moved == {'AuditArchive_2019': 2, 'AuditArchive_2020': 1}
+    assert audit.archive_tables(conn) == ['AuditArchive_2019', 'AuditArchive_2020']
+    assert conn.execute("SELECT COUNT(*) FROM Audit").fetchone()[0] == 1
+    # history still spans the live table and every archive, newest first
+    history = [r['changed_at'][:4] for r in audit.load_history(conn, uid)]
+    assert history == ['2099', '2020', '2019', '2019']
+    assert audit.archive_audit(conn, older_than_days=365) == {}
+
+
+def test_archive_command(app, create, conn):
+    uid = create()
+    _audit(conn, uid, '2019-03-01T00:00:00')
+    result = app.test_cli_runner().invoke(args=['archive-audit', '--older-than-days', '30'])
+    assert 'Archived 1 rows into AuditArchive_2019' in result.output
+    result = app.test_cli_runner().invoke(args=['archive-audit', '--older-than-days', '30'])
+    assert 'No audit rows older than 30 days' in result.output
+
+
+def test_detail_page_shows_archived_history(client, create, conn):
+    uid = create()
+    _audit(conn, uid, '2019-03-01T00:00:00')
+    audit.archive_audit(conn, older_than_days=30)
+    assert '2019-03-01' in client.get(f'/view/{uid}').get_data(as_text=True)
@@ -0,0 +1,94 @@
+import cache
+import lifecycle
+
+
+def _status(client, uid):
+    return client.get(f'/api/v1/identities/{uid}').get_json()['status']
+
+
+def _checkouts(app):
+    stats = app.extensions['db_pool'].stats()
+    return stats['hits'] + stats['misses']
+
+
+def test_memory_backend_is_an_lru_with_ttl():
+    backend = cache.MemoryCache(max_entries=2, ttl=300)
+    backend.set('a', 1)
+    backend.set('b', 2)
+    backend.get('a')
+    backend.set('c', 3)
+    assert backend.get('b') == (False, None)
+    assert backend.get('a') == (True, 1)
+    assert backend.stats()['evictions'] == 1
+    expired = cache.MemoryCache(ttl=-1)
+    expired.set('a', 1)
+    assert expired.get('a') == (False, None)
+
+
+def test_hits_do_not_touch_sqlite(app, client, create):
+    uid = create()
+    _status(client, uid)
+    checkouts = _checkouts(app)
+    hits = app.extensions['identity_cache'].stats()['hits']
+    for _ in range(3):
+        assert _status(client, uid) == 'Pending'
+    assert _checkouts(app) == checkouts
+    assert app.extensions['identity_cache'].stats()['hits'] == hits + 3
+
+
+def test_edit_invalidates_in_process(client, create, conn):
+    uid = create()
+    assert client.get(f'/api/v1/identities/{uid}').get_json()['first_name'] == 'Mohamed'
+    version = conn.execute("SELECT version FROM People WHERE id=?", (uid,)).fetchone()[0]
+    client.post(f'/edit/{uid}', data={'first_name': 'Karim', 'version': version})
+    assert client.get(f'/api/v1/identities/{uid}').get_json()['first_name'] == 'Karim'
+    page = client.get(f'/view/{uid}').get_data(as_text=True)
+    assert 'Karim' in page
+
+
+def test_write_from_another_process_is_seen_after_the_sync_interval(app, client, create, conn):
+    """The lifecycle CLI runs in its own process and never calls invalidate_identity"""
+    identity_cache = app.extensions['identity_cache']
+    uid = create()
+    assert _status(client, uid) == 'Pending'
+    assert lifecycle.apply_transition(conn, 'Pending', 'Active', 0) == 1
+    # within the interval the cached row is served as is
+    assert _status(client, uid) == 'Pending'
+    identity_cache.sync_interval = 0
+    assert _status(client, uid) == 'Active'
+    assert identity_cache.stats()['stale'] == 2
+
+
+def test_sync_keeps_entries_of_untouched_identities(app, client, create, conn):
+    identity_cache = app.extensions['identity_cache']
+    identity_cache.sync_interval = 0
+    uid = create()
+    other = create(first_name='Other', last_name='Person', email='other@example.com')
+    _status(client, uid)
+    conn.execute("UPDATE People SET status='Active' WHERE id=?", (other,))
+    conn.execute("INSERT INTO Audit (person_id, changed_at, field, old_value, new_value) "
+                 "VALUES (?, '2026-01-01', 'status', 'Pending', 'Active')", (other,))
+    conn.commit()
+    hits = identity_cache.stats()['hits']
+    _status(client, uid)
+    assert identity_cache.stats()['hits'] == hits + 1
+
+
+def test_far_behind_sync_drops_everything(app, client, create, conn, monkeypatch):
+    identity_cache = app.extensions['identity_cache']
+    identity_cache.sync_interval = 0
+    monkeypatch.setattr(cache, 'MAX_SYNC_GAP', 1)
+    uid = create()
+    _status(client, uid)
+    create(first_name='Anas', email='a@example.com')
+    create(first_name='Bilal', email='b@example.com')
+    misses = identity_cache.stats()['misses']
+    _status(client, uid)
+    assert identity_cache.stats()['misses'] == misses + 1
+
+
+def test_delete_invalidates(client, create):
+    uid = create()
+    _status(client, uid)
+    client.post(f'/delete/{uid}')
+    assert client.get(f'/api/v1/identities/{uid}').status_code == 404
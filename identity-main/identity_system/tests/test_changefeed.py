@@ -0,0 +1,81 @@
+import pytest
+
+import changefeed
+import lifecycle
+
+
+def test_entries_after_the_cursor(client, create, conn):
+    first = create()
+    batch = client.get('/changes').get_json()
+    assert [(e['op'], e['id']) for e in batch['changes']] == [('create', first)]
+    assert batch['changes'][0]['record']['last_name'] == 'Benali'
+
+    lifecycle.apply_transition(conn, 'Pending', 'Active', 0)
+    second = create(first_name='Other', email='other@example.com')
+    batch = client.get(f"/changes?since={batch['next']}").get_json()
+    assert [(e['op'], e['id']) for e in batch['changes']] == [('update', first), ('create', second)]
+    assert batch['changes'][0]['new_value'] == 'Active'
+
+    client.post(f'/delete/{second}')
+    batch = client.get(f"/changes?since={batch['next']}").get_json()
+    assert batch['changes'][0]['op'] == 'delete'
+    assert batch['changes'][0]['record']['first_name'] == 'Other'
+    assert client.get(f"/changes?since={batch['next']}").get_json()['changes'] == []
+
+
+def test_limit_pages_through_the_log(client, create):
+    for i in range(3):
+        create(first_name=f'Name{i}', email=f'name{i}@example.com')
+    batch = client.get('/changes?limit=2').get_json()
+    assert len(batch['changes']) == 2 and batch['has_more']
+    batch = client.get(f"/changes?limit=2&since={batch['next']}").get_json()
+    assert len(batch['changes']) == 1 and not batch['has_more']
+
+
+def test_latest_skips_the_backlog(client, create):
+    create()
+    batch = client.get('/changes?since=latest').get_json()
+    assert batch['changes'] == [] and batch['next'] == 1
+
+
+@pytest.mark.parametrize('since', ['-1', 'abc', '1.5'])
+def test_invalid_cursor(client, since):
+    assert client.get(f'/changes?since={since}').status_code == 400
+
+
+def test_expired_cursor(client, create, conn):
+    create()
+    # a cursor ahead of the log, and one whose entries were pruned
+    assert client.get('/changes?since=5').status_code == 410
+    create(first_name='Other', email='other@example.com')
+    conn.execute("DELETE FROM ChangeLog WHERE seq = 1")
+    conn.commit()
+    assert client.get('/changes?since=0').status_code == 410
+    assert client.get('/changes?since=1').status_code == 200
+
+
+@pytest.mark.parametrize('wait', ['nan', 'inf', '-inf', 'abc'])
+def test_invalid_wait(client, wait):
+    assert client.get(f'/changes?wait={wait}').status_code == 400
+
+
+def test_wait_is_clamped(app, client):
+    app.config['CHANGES_MAX_WAIT'] = 0.2
+    app.config['CHANGES_POLL_INTERVAL'] = 0.05
+    assert client.get('/changes?since=latest&wait=-5').get_json()['changes'] == []
+    # a huge wait still returns after CHANGES_MAX_WAIT
+    assert client.get('/changes?since=latest&wait=1e9').status_code == 200
+
+
+def test_stream_cap(app):
+    app.extensions['changes_streams'] = changefeed.threading.BoundedSemaphore(1)
+    client = app.test_client()
+    headers = {'Accept': 'text/event-stream'}
+    first = client.get('/changes', headers=headers, buffered=False)
+    assert first.status_code == 200
+    refused = client.get('/changes', headers=headers)
+    assert refused.status_code == 503 and 'Retry-After' in refused.headers
+    first.close()
+    second = client.get('/changes', headers=headers, buffered=False)
+    assert second.status_code == 200
+    second.close()
@@ -0,0 +1,61 @@
+import pytest
+
+import db
+
+
+def test_pragmas_are_applied_and_overridable(db_path, monkeypatch):
+    monkeypatch.setenv('SQLITE_CACHE_SIZE', '-2000')
+    conn = db.connect(db_path, db.pragmas_from_env())
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -2000
+    finally:
+        conn.close()
+
+
+def test_pool_reuses_released_connections(db_path):
+    pool = db.ConnectionPool(db_path, max_size=2)
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    stats = pool.stats()
+    assert (stats['size'], stats['hits'], stats['misses']) == (1, 1, 1)
+    pool.release(first)
+    pool.close()
+
+
+def test_pool_waits_then_times_out(db_path):
+    pool = db.ConnectionPool(db_path, max_size=1, timeout=0.1)
+    conn = pool.acquire()
+    with pytest.raises(db.PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+    pool.release(conn)
+    pool.close()
+
+
+def test_release_rolls_back_and_drops_closed_connections(db_path):
+    pool = db.ConnectionPool(db_path, max_size=2)
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x)")
+    conn.execute("BEGIN")
+    conn.execute("INSERT INTO t VALUES (1)")
+    pool.release(conn)
+    assert not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+    closed = pool.acquire()
+    closed.close()
+    pool.release(closed)
+    assert pool.stats()['size'] == 0
+    pool.close()
+
+
+def test_one_connection_per_request(app):
+    pool = app.extensions['db_pool']
+    with app.test_request_context('/'):
+        assert db.get_db_connection() is db.get_db_connection()
+        assert pool.stats()['idle'] == 0
+    # returned to the pool at teardown
+    assert pool.stats()['idle'] == 1
@@ -0,0 +1,118 @@
+import sqlite3
+import threading
+
+import pytest
+
+import db
+from db_gateway import DBGateway, GatewayFailed, GatewayOverloaded, GatewayTimeout
+
+
+def _gateway(db_path, workers=1, queue_size=4, timeout=5.0):
+    return DBGateway(lambda: db.connect(db_path, db.pragmas_from_env()),
+                     workers=workers, queue_size=queue_size, timeout=timeout)
+
+
+def _blocked(gateway):
+    """Occupy the (single) worker until the returned event is set"""
+    started, release = threading.Event(), threading.Event()
+
+    def wait(conn):
+        started.set()
+        release.wait(5)
+    future = gateway.submit(wait)
+    assert started.wait(5)
+    return future, release
+
+
+def _count(conn):
+    return conn.execute("SELECT count(*) FROM People").fetchone()[0]
+
+
+@pytest.fixture
+def gateway(app, db_path):
+    gw = _gateway(db_path)
+    yield gw
+    gw.stop()
+
+
+def test_call_returns_result_on_read_only_connection(gateway):
+    assert gateway.call(_count) == 0
+    with pytest.raises(sqlite3.OperationalError):
+        gateway.call(lambda conn: conn.execute("DELETE FROM People"))
+    # the error went to its caller only; the worker carries on
+    assert gateway.call(_count) == 0
+
+
+def test_queued_call_times_out_and_is_cancelled(gateway):
+    running, release = _blocked(gateway)
+    with pytest.raises(GatewayTimeout):
+        gateway.call(_count, timeout=0.05)
+    release.set()
+    running.result(5)
+    assert gateway.call(_count) == 0
+    stats = gateway.stats()
+    assert stats['timeouts'] == 1 and stats['running'] == 0
+
+
+def test_running_call_is_interrupted_and_next_call_unaffected(gateway):
+    endless = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n"
+    with pytest.raises(GatewayTimeout):
+        gateway.call(lambda conn: conn.execute(endless).fetchone(), timeout=0.2)
+    # the interrupt hit the abandoned statement, not the connection's next job
+    assert gateway.call(_count) == 0
+
+
+def test_full_queue_is_rejected_at_once(db_path, app):
+    gateway = _gateway(db_path, queue_size=1)
+    try:
+        running, release = _blocked(gateway)
+        queued = gateway.submit(_count)
+        with pytest.raises(GatewayOverloaded):
+            gateway.submit(_count)
+        release.set()
+        assert queued.result(5) == 0
+        assert gateway.stats()['rejected'] == 1
+    finally:
+        gateway.stop()
+
+
+def test_overloaded_search_answers_503(monkeypatch, db_path):
+    monkeypatch.setenv('DB_GATEWAY_WORKERS', '1')
+    monkeypatch.setenv('DB_GATEWAY_QUEUE', '1')
+    import app as app_module
+    application = app_module.create_app('development')
+    gateway = application.extensions['db_gateway']
+    try:
+        running, release = _blocked(gateway)
+        gateway.submit(_count)
+        response = application.test_client().get('/search?query=benali')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        release.set()
+    finally:
+        gateway.stop()
+        application.extensions['writer'].stop()
+        application.extensions['outbox'].stop()
+        application.extensions['db_pool'].close()
+
+
+def test_failed_connect_fails_queued_calls_and_restarts(db_path, app):
+    healthy = threading.Event()
+
+    def connect():
+        if not healthy.is_set():
+            raise sqlite3.OperationalError("unable to open database file")
+        return db.connect(db_path, db.pragmas_from_env())
+
+    gateway = DBGateway(connect, workers=2, queue_size=4, timeout=5.0)
+    try:
+        with pytest.raises(GatewayFailed):
+            # fails as soon as a worker gives up, not after the 5 second timeout
+            gateway.call(_count)
+        healthy.set()
+        assert gateway.call(_count) == 0
+        stats = gateway.stats()
+        assert stats['failed'] >= 1 and stats['restarts'] >= 1
+        assert stats['workers'] == 2
+    finally:
+        gateway.stop()
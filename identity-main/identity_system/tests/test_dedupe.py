@@ -0,0 +1,70 @@
+import dedupe
+from conftest import STAFF
+
+
+def _record(first, last, dob='1990-01-01', email='x@example.com'):
+    return {'first_name': first, 'last_name': last, 'dob': dob, 'email': email}
+
+
+def test_phonetic_codes_fold_transliterations():
+    assert dedupe.phonetic('Mohamed') == dedupe.phonetic('Mohammed') == dedupe.phonetic('Muhammad')
+    assert dedupe.phonetic('Oualid') == dedupe.phonetic('Walid')
+    assert dedupe.phonetic('Ben Ali') == dedupe.phonetic('Benali')
+
+
+def test_scores():
+    base = _record('Mohamed', 'Benali', email='m.benali@example.com')
+    assert dedupe.score(base, _record('Mohammed', 'Ben Ali', email='mbenali@example.com')) >= 0.9
+    assert dedupe.score(base, _record('Benali', 'Mohamed')) >= dedupe.MATCH_THRESHOLD
+    assert dedupe.score(base, _record('Mohamed', 'Benali', dob='1990-01-10')) >= dedupe.MATCH_THRESHOLD
+    assert dedupe.score(base, _record('Karim', 'Haddad', dob='1975-05-05')) < dedupe.MATCH_THRESHOLD
+    assert dedupe.dob_similarity('1990-03-04', '1990-04-03') == 0.7
+
+
+def test_find_matches_is_read_only_and_sees_pending_identities(create, conn):
+    uid = create()
+    # a write that skipped re-keying leaves the identity pending
+    conn.execute("INSERT INTO MatchKeysPending (person_id) VALUES (?)", (uid,))
+    conn.execute("DELETE FROM MatchKeys WHERE person_id=?", (uid,))
+    conn.commit()
+    matches = dedupe.find_matches(conn, dict(STAFF, first_name='Mouhamed', email='other@example.com'))
+    assert [m['id'] for m in matches] == [uid]
+    assert not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM MatchKeysPending").fetchone()[0] == 1
+
+
+def test_create_asks_for_confirmation_on_near_matches(client, create, conn):
+    create()
+    response = client.post('/create', data=dict(STAFF, first_name='Mohammed', email='m2@example.com'))
+    assert 'Benali' in response.get_data(as_text=True)
+    assert conn.execute("SELECT COUNT(*) FROM People").fetchone()[0] == 1
+
+
+def test_report_yields_each_pair_once(create, conn):
+    # the first two share their name, dob, initials and email keys
+    a = create(email='m.benali@example.com')
+    b = create(first_name='Mohammed', last_name='Ben Ali', email='mbenali@example.com', type='Student',
+               national_id='X1')
+    create(first_name='Karim', last_name='Haddad', dob='1975-05-05', email='k@example.com')
+    pairs = [(x['id'], y['id']) for x, y in dedupe.candidate_pairs(conn)]
+    assert sorted(tuple(sorted(p)) for p in pairs) == [tuple(sorted((a, b)))]
+    matches, stats = dedupe.duplicate_report(conn)
+    assert stats == {'compared': 1, 'matches': 1, 'skipped_blocks': 0}
+    assert {matches[0][1]['id'], matches[0][2]['id']} == {a, b}
+
+
+def test_oversized_blocks_are_skipped(create, conn):
+    for i in range(3):
+        create(first_name=f'Name{i}', email=f'n{i}@example.com', dob=f'19{80 + i}-01-01')
+    # digits fold away, so the three share only their name key
+    matches, stats = dedupe.duplicate_report(conn, max_block_size=2)
+    assert stats['compared'] == 0 and stats['skipped_blocks'] >= 1
+
+
+def test_report_command(app, create, tmp_path):
+    create(email='m.benali@example.com')
+    create(first_name='Mohammed', email='mbenali@example.com', type='Student', national_id='X1')
+    out = tmp_path / 'dupes.csv'
+    result = app.test_cli_runner().invoke(args=['dedupe-report', '--output', str(out), '--rebuild-keys'])
+    assert '1 likely duplicate pairs out of 1 compared' in result.output
+    assert len(out.read_text().splitlines()) == 2
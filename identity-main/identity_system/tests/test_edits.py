@@ -0,0 +1,74 @@
+import pytest
+
+import edits
+import profiles
+
+
+def _version(conn, uid):
+    return conn.execute("SELECT version FROM People WHERE id=?", (uid,)).fetchone()[0]
+
+
+def test_write_edit_bumps_version_and_audits(create, conn):
+    uid = create()
+    version = _version(conn, uid)
+    person = profiles.load_person(conn, uid)
+    changes = edits.diff_changes(person, {'first_name': 'Karim', 'job_title': 'Auditor'})
+    assert edits.write_edit(conn, uid, changes, version) == version + 1
+    conn.commit()
+    assert profiles.load_person(conn, uid)['job_title'] == 'Auditor'
+    audit = conn.execute("SELECT field, old_value, new_value FROM Audit WHERE person_id=? ORDER BY field",
+                         (uid,)).fetchall()
+    assert [tuple(r) for r in audit] == [('first_name', 'Mohamed', 'Karim'), ('job_title', 'Accountant', 'Auditor')]
+
+
+def test_stale_version_conflicts_and_writes_nothing(create, conn):
+    uid = create()
+    version = _version(conn, uid)
+    edits.write_edit(conn, uid, [('first_name', 'Mohamed', 'Karim')], version)
+    conn.commit()
+    with pytest.raises(edits.EditConflict):
+        edits.write_edit(conn, uid, [('last_name', 'Benali', 'Other')], version)
+    conn.rollback()
+    assert profiles.load_person(conn, uid)['last_name'] == 'Benali'
+    assert conn.execute("SELECT COUNT(*) FROM Audit WHERE person_id=?", (uid,)).fetchone()[0] == 1
+
+
+def test_edit_form_reports_conflict(client, create, conn):
+    uid = create()
+    version = _version(conn, uid)
+    assert client.post(f'/edit/{uid}', data={'first_name': 'Karim', 'version': version}).status_code == 302
+    response = client.post(f'/edit/{uid}', data={'first_name': 'Walid', 'version': version})
+    assert b'changed by someone else' in response.data
+    assert profiles.load_person(conn, uid)['first_name'] == 'Karim'
+
+
+def test_batch_edit_by_ids_and_where(client, create, conn):
+    first = create()
+    second = create(first_name='Karim', email='karim@example.com')
+    body = client.post('/api/v1/identities/batch',
+                       json={'set': {'staff_department': 'Library'}, 'ids': [first]}).get_json()
+    assert body == {'updated': 1, 'ids': [first]}
+    body = client.post('/api/v1/identities/batch',
+                       json={'set': {'job_title': 'Clerk'}, 'where': {'staff_department': 'Finance'}}).get_json()
+    assert body['ids'] == [second]
+    assert profiles.load_person(conn, second)['job_title'] == 'Clerk'
+    audit = conn.execute("SELECT field, old_value, new_value FROM Audit WHERE person_id=?", (second,)).fetchall()
+    assert [tuple(r) for r in audit] == [('job_title', 'Accountant', 'Clerk')]
+    # already holding the value: nothing to change
+    body = client.post('/api/v1/identities/batch', json={'set': {'job_title': 'Clerk'}, 'ids': [second]}).get_json()
+    assert body['updated'] == 0
+
+
+@pytest.mark.parametrize('body', [
+    {'set': {'job_title': ['Clerk']}, 'ids': ['X']},
+    {'set': {'job_title': 'Clerk'}, 'where': {'staff_department': {'a': 1}}},
+    {'set': {'status': 'Active'}, 'ids': ['X']},
+    {'set': {'job_title': 'Clerk'}, 'ids': 'X'},
+    {'set': {'job_title': 'Clerk'}},
+    {'set': {}},
+    ['not an object'],
+])
+def test_batch_edit_rejects_bad_bodies(client, body):
+    response = client.post('/api/v1/identities/batch', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
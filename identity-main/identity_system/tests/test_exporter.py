@@ -0,0 +1,87 @@
+import csv
+import gzip
+import io
+import json
+
+import db
+import exporter
+from conftest import STAFF
+
+
+def _csv_rows(data):
+    return list(csv.DictReader(io.StringIO(data)))
+
+
+def test_full_export_in_every_text_format(client, create):
+    uid = create()
+    create(first_name='Karim', email='k@example.com')
+    response = client.get('/export.csv')
+    rows = _csv_rows(response.get_data(as_text=True))
+    assert [r['id'] for r in rows][0] == uid and len(rows) == 2
+    assert rows[0]['job_title'] == 'Accountant' and rows[0]['deleted_at'] == ''
+    assert 'X-Export-Watermark' in response.headers
+
+    lines = client.get('/export.jsonl?query=karim').get_data(as_text=True).splitlines()
+    assert [json.loads(line)['first_name'] for line in lines] == ['Karim']
+
+    body = gzip.decompress(client.get('/export.csv?compress=gzip').data).decode()
+    assert len(_csv_rows(body)) == 2
+
+
+def test_bad_requests(client):
+    assert client.get('/export.xml').status_code == 404
+    assert client.get('/export.csv?since=yesterday').status_code == 400
+
+
+def test_parse_since_normalizes_to_utc():
+    assert exporter.parse_since('2026-01-01T12:00:00+02:00') == '2026-01-01T10:00:00.000Z'
+    assert exporter.parse_since('2026-01-01T10:00:00Z') == '2026-01-01T10:00:00.000Z'
+
+
+def test_incremental_export_with_watermark_and_tombstones(client, create, conn):
+    kept = create()
+    gone = create(first_name='Karim', email='k@example.com')
+    since = exporter.watermark(conn)
+    # the watermark trails the export start, so rows touched just before it come again
+    rows = _csv_rows(client.get(f'/export.csv?since={since}').get_data(as_text=True))
+    assert {r['id'] for r in rows} == {kept, gone}
+
+    version = conn.execute("SELECT version FROM People WHERE id=?", (kept,)).fetchone()[0]
+    conn.execute("UPDATE People SET updated_at='2000-01-01T00:00:00.000Z'")
+    conn.commit()
+    since = '2001-01-01T00:00:00Z'
+    client.post(f'/edit/{kept}', data={'job_title': 'Auditor', 'version': version})
+    client.post(f'/delete/{gone}')
+    rows = _csv_rows(client.get(f'/export.csv?since={since}').get_data(as_text=True))
+    assert [(r['id'], r['job_title'], bool(r['deleted_at'])) for r in rows] == \
+        [(kept, 'Auditor', False), (gone, '', True)]
+
+
+def test_export_reads_one_snapshot(db_path, create, conn):
+    """A delete committed between chunks shows up neither as a tombstone nor as a missing row"""
+    first = create()
+    second = create(first_name='Karim', email='k@example.com')
+    reader = db.connect(db_path, db.pragmas_from_env())
+    try:
+        chunks = exporter.iter_chunks(reader, since='2000-01-01T00:00:00.000Z', chunk_size=1)
+        assert next(chunks)[0][0] == first
+        conn.execute("DELETE FROM People WHERE id=?", (second,))
+        conn.commit()
+        rest = [row for chunk in chunks for row in chunk]
+        assert [(row[0], row[-1]) for row in rest] == [(second, None)]
+        assert not reader.in_transaction
+    finally:
+        reader.close()
+
+
+def test_export_command_with_state_file(app, create, tmp_path):
+    create()
+    out, state = tmp_path / 'people.jsonl.gz', tmp_path / 'state'
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['export-identities', str(out), '--state-file', str(state)])
+    assert 'Exported 1 rows' in result.output
+    assert json.loads(gzip.decompress(out.read_bytes()))['email'] == STAFF['email']
+    watermark = state.read_text().strip()
+    result = runner.invoke(args=['export-identities', str(out), '--state-file', str(state)])
+    assert f'changed since {watermark}' in result.output
+    assert not (tmp_path / 'people.jsonl.gz.partial').exists()
@@ -0,0 +1,52 @@
+import threading
+
+import db
+import id_allocator
+from conftest import STAFF
+
+
+def test_ids_are_sequential_per_type_and_year(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    first = id_allocator.reserve_ids(conn, 'Staff', 3, year=2026)
+    student = id_allocator.allocate_id(conn, 'Student')
+    conn.commit()
+    assert first == ['STF202600001', 'STF202600002', 'STF202600003']
+    assert student.startswith('STU')
+    assert id_allocator.reserve_ids(conn, 'Staff', 1, year=2026) == ['STF202600004']
+
+
+def test_sequence_continues_after_existing_ids(conn):
+    conn.execute("INSERT INTO People (id, type, first_name, last_name) VALUES ('STF202600041', 'Staff', 'A', 'B')")
+    assert id_allocator.reserve_ids(conn, 'Staff', 1, year=2026) == ['STF202600042']
+
+
+def test_concurrent_allocations_never_collide(db_path, conn):
+    """Regression: counting rows to pick the next ID handed the same ID to concurrent creates"""
+    threads, per_thread = 8, 25
+    errors, ids = [], []
+    lock = threading.Lock()
+
+    def worker(n):
+        own = db.connect(db_path, db.pragmas_from_env())
+        try:
+            for i in range(per_thread):
+                own.execute("BEGIN IMMEDIATE")
+                uid = id_allocator.allocate_id(own, 'Staff')
+                own.execute("INSERT INTO People (id, type, first_name, last_name, email) VALUES (?, ?, ?, ?, ?)",
+                            (uid, 'Staff', STAFF['first_name'], STAFF['last_name'], f"t{n}.{i}@example.com"))
+                own.commit()
+                with lock:
+                    ids.append(uid)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            own.close()
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    assert errors == []
+    assert len(ids) == len(set(ids)) == threads * per_thread
+    assert conn.execute("SELECT COUNT(*) FROM People").fetchone()[0] == threads * per_thread
@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+
+import importer
+import outbox
+from conftest import STAFF
+
+CSV_HEADER = ','.join(STAFF)
+
+
+def _csv(*rows):
+    lines = [CSV_HEADER] + [','.join(str(dict(STAFF, **r)[f]) for f in STAFF) for r in rows]
+    return io.StringIO('\n'.join(lines) + '\n')
+
+
+def _report(report):
+    report.seek(0)
+    return list(csv.DictReader(report))
+
+
+def test_csv_import_in_chunks(conn):
+    rows = [{'first_name': f'Name{i}', 'email': f'n{i}@example.com'} for i in range(5)]
+    rows.append({'first_name': 'Bad', 'email': 'n0@example.com'})
+    report = io.StringIO()
+    summary = importer.import_records(conn, _csv(*rows), 'csv', report, chunk_size=2)
+    assert summary == {'imported': 5, 'rejected': 1}
+    assert conn.execute("SELECT COUNT(*) FROM People WHERE status='Pending'").fetchone()[0] == 5
+    # profile values land in the profile table
+    assert conn.execute("SELECT COUNT(*) FROM StaffProfile WHERE job_title='Accountant'").fetchone()[0] == 5
+    rejected = _report(report)
+    assert [(r['line'], r['email']) for r in rejected] == [('7', 'n0@example.com')]
+    assert rejected[0]['errors'] == 'Email already exists'
+
+
+def test_jsonl_rows_are_rejected_one_by_one(conn):
+    lines = [
+        json.dumps(dict(STAFF, email='ok@example.com', phone=612345678)),
+        '{not json',
+        json.dumps(['a list']),
+        json.dumps(dict(STAFF, first_name=['Mohamed'], email='list@example.com')),
+        '',
+        json.dumps(dict(STAFF, first_name='Karim', email='k@example.com')),
+    ]
+    report = io.StringIO()
+    summary = importer.import_records(conn, io.StringIO('\n'.join(lines)), 'jsonl', report)
+    assert summary == {'imported': 2, 'rejected': 3}
+    errors = {r['line']: r['errors'] for r in _report(report)}
+    assert errors['2'].startswith('Invalid JSON')
+    assert errors['3'] == 'Each line must be a JSON object'
+    assert errors['4'] == 'first_name must be text, not list'
+    assert conn.execute("SELECT phone FROM People WHERE email='ok@example.com'").fetchone()[0] == '612345678'
+
+
+def test_confirmations_are_queued_with_the_rows(conn):
+    importer.import_records(conn, _csv({}, {'first_name': 'Karim', 'email': 'K@Example.com'}), 'csv',
+                            io.StringIO(), on_created=outbox.send_confirmation)
+    assert sorted(r[0] for r in conn.execute("SELECT recipient FROM Outbox")) == \
+        ['k@example.com', 'mohamed.benali@example.com']
+
+
+def test_import_endpoint(client, conn):
+    data = {'file': (io.BytesIO(_csv({}, {'email': 'bad'}).getvalue().encode()), 'people.csv')}
+    response = client.post('/import', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert conn.execute("SELECT COUNT(*) FROM People").fetchone()[0] == 1
+
+    data = {'file': (io.BytesIO(_csv({'email': 'bad'}).getvalue().encode()), 'people.csv'), 'report': 'csv'}
+    response = client.post('/import', data=data, content_type='multipart/form-data')
+    assert response.mimetype == 'text/csv'
+    assert 'Invalid email format' in response.get_data(as_text=True)
+
+
+def test_import_command(app, tmp_path, conn):
+    source = tmp_path / 'people.csv'
+    source.write_text(_csv({}).getvalue())
+    report = tmp_path / 'errors.csv'
+    result = app.test_cli_runner().invoke(args=['import-identities', str(source), '--report', str(report),
+                                                '--no-email'])
+    assert 'Imported 1 identities, rejected 0 rows' in result.output
+    assert conn.execute("SELECT COUNT(*) FROM Outbox").fetchone()[0] == 0
@@ -0,0 +1,49 @@
+import re
+
+import pytest
+
+from conftest import STAFF
+
+
+@pytest.fixture
+def instrumented(db_path, monkeypatch):
+    """INSTRUMENTATION on and every statement counted as slow; must come before `client`"""
+    monkeypatch.setenv('INSTRUMENTATION', '1')
+    monkeypatch.setenv('SLOW_QUERY_MS', '0')
+    monkeypatch.setenv('RESPONSE_CACHE', '0')
+
+
+def _timings(response):
+    """{span: milliseconds} from the Server-Timing header"""
+    return {name: float(ms) for name, ms in re.findall(r'(\w+);dur=([\d.]+)', response.headers['Server-Timing'])}
+
+
+def test_off_by_default(client):
+    assert 'Server-Timing' not in client.get('/view_all').headers
+    assert client.get('/metrics').status_code == 404
+
+
+def test_server_timing_covers_queries_and_templates(instrumented, client, create):
+    create()
+    response = client.get('/view_all')
+    assert set(_timings(response)) == {'db', 'tpl', 'total'}
+    assert re.search(r'desc="[1-9]\d* queries', response.headers['Server-Timing'])
+
+
+def test_gateway_and_writer_jobs_are_traced(instrumented, client):
+    # the search runs on a gateway thread, the insert and its email on the writer thread
+    response = client.post('/create', data=dict(STAFF, confirm_not_duplicate='1'))
+    assert 'mail' in _timings(response)
+    response = client.post('/search', data={'query': 'benali'})
+    assert re.search(r'desc="[1-9]\d* queries', response.headers['Server-Timing'])
+
+
+def test_metrics_and_slow_query_log(instrumented, client, create):
+    create()
+    client.get('/view_all')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'identity_http_requests_total{method="GET",endpoint="views.view_all",status="200"} 1' in text
+    assert 'identity_db_pool_connections{state="open"}' in text
+    slow = client.get('/metrics/slow-queries').get_json()
+    listing = [q for q in slow if q['endpoint'] == 'views.view_all']
+    assert listing and all(q['plan'] for q in listing if q['sql'].startswith('SELECT'))
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import cache
+import lifecycle
+
+
+def _set_status(conn, uid, status, days_ago):
+    stamp = (datetime.now() - timedelta(days=days_ago)).isoformat()
+    conn.execute("UPDATE People SET status=?, status_changed_at=? WHERE id=?", (status, stamp, uid))
+    conn.commit()
+
+
+def test_transition_rules():
+    assert lifecycle.is_valid_transition('Pending', 'Active')
+    assert not lifecycle.is_valid_transition('Pending', 'Archived')
+    old = (datetime.now() - timedelta(days=365 * 6)).isoformat()
+    recent = (datetime.now() - timedelta(days=30)).isoformat()
+    assert lifecycle.is_valid_transition('Inactive', 'Archived', old)
+    assert not lifecycle.is_valid_transition('Inactive', 'Archived', recent)
+    with pytest.raises(ValueError):
+        lifecycle.check_transition('Archived', 'Active', 0)
+    with pytest.raises(ValueError):
+        lifecycle.check_transition('Inactive', 'Archived', 30)
+
+
+def test_apply_transition_in_chunks_with_audit(create, conn):
+    ids = [create(first_name=f'Name{i}', email=f'n{i}@example.com') for i in range(5)]
+    for n, uid in enumerate(ids):
+        _set_status(conn, uid, 'Inactive', days_ago=365 * 6 if n < 3 else 10)
+    assert lifecycle.pending_transition(conn, 'Inactive', 'Archived', 365 * 5)[0] == 3
+    assert lifecycle.apply_transition(conn, 'Inactive', 'Archived', 365 * 5, chunk_size=2) == 3
+    statuses = dict(conn.execute("SELECT id, status FROM People").fetchall())
+    assert [statuses[uid] for uid in ids] == ['Archived'] * 3 + ['Inactive'] * 2
+    audit = conn.execute("SELECT person_id, old_value, new_value FROM Audit WHERE field='status'").fetchall()
+    assert sorted(tuple(r) for r in audit) == sorted((uid, 'Inactive', 'Archived') for uid in ids[:3])
+    # bumped once, so an editor holding the old version gets a conflict
+    versions = conn.execute("SELECT DISTINCT version FROM People ORDER BY status").fetchall()
+    assert [r[0] for r in versions] == [1, 0]
+    assert lifecycle.apply_transition(conn, 'Inactive', 'Archived', 365 * 5) == 0
+
+
+def test_transition_drops_cached_identities(app, client, create, conn):
+    uid = create()
+    assert client.get(f'/api/v1/identities/{uid}').get_json()['status'] == 'Pending'
+    with app.app_context():
+        lifecycle.apply_transition(conn, 'Pending', 'Active', 0)
+        assert cache.get_person(uid, conn)['status'] == 'Active'
+
+
+def test_apply_lifecycle_command(app, create, conn):
+    uid = create()
+    _set_status(conn, uid, 'Inactive', days_ago=365 * 6)
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['apply-lifecycle', '--dry-run'])
+    assert '1 identities would move' in result.output
+    result = runner.invoke(args=['apply-lifecycle'])
+    assert 'moved 1 identities' in result.output
+    assert conn.execute("SELECT status FROM People WHERE id=?", (uid,)).fetchone()[0] == 'Archived'
+    result = runner.invoke(args=['apply-lifecycle', '--from-status', 'Archived', '--to-status', 'Active'])
+    assert result.exit_code != 0 and 'not allowed' in result.output
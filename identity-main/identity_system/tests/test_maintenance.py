@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import maintenance
+import search_index
+from maintenance import Interrupted
+
+
+@pytest.fixture
+def settings(app, tmp_path):
+    return dict(maintenance.settings_from_config(app.config), pause=0, backup_dir=str(tmp_path / 'backups'),
+                backup_keep=1)
+
+
+@pytest.fixture
+def mconn(settings, db_path):
+    connection = maintenance.connect(db_path, settings)
+    yield connection
+    connection.close()
+
+
+def _age(conn, run_id, seconds):
+    started = maintenance._utcnow() - timedelta(seconds=seconds)
+    conn.execute("UPDATE MaintenanceRuns SET started_at = ? WHERE id = ?", (maintenance._stamp(started), run_id))
+    conn.commit()
+
+
+def test_claim_runs_each_job_once_per_interval(mconn):
+    first = maintenance._claim(mconn, 'optimize', 86400)
+    assert first is not None
+    # another process (or the next cron run) finds it already claimed
+    assert maintenance._claim(mconn, 'optimize', 86400) is None
+    assert maintenance._claim(mconn, 'checkpoint', 3600) is not None
+    assert maintenance._claim(mconn, 'optimize', 86400, force=True) not in (None, first)
+    _age(mconn, first, 86401)
+    mconn.execute("DELETE FROM MaintenanceRuns WHERE id != ?", (first,))
+    mconn.commit()
+    assert maintenance._claim(mconn, 'optimize', 86400) is not None
+
+
+def test_failed_job_is_retried_before_its_interval(mconn):
+    run_id = maintenance._claim(mconn, 'backup', 86400)
+    maintenance._finish(mconn, run_id, 0.1, 'error', detail='disk full')
+    _age(mconn, run_id, maintenance.RETRY_SECONDS + 1)
+    assert maintenance._claim(mconn, 'backup', 86400) is not None
+
+
+def test_run_job_logs_result_and_last_runs(mconn, settings):
+    row = maintenance.run_job(mconn, 'checkpoint', settings)
+    assert row['result'] == 'ok' and row['finished_at'] and 'WAL frames copied' in row['detail']
+    # not due again until its interval has passed
+    assert maintenance.run_job(mconn, 'checkpoint', settings) is None
+    row = maintenance.run_job(mconn, 'integrity_check', settings)
+    assert (row['result'], row['detail']) == ('ok', 'ok')
+    assert [r['job'] for r in maintenance.last_runs(mconn)] == ['checkpoint', 'integrity_check']
+
+
+def test_interrupted_job_is_recorded(mconn, settings):
+    def closed():
+        raise Interrupted("maintenance window closed")
+    row = maintenance.run_job(mconn, 'optimize', settings, check=closed)
+    assert (row['result'], row['detail']) == ('interrupted', 'maintenance window closed')
+    assert not mconn.in_transaction
+
+
+def test_backup_keeps_newest_copies(mconn, settings, create, tmp_path):
+    create()
+    row = maintenance.run_job(mconn, 'backup', settings)
+    assert row['result'] == 'ok'
+    backups = list((tmp_path / 'backups').glob('identity-*.db'))
+    assert len(backups) == 1 and not list((tmp_path / 'backups').glob('*.partial'))
+
+
+def test_full_vacuum_keeps_search_index_keyed(app, create, conn, settings, db_path):
+    uid = create(last_name='Alaoui', email='alaoui@example.com')
+    create()
+    conn.execute("DELETE FROM People WHERE id != ?", (uid,))
+    conn.commit()
+    result = app.test_cli_runner().invoke(args=['maintenance', 'vacuum', '--full'])
+    assert 'vacuum: ok' in result.output and 'rowids unchanged' in result.output
+    mconn = maintenance.connect(db_path, settings)
+    assert mconn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    rows, _ = search_index.search_people(mconn, query='alaoui')
+    assert [r['id'] for r in rows] == [uid]
+    # incremental vacuum can run from now on
+    row = maintenance.run_job(mconn, 'vacuum', settings, force=True)
+    assert row['result'] == 'ok' and 'pages released' in row['detail']
+    mconn.close()
+
+
+def test_cli_status_and_named_jobs(app):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['maintenance', 'checkpoint'])
+    assert result.output.startswith('checkpoint: ok in ')
+    # named jobs always run, whether due or not
+    assert runner.invoke(args=['maintenance', 'checkpoint']).output.startswith('checkpoint: ok in ')
+    status = runner.invoke(args=['maintenance', '--status']).output
+    assert status.startswith('checkpoint ') and 'ok' in status
+    assert runner.invoke(args=['maintenance', 'optimize', '--full']).exit_code != 0
+
+
+def test_windows():
+    windows = maintenance.parse_windows('01:00-05:00,23:30-00:30')
+    assert windows == [((1, 0), (5, 0)), ((23, 30), (0, 30))]
+    assert maintenance.in_window(windows, datetime(2024, 1, 1, 2, 0))
+    assert maintenance.in_window(windows, datetime(2024, 1, 1, 0, 15))
+    assert not maintenance.in_window(windows, datetime(2024, 1, 1, 12, 0))
+    assert maintenance.in_window([], datetime(2024, 1, 1, 12, 0))
+    with pytest.raises(ValueError):
+        maintenance.parse_windows('25:00-26:00')
@@ -0,0 +1,128 @@
+import time
+from datetime import datetime, timedelta
+
+import app as app_module
+import db
+import outbox
+from outbox import FakeSMTP, OutboxWorkerPool, SMTPPool
+
+
+def _workers(max_attempts=3, backoff_seconds=30):
+    return OutboxWorkerPool(None, SMTPPool(lambda: FakeSMTP()), 'noreply@example.com',
+                            max_attempts=max_attempts, backoff_seconds=backoff_seconds)
+
+
+def _row(conn, msg_id):
+    return conn.execute("SELECT status, attempts, next_attempt_at, last_error FROM Outbox WHERE id=?",
+                        (msg_id,)).fetchone()
+
+
+def _make_due(conn, msg_id):
+    conn.execute("UPDATE Outbox SET next_attempt_at=? WHERE id=?", (datetime(2000, 1, 1).isoformat(), msg_id))
+    conn.commit()
+
+
+def test_create_queues_confirmation_in_same_transaction(create, conn):
+    uid = create()
+    row = conn.execute("SELECT recipient, status, body FROM Outbox").fetchone()
+    assert row['recipient'] == 'mohamed.benali@example.com'
+    # the workers are woken right after the commit and may already be sending it
+    assert row['status'] in ('queued', 'sending', 'sent')
+    assert uid in row['body']
+
+
+def test_send_marks_message_sent(conn):
+    msg_id = outbox.enqueue(conn, 'a@example.com', 'Hi', 'Body')
+    conn.commit()
+    workers = _workers()
+    assert workers.process_batch(conn) == 1
+    assert _row(conn, msg_id)['status'] == 'sent'
+    assert [m['To'] for m in FakeSMTP.messages] == ['a@example.com']
+    assert workers.metrics.sent == 1
+
+
+def test_failed_send_backs_off_exponentially(conn):
+    msg_id = outbox.enqueue(conn, 'a@example.com', 'Hi', 'Body')
+    conn.commit()
+    workers = _workers(backoff_seconds=30)
+
+    FakeSMTP.fail_next = 1
+    before = datetime.now()
+    workers.process_batch(conn)
+    row = _row(conn, msg_id)
+    assert (row['status'], row['attempts']) == ('queued', 1)
+    assert row['last_error'] == 'fake failure'
+    delay = datetime.fromisoformat(row['next_attempt_at']) - before
+    assert timedelta(seconds=29) < delay < timedelta(seconds=35)
+
+    # not due yet: nothing is claimed
+    assert workers.process_batch(conn) == 0
+
+    _make_due(conn, msg_id)
+    FakeSMTP.fail_next = 1
+    before = datetime.now()
+    workers.process_batch(conn)
+    row = _row(conn, msg_id)
+    assert row['attempts'] == 2
+    delay = datetime.fromisoformat(row['next_attempt_at']) - before
+    assert timedelta(seconds=59) < delay < timedelta(seconds=65)
+    assert workers.metrics.retried == 2
+
+
+def test_gives_up_after_max_attempts(conn):
+    msg_id = outbox.enqueue(conn, 'a@example.com', 'Hi', 'Body')
+    conn.commit()
+    workers = _workers(max_attempts=2)
+    for _ in range(2):
+        FakeSMTP.fail_next = 1
+        _make_due(conn, msg_id)
+        workers.process_batch(conn)
+    row = _row(conn, msg_id)
+    assert (row['status'], row['attempts']) == ('failed', 2)
+    assert workers.metrics.failed == 1
+    _make_due(conn, msg_id)
+    assert workers.process_batch(conn) == 0
+    assert FakeSMTP.messages == []
+
+
+def test_expired_lease_is_claimed_again(conn):
+    msg_id = outbox.enqueue(conn, 'a@example.com', 'Hi', 'Body')
+    conn.execute("UPDATE Outbox SET status='sending', claimed_at=? WHERE id=?",
+                 (datetime(2000, 1, 1).isoformat(), msg_id))
+    conn.commit()
+    assert _workers().process_batch(conn) == 1
+    assert _row(conn, msg_id)['status'] == 'sent'
+
+
+def test_idle_poll_does_not_take_the_write_lock(db_path, conn):
+    """Nothing due: the claim only reads, so it never waits behind another writer"""
+    writer = db.connect(db_path, db.pragmas_from_env())
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        assert _workers().process_batch(conn) == 0
+        assert time.monotonic() - started < 1
+    finally:
+        writer.rollback()
+        writer.close()
+
+
+def test_autostart_sends_mail_left_queued(db_path, monkeypatch):
+    """Mail queued before a restart goes out without waiting for the next /create"""
+    app_module.init_db(db_path)
+    queued = db.connect(db_path, db.pragmas_from_env())
+    outbox.enqueue(queued, 'a@example.com', 'Hi', 'Body')
+    queued.commit()
+    queued.close()
+    FakeSMTP.reset()
+    monkeypatch.setenv('OUTBOX_AUTOSTART', '1')
+    application = app_module.create_app('development')
+    try:
+        deadline = time.monotonic() + 5
+        while not FakeSMTP.messages and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert [m['To'] for m in FakeSMTP.messages] == ['a@example.com']
+    finally:
+        for name in ('writer', 'outbox', 'db_gateway'):
+            application.extensions[name].stop()
+        application.extensions['db_pool'].close()
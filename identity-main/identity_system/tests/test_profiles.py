@@ -0,0 +1,56 @@
+import db
+import migrations
+import profiles
+
+
+def test_create_writes_only_the_relevant_profile(create, conn):
+    uid = create()
+    assert tuple(conn.execute("SELECT staff_department, job_title FROM StaffProfile WHERE person_id=?",
+                              (uid,)).fetchone()) == ('Finance', 'Accountant')
+    for table in ('StudentProfile', 'PhdProfile', 'FacultyProfile'):
+        assert conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0
+    person = profiles.load_person(conn, uid)
+    assert (person['first_name'], person['job_title'], person['national_id']) == ('Mohamed', 'Accountant', None)
+
+
+def test_delete_cascades_to_profiles(client, create, conn):
+    uid = create()
+    client.post(f'/delete/{uid}')
+    assert conn.execute("SELECT COUNT(*) FROM StaffProfile").fetchone()[0] == 0
+
+
+def test_blanking_profile_columns_updates_in_place(create, conn):
+    uid = create()
+    profiles.save_profiles(conn, uid, {'job_title': '', 'national_id': ''})
+    conn.commit()
+    assert conn.execute("SELECT job_title FROM StaffProfile WHERE person_id=?", (uid,)).fetchone()[0] == ''
+    assert conn.execute("SELECT COUNT(*) FROM StudentProfile").fetchone()[0] == 0
+
+
+def test_wide_table_is_split_into_profiles(tmp_path):
+    conn = db.connect(str(tmp_path / 'legacy.db'))
+    try:
+        # a database as it stood before the profile tables
+        conn.execute("BEGIN IMMEDIATE")
+        migrations.MIGRATIONS[0][2](conn.cursor())
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+        conn.execute("INSERT INTO People (id, type, first_name, last_name, email, national_id, entry_year) "
+                     "VALUES ('STU202600001', 'Student', 'Sara', 'Amrani', 's@example.com', 'AB1', 2024)")
+        conn.execute("INSERT INTO People (id, type, first_name, last_name, email, job_title) "
+                     "VALUES ('STF202600001', 'Staff', 'Walid', 'Haddad', 'w@example.com', '')")
+        conn.commit()
+        rowid = conn.execute("SELECT rowid FROM People WHERE id='STU202600001'").fetchone()[0]
+
+        applied = migrations.migrate(conn)
+        assert applied[0] == (2, migrations.MIGRATIONS[1][1])
+        assert migrations.migrate(conn) == []
+        assert 'national_id' not in {r[1] for r in conn.execute("PRAGMA table_info(People)")}
+        assert conn.execute("SELECT rowid FROM People WHERE id='STU202600001'").fetchone()[0] == rowid
+        assert [tuple(r) for r in conn.execute("SELECT national_id, entry_year FROM StudentProfile")] == \
+            [('AB1', 2024)]
+        # a group holding only blanks gets no row
+        assert conn.execute("SELECT COUNT(*) FROM StaffProfile").fetchone()[0] == 0
+        assert conn.execute("SELECT rowid FROM PeopleSearch WHERE PeopleSearch MATCH 'sara'").fetchone()[0] == rowid
+    finally:
+        conn.close()
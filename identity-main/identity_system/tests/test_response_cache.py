@@ -0,0 +1,96 @@
+import gzip
+
+import pytest
+
+from response_cache import CachedPage, ResponseCache
+
+
+@pytest.fixture
+def cached(db_path, monkeypatch):
+    """RESPONSE_CACHE on (it is off in development); must come before `client`"""
+    monkeypatch.setenv('RESPONSE_CACHE', '1')
+
+
+def _stats(client):
+    return client.get('/metrics/responses').get_json()
+
+
+def test_off_in_development(client):
+    assert _stats(client) == {'enabled': False}
+
+
+def test_second_request_is_served_from_cache(cached, client, create):
+    uid = create()
+    first = client.get(f'/view/{uid}')
+    second = client.get(f'/view/{uid}')
+    assert second.status_code == 200 and second.data == first.data
+    assert second.headers['ETag'] == first.headers['ETag']
+    stats = _stats(client)
+    assert (stats['misses'], stats['hits'], stats['entries']) == (1, 1, 1)
+
+
+def test_query_string_is_part_of_the_key(cached, client, create):
+    create()
+    client.get('/view_all?sort=id')
+    client.get('/view_all?sort=last_name')
+    client.get('/view_all?sort=id')
+    stats = _stats(client)
+    assert (stats['misses'], stats['hits']) == (2, 1)
+
+
+def test_matching_etag_answers_304(cached, client, create):
+    uid = create()
+    etag = client.get(f'/view/{uid}').headers['ETag']
+    assert etag.startswith('W/')
+    response = client.get(f'/view/{uid}', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b''
+    assert response.headers['ETag'] == etag
+    assert _stats(client)['not_modified'] == 1
+
+
+def test_last_modified_answers_304(cached, client, create):
+    uid = create()
+    modified = client.get(f'/view/{uid}').headers['Last-Modified']
+    response = client.get(f'/view/{uid}', headers={'If-Modified-Since': modified})
+    assert response.status_code == 304
+
+
+def test_write_invalidates_cached_pages(cached, client, create):
+    create()
+    before = client.get('/view_all')
+    create(first_name='Yassine', email='yassine@example.com')
+    after = client.get('/view_all')
+    assert b'Yassine' in after.data and b'Yassine' not in before.data
+    assert after.headers['ETag'] != before.headers['ETag']
+    # the old validator no longer matches the page cached for the new version
+    response = client.get('/view_all', headers={'If-None-Match': before.headers['ETag']})
+    assert response.status_code == 200
+    stats = _stats(client)
+    assert (stats['misses'], stats['hits']) == (2, 1)
+
+
+def test_large_pages_are_gzipped_once(cached, client, create):
+    create()
+    plain = client.get('/view_all')
+    assert 'Content-Encoding' not in plain.headers and 'Accept-Encoding' in plain.headers['Vary']
+    first = client.get('/view_all', headers={'Accept-Encoding': 'gzip'})
+    second = client.get('/view_all', headers={'Accept-Encoding': 'gzip'})
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(first.data) == plain.data
+    # the compressed body is kept with the page, so both hits send the same bytes
+    assert second.data == first.data
+    stats = _stats(client)
+    assert stats['compression'] and stats['bytes_sent'] < stats['bytes_rendered']
+
+
+def test_cache_is_bounded_by_bytes():
+    cache = ResponseCache(max_bytes=100)
+    for n in range(3):
+        cache.put(('page', n), 1, CachedPage(b'x' * 40, 'text/html', str(n), None))
+    assert cache.get(('page', 0), 1) is None
+    assert cache.get(('page', 2), 1) is not None
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (2, 80, 1)
+    # a newer data version drops everything stored for the old one
+    assert cache.get(('page', 2), 2) is None
+    assert cache.stats()['entries'] == 0
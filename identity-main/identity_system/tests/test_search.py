@@ -0,0 +1,59 @@
+import search_index
+
+
+def _search(conn, **criteria):
+    rows, _ = search_index.search_people(conn, **criteria)
+    return [r['id'] for r in rows]
+
+
+def test_prefix_words_diacritics_and_ranking(create, conn):
+    name_hit = create(first_name='Amine', last_name='Finance', email='a.finance@example.com')
+    dept_hit = create(first_name='Walid', last_name='Haddad', email='w.haddad@example.com')
+    assert set(_search(conn, query='fin')) == {name_hit, dept_hit}
+    # a name match ranks above a department match
+    assert _search(conn, query='finance')[0] == name_hit
+    assert _search(conn, query='wal had') == [dept_hit]
+    assert _search(conn, query='wâlid') == [dept_hit]
+    assert _search(conn, query='fin', department_filter='finance') == [name_hit, dept_hit]
+
+
+def test_filters_and_paging(create, conn):
+    ids = [create(first_name=f'Name{i}', email=f'n{i}@example.com') for i in range(3)]
+    rows, total = search_index.search_people(conn, type_filter='Staff', page=2, page_size=2)
+    assert total == 3 and [r['id'] for r in rows] == [ids[2]]
+    assert _search(conn, status_filter='Active') == []
+
+
+def test_index_follows_edits_and_deletes(client, create, conn):
+    uid = create(first_name='Yasmine', email='y.benali@example.com')
+    other = create(first_name='Karim', email='k.benali@example.com')
+    assert _search(conn, query='Yasmine') == [uid]
+    assert [r[0] for r in search_index.typeahead(conn, 'Yas')] == [uid]
+
+    version = conn.execute("SELECT version FROM People WHERE id=?", (uid,)).fetchone()[0]
+    client.post(f'/edit/{uid}', data={'first_name': 'Lina', 'job_title': 'Librarian', 'version': version})
+    assert _search(conn, query='Yasmine') == []
+    assert _search(conn, query='Lina') == [uid]
+
+    client.post(f'/delete/{other}')
+    assert _search(conn, query='Karim') == []
+    assert search_index.typeahead(conn, 'Kar') == []
+    # the index rows are exactly the live identities
+    indexed = conn.execute("SELECT COUNT(*) FROM PeopleSearch").fetchone()[0]
+    assert indexed == conn.execute("SELECT COUNT(*) FROM People").fetchone()[0] == 1
+
+
+def test_profile_changes_are_indexed(client, create, conn):
+    uid = create()
+    version = conn.execute("SELECT version FROM People WHERE id=?", (uid,)).fetchone()[0]
+    client.post(f'/edit/{uid}', data={'staff_department': 'Library', 'version': version})
+    assert _search(conn, department_filter='library') == [uid]
+    assert _search(conn, department_filter='finance') == []
+
+
+def test_search_page(client, create):
+    create()
+    page = client.post('/search', data={'query': 'benal'}).get_data(as_text=True)
+    assert 'Benali' in page
+    page = client.get('/search?query=nobody').get_data(as_text=True)
+    assert 'Benali' not in page
@@ -0,0 +1,39 @@
+import lifecycle
+import stats
+
+
+def test_counters_follow_every_write_path(client, create, conn):
+    ids = [create(first_name=f'Name{i}', email=f'name{i}@example.com') for i in range(3)]
+    assert stats.drift(conn) == []
+
+    version = conn.execute("SELECT version FROM People WHERE id=?", (ids[0],)).fetchone()[0]
+    client.post(f'/edit/{ids[0]}', data={'staff_department': 'Library', 'version': version})
+    assert stats.drift(conn) == []
+
+    lifecycle.apply_transition(conn, 'Pending', 'Active', 0)
+    client.post('/api/v1/identities/batch', json={'set': {'staff_department': 'Library'}, 'ids': ids[1:]})
+    assert stats.drift(conn) == []
+
+    client.post(f'/delete/{ids[1]}')
+    assert stats.drift(conn) == []
+    counts = stats.load_stats(conn)
+    assert counts['total'] == 2 and counts['by_type'] == {'Staff': 2}
+    assert [(g['value'], g['total']) for g in counts['status']] == [('Active', 2)]
+
+
+def test_drift_is_found_and_rebuilt(app, create, conn):
+    create()
+    conn.execute("UPDATE StatsCounters SET count = count + 5 WHERE dimension='status'")
+    conn.commit()
+    assert len(stats.drift(conn)) == 1
+    runner = app.test_cli_runner()
+    assert '1 counters out of date' in runner.invoke(args=['rebuild-stats', '--check']).output
+    assert 'Rebuilt' in runner.invoke(args=['rebuild-stats']).output
+    assert stats.drift(conn) == []
+
+
+def test_dashboard_and_api(client, create):
+    create()
+    create(type='Student', national_id='AB1', first_name='Sara', email='s@example.com')
+    assert client.get('/api/v1/stats').get_json()['by_type'] == {'Staff': 1, 'Student': 1}
+    assert client.get('/stats').status_code == 200
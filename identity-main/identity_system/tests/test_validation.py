@@ -0,0 +1,49 @@
+from conftest import STAFF
+from validation import validate_many, validate_user_data
+
+
+def test_valid_record_passes(conn):
+    assert validate_user_data(STAFF, conn) == []
+
+
+def test_duplicates_of_stored_identities(create, conn):
+    create()
+    errors = validate_user_data(dict(STAFF, first_name='MOHAMED ', email='Mohamed.Benali@example.com'), conn)
+    assert "An identity with the same name, date of birth, and type already exists" in errors
+    assert "Email already exists" in errors
+    # the same person may hold an identity of another type
+    student = dict(STAFF, type='Student', national_id='AB123', email='other@example.com')
+    assert validate_user_data(student, conn) == []
+
+
+def test_validate_many_checks_the_database_and_earlier_records(create, conn):
+    create()
+    records = [
+        dict(STAFF),
+        dict(STAFF, first_name='Karim', email='karim@example.com'),
+        dict(STAFF, first_name='Walid', email='KARIM@example.com'),
+        dict(STAFF, first_name='Karim', email='karim2@example.com'),
+    ]
+    results = validate_many(records, conn)
+    assert "Email already exists" in results[0]
+    assert results[1] == []
+    assert results[2] == ["Email already used by record 2 in this batch"]
+    assert results[3] == ["Same name, date of birth, and type as record 2 in this batch"]
+
+
+def test_rejected_records_do_not_claim_their_keys(conn):
+    """A record with other errors is never inserted, so a later valid one may use its email and name"""
+    records = [
+        dict(STAFF, phone='not a number'),
+        dict(STAFF, job_title=''),
+        dict(STAFF),
+    ]
+    results = validate_many(records, conn)
+    assert results[0] == ["Phone must contain only numbers"]
+    assert results[1] == ["Job title is required"]
+    assert results[2] == []
+
+
+def test_validate_many_matches_validate_user_data(conn):
+    records = [dict(STAFF, email='bad'), dict(STAFF, dob='2999-01-01', email='x@example.com'), {}]
+    assert validate_many(records, conn) == [validate_user_data(r, conn) for r in records]
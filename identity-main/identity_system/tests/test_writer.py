@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import db
+from conftest import STAFF
+from db_gateway import GatewayTimeout
+from writer import WriteCoordinator, WriterFailed
+
+
+def _insert(conn, value):
+    conn.execute("INSERT INTO Items (value) VALUES (?)", (value,))
+    return value
+
+
+def _fail(conn, value):
+    conn.execute("INSERT INTO Items (value) VALUES (?)", (value,))
+    raise ValueError("rejected")
+
+
+def _values(conn):
+    return sorted(r[0] for r in conn.execute("SELECT value FROM Items"))
+
+
+def _blocked(coordinator):
+    """Keep the writer busy in its own batch until the returned event is set"""
+    started, release = threading.Event(), threading.Event()
+
+    def wait(conn):
+        started.set()
+        release.wait(5)
+    future = coordinator.submit(wait)
+    assert started.wait(5)
+    return future, release
+
+
+def _wait_queued(coordinator, n):
+    deadline = time.monotonic() + 5
+    while coordinator.stats()['queued'] < n:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def items(conn):
+    conn.execute("CREATE TABLE Items (value TEXT)")
+    conn.commit()
+    return conn
+
+
+@pytest.fixture
+def coordinator(items, db_path):
+    writer = WriteCoordinator(lambda: db.connect(db_path, db.pragmas_from_env()), max_delay=0.01)
+    yield writer
+    writer.stop()
+
+
+def test_queued_writes_share_one_commit(coordinator, items):
+    running, release = _blocked(coordinator)
+    futures = [coordinator.submit(_insert, f'v{n}') for n in range(3)]
+    release.set()
+    assert [f.result(5) for f in futures] == ['v0', 'v1', 'v2']
+    batches = coordinator.stats()['batch_size']
+    # the blocking write alone, then the three queued behind it together
+    assert (batches['count'], batches['sum']) == (2, 4)
+    assert _values(items) == ['v0', 'v1', 'v2']
+
+
+def test_failing_write_is_rolled_back_alone(coordinator, items):
+    running, release = _blocked(coordinator)
+    ok = coordinator.submit(_insert, 'kept')
+    bad = coordinator.submit(_fail, 'dropped')
+    also_ok = coordinator.submit(_insert, 'also kept')
+    release.set()
+    assert ok.result(5) == 'kept' and also_ok.result(5) == 'also kept'
+    with pytest.raises(ValueError):
+        bad.result(5)
+    assert _values(items) == ['also kept', 'kept']
+    assert coordinator.stats()['failed'] == 1
+
+
+def test_queued_write_times_out_without_writing(coordinator, items):
+    running, release = _blocked(coordinator)
+    with pytest.raises(GatewayTimeout):
+        coordinator.call(_insert, 'late', timeout=0.05)
+    release.set()
+    running.result(5)
+    assert coordinator.call(_insert, 'next') == 'next'
+    assert _values(items) == ['next']
+
+
+def test_failed_connect_fails_queued_writes_and_restarts(items, db_path):
+    healthy = threading.Event()
+
+    def connect():
+        if not healthy.is_set():
+            raise sqlite3.OperationalError("unable to open database file")
+        return db.connect(db_path, db.pragmas_from_env())
+
+    writer = WriteCoordinator(connect, timeout=5.0)
+    try:
+        with pytest.raises(WriterFailed):
+            writer.call(_insert, 'lost')
+        healthy.set()
+        assert writer.call(_insert, 'saved') == 'saved'
+        assert writer.stats()['restarts'] >= 1
+        assert _values(items) == ['saved']
+    finally:
+        writer.stop()
+
+
+def test_concurrent_creates_insert_one_identity(app, conn):
+    running, release = _blocked(app.extensions['writer'])
+    responses = []
+
+    def post(email):
+        data = dict(STAFF, email=email, confirm_not_duplicate='1')
+        responses.append(app.test_client().post('/create', data=data).get_data(as_text=True))
+
+    # both forms pass validation while the writer is busy, before either identity exists
+    threads = [threading.Thread(target=post, args=(f'mohamed{n}@example.com',)) for n in range(2)]
+    for t in threads:
+        t.start()
+    _wait_queued(app.extensions['writer'], 2)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert conn.execute("SELECT count(*) FROM People").fetchone()[0] == 1
+    assert sum("same name, date of birth, and type already exists" in body for body in responses) == 1
@@ -0,0 +1,181 @@
+import json
+import re
+from datetime import datetime
+
+from db import get_db_connection
+
+NAME_EXISTS = "An identity with the same name, date of birth, and type already exists"
+EMAIL_EXISTS = "Email already exists"
+
+
+class DuplicateIdentity(ValueError):
+    """Another write created the same identity after the form was validated"""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+# ========================
+# Duplicate Indexes
+# ========================
+def init_indexes(cur):
+    """Expression indexes matching the normalized duplicate lookups below"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_people_identity ON People(lower(first_name), lower(last_name), dob, type)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_people_email_lower ON People(lower(email))")
+
+
+# both duplicate checks in one round trip, each served by an index above
+DUPLICATE_QUERY = """SELECT
+    EXISTS(SELECT 1 FROM People WHERE lower(first_name)=? AND lower(last_name)=? AND dob=? AND type=?),
+    EXISTS(SELECT 1 FROM People WHERE lower(email)=?)"""
+
+# same checks for a whole batch, passed in as one JSON array of [fn, ln, dob, type, email]
+BATCH_DUPLICATE_QUERY = """WITH batch(idx, fn, ln, dob, type, email) AS (
+        SELECT key, json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]'),
+               json_extract(value, '$[3]'), json_extract(value, '$[4]')
+        FROM json_each(?))
+    SELECT idx,
+        EXISTS(SELECT 1 FROM People p WHERE lower(p.first_name)=batch.fn AND lower(p.last_name)=batch.ln
+                                        AND p.dob=batch.dob AND p.type=batch.type),
+        EXISTS(SELECT 1 FROM People p WHERE lower(p.email)=batch.email)
+    FROM batch"""
+
+# ========================
+# Validate User Data
+# ========================
+def validate_user_data(data, conn=None):
+    """Validate user data before creating identity"""
+    name_key, email_key = _duplicate_keys(data)
+    name_dup = email_dup = False
+    if name_key or email_key:
+        conn = conn or get_db_connection()
+        params = (name_key or (None, None, None, None)) + (email_key,)
+        name_dup, email_dup = conn.execute(DUPLICATE_QUERY, params).fetchone()
+    return _record_errors(data, name_dup, email_dup)
+
+
+def check_duplicates(conn, data):
+    """Repeat only the duplicate checks; run inside the write transaction that inserts `data`"""
+    name_key, email_key = _duplicate_keys(data)
+    params = (name_key or (None, None, None, None)) + (email_key,)
+    name_dup, email_dup = conn.execute(DUPLICATE_QUERY, params).fetchone()
+    errors = ([NAME_EXISTS] if name_dup else []) + ([EMAIL_EXISTS] if email_dup else [])
+    if errors:
+        raise DuplicateIdentity(errors)
+
+
+def validate_many(records, conn=None):
+    """Validate a batch of records in one set-based pass.
+
+    Returns one error list per record, in order. Each record is checked against
+    the database and against the records before it in the same batch.
+    """
+    records = list(records)
+    if not records:
+        return []
+    keys = [_duplicate_keys(data) for data in records]
+    conn = conn or get_db_connection()
+    payload = json.dumps([list(name_key or (None, None, None, None)) + [email_key]
+                          for name_key, email_key in keys])
+    found = {idx: (name_dup, email_dup)
+             for idx, name_dup, email_dup in conn.execute(BATCH_DUPLICATE_QUERY, (payload,))}
+
+    seen_names, seen_emails = {}, {}
+    results = []
+    for idx, (data, (name_key, email_key)) in enumerate(zip(records, keys)):
+        name_dup, email_dup = found.get(idx, (False, False))
+        errors = _record_errors(data, name_dup, email_dup)
+        if name_key in seen_names:
+            errors.append(f"Same name, date of birth, and type as record {seen_names[name_key] + 1} in this batch")
+        if email_key in seen_emails:
+            errors.append(f"Email already used by record {seen_emails[email_key] + 1} in this batch")
+        # only a record that will be inserted can clash with the ones after it
+        if not errors:
+            if name_key:
+                seen_names[name_key] = idx
+            if email_key:
+                seen_emails[email_key] = idx
+        results.append(errors)
+    return results
+
+
+def _duplicate_keys(data):
+    name_key = None
+    # duplicate check: same name + dob + same type (allow different types for same person)
+    if data.get('first_name') and data.get('last_name') and data.get('dob') and data.get('type'):
+        name_key = (data['first_name'].strip().lower(), data['last_name'].strip().lower(), data['dob'], data['type'])
+    email = str(data.get('email') or '').strip()
+    return name_key, (email.lower() or None)
+
+
+def _record_errors(data, name_dup, email_dup):
+    errors = []
+    
+    # Check for empty fields
+    required_fields = ['first_name', 'last_name', 'email', 'dob', 'type']
+    for field in required_fields:
+        if not data.get(field) or str(data.get(field)).strip() == '':
+            errors.append(f"{field.replace('_', ' ')} cannot be empty")
+
+    if name_dup:
+        errors.append(NAME_EXISTS)
+    
+    # Check first name (at least 2 characters)
+    first_name = str(data.get('first_name') or '').strip()
+    if first_name and len(first_name) < 2:
+        errors.append("First name must be at least 2 characters")
+    # also check last name exists (same requirement)
+    last_name = str(data.get('last_name') or '').strip()
+    if last_name and len(last_name) < 2:
+        errors.append("Last name must be at least 2 characters")
+
+    # type‑specific required fields
+    if data.get('type') == 'Student':
+        if not data.get('national_id') or not str(data.get('national_id')).strip():
+            errors.append("Student national ID is required")
+    if data.get('type') == 'Faculty':
+        if not data.get('faculty_rank') or not str(data.get('faculty_rank')).strip():
+            errors.append("Faculty rank is required")
+        if not data.get('primary_department') or not str(data.get('primary_department')).strip():
+            errors.append("Primary department is required")
+    if data.get('type') == 'Staff':
+        if not data.get('staff_department') or not str(data.get('staff_department')).strip():
+            errors.append("Staff department is required")
+        if not data.get('job_title') or not str(data.get('job_title')).strip():
+            errors.append("Job title is required")
+    
+    # Check email validity
+    email = str(data.get('email') or '').strip()
+    email_regex = r'^[^\s@]+@[^\s@]+\.[^\s@]+$'
+    if email and not re.match(email_regex, email):
+        errors.append("Invalid email format")
+    
+    # Check if email is not duplicate
+    if email and email_dup:
+        errors.append(EMAIL_EXISTS)
+    
+    # Check phone number (numbers only)
+    phone = str(data.get('phone') or '').strip()
+    if phone and not phone.isdigit():
+        errors.append("Phone must contain only numbers")
+    
+    # Check birth date
+    dob = data.get('dob')
+    if dob:
+        try:
+            dob_date = datetime.strptime(dob, '%Y-%m-%d')
+            today = datetime.now()
+            
+            # Check if date is not in future
+            if dob_date > today:
+                errors.append("Birth date cannot be in the future")
+            
+            # Check age (>=16 for students)
+            age = (today - dob_date).days / 365.25
+            user_type = data.get('type')
+            if user_type == 'Student' and age < 16:
+                errors.append("You must be at least 16 years old")
+        except ValueError:
+            errors.append("Invalid date format")
+    
+    return errors
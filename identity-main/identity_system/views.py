@@ -0,0 +1,352 @@
+from datetime import datetime
+from itertools import islice
+import csv
+import io
+import tempfile
+
+from flask import Blueprint, Response, current_app, jsonify, redirect, render_template, request, stream_template
+
+import cache
+import dedupe
+import edits
+import id_allocator
+import importer
+import outbox
+import pagination
+import profiles
+import search_index
+import stats
+from db import get_db_connection
+from lifecycle import is_valid_transition
+from validation import DuplicateIdentity, check_duplicates, validate_user_data
+
+bp = Blueprint('views', __name__)
+
+# search form fields
+SEARCH_FIELDS = ["query", "type_filter", "status_filter", "year_filter", "department_filter"]
+
+
+def _wake_mail_workers():
+    """Start the outbox workers if needed and tell them new mail is queued"""
+    workers = current_app.extensions['outbox']
+    workers.start()
+    workers.notify()
+
+# ========================
+# Identity Writes
+# ========================
+def generate_id(conn, user_type):
+    """Allocate the next ID for user_type; must run in the same transaction as the INSERT"""
+    return id_allocator.allocate_id(conn, user_type)
+
+
+def _insert_identity(conn, person, profile_values):
+    """Insert one identity, its profiles and its confirmation email; runs inside the writer's transaction"""
+    # the form was checked before queueing; a concurrent create of the same identity may have committed since
+    check_duplicates(conn, person)
+    uid = generate_id(conn, person['type'])
+    row = dict(person, id=uid, status_changed_at=datetime.now().isoformat())
+    conn.execute(f"INSERT INTO People ({','.join(row)}) VALUES ({','.join('?' * len(row))})", list(row.values()))
+    # category-specific values go to the profile tables
+    profiles.save_profiles(conn, uid, profile_values, new=True)
+    dedupe.refresh_pending(conn)
+    # queue confirmation email together with the new identity
+    if person['email']:
+        outbox.send_confirmation(conn, person['email'], uid)
+    return uid
+
+
+def _update_identity(conn, uid, changes, version):
+    """write_edit plus re-keying of renamed identities; runs inside the writer's transaction"""
+    version = edits.write_edit(conn, uid, changes, version)
+    dedupe.refresh_pending(conn)
+    return version
+
+# ========================
+# Home Page
+# ========================
+@bp.route("/")
+def index():
+    return render_template("index.html")
+
+# ========================
+# Create Identity
+# ========================
+@bp.route("/create", methods=["GET","POST"])
+def create():
+    if request.method == "POST":
+        user_type = request.form.get("type")
+        first_name = request.form.get("first_name")
+        last_name = request.form.get("last_name")
+        dob = request.form.get("dob")
+        place_of_birth = request.form.get("place_of_birth")
+        nationality = request.form.get("nationality")
+        gender = request.form.get("gender")
+        email = request.form.get("email")
+        phone = request.form.get("phone")
+        status = "Pending"
+        # category-specific values
+        national_id = request.form.get("national_id")
+        diploma_type = request.form.get("diploma_type")
+        diploma_year = request.form.get("diploma_year")
+        entry_year = request.form.get("entry_year")
+        faculty_rank = request.form.get("faculty_rank")
+        primary_department = request.form.get("primary_department")
+        staff_department = request.form.get("staff_department")
+        job_title = request.form.get("job_title")
+        staff_entry_date = request.form.get("staff_entry_date")
+        
+        # Validate data
+        validation_data = {
+            'type': user_type,
+            'first_name': first_name,
+            'last_name': last_name,
+            'dob': dob,
+            'email': email,
+            'phone': phone,
+            'national_id': national_id,
+            'faculty_rank': faculty_rank,
+            'primary_department': primary_department,
+            'staff_department': staff_department,
+            'job_title': job_title
+        }
+        
+        errors = validate_user_data(validation_data)
+        if errors:
+            return render_template("create.html", errors=errors)
+
+        # near matches (spelling variants, typos, swapped names) need an explicit confirmation
+        if not request.form.get("confirm_not_duplicate"):
+            matches = dedupe.find_matches(get_db_connection(), validation_data)
+            if matches:
+                return render_template("create.html", possible_duplicates=matches)
+
+        try:
+            # written by the group-commit writer, together with whatever else is queued
+            uid = current_app.extensions['writer'].call(
+                _insert_identity,
+                {'type': user_type, 'first_name': first_name.strip(), 'last_name': last_name.strip(), 'dob': dob,
+                 'place_of_birth': place_of_birth, 'nationality': nationality, 'gender': gender,
+                 'email': email.strip().lower(), 'phone': phone, 'status': status},
+                {'national_id': national_id, 'diploma_type': diploma_type, 'diploma_year': diploma_year,
+                 'entry_year': entry_year, 'faculty_rank': faculty_rank, 'primary_department': primary_department,
+                 'staff_department': staff_department, 'job_title': job_title, 'staff_entry_date': staff_entry_date})
+            _wake_mail_workers()
+            return render_template("success.html", 
+                                 uid=uid,
+                                 identity_type=user_type,
+                                 first_name=first_name.strip(),
+                                 last_name=last_name.strip(),
+                                 email=email.strip().lower(),
+                                 status=status,
+                                 national_id=national_id,
+                                 diploma_type=diploma_type,
+                                 entry_year=entry_year,
+                                 faculty_rank=faculty_rank,
+                                 primary_department=primary_department,
+                                 staff_department=staff_department,
+                                 job_title=job_title,
+                                 staff_entry_date=staff_entry_date)
+        except DuplicateIdentity as e:
+            return render_template("create.html", errors=e.errors)
+        except Exception as e:
+            return render_template("error.html", error=str(e))
+
+    return render_template("create.html")
+
+# ========================
+# View All Identities
+# ========================
+@bp.route("/view_all")
+def view_all():
+    sort = request.args.get("sort", "id")
+    if sort not in pagination.SORT_COLUMNS:
+        sort = "id"
+    direction = "desc" if request.args.get("dir") == "desc" else "asc"
+    conn = get_db_connection()
+    if request.args.get("export") == "all":
+        # stream every row so the first byte goes out before the whole table is read
+        return Response(stream_template("view_all.html", people=pagination.iter_rows(conn, sort, direction),
+                                        sort=sort, direction=direction, streaming=True))
+    page_size = pagination.clamp_page_size(request.args.get("page_size"), current_app.config['VIEW_ALL_PAGE_SIZE'])
+    try:
+        people, next_cursor = pagination.fetch_page(conn, sort, direction, request.args.get("cursor"), page_size)
+    except pagination.InvalidCursor as e:
+        return render_template("error.html", error=str(e)), 400
+    return render_template("view_all.html", people=people, sort=sort, direction=direction,
+                           page_size=page_size, next_cursor=next_cursor,
+                           first_page=not request.args.get("cursor"))
+
+# ========================
+# View Single Identity
+# ========================
+@bp.route("/view/<uid>")
+def view(uid):
+    person = cache.get_person(uid)
+    if not person:
+        return "Identity not found"
+    # fetch audit history
+    audits = cache.get_history(uid)
+    return render_template("view.html", person=person, audits=audits)
+
+# ========================
+# Delete identity
+# ========================
+@bp.route("/delete/<uid>", methods=["POST"])
+def delete(uid):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM People WHERE id=?", (uid,))
+    conn.commit()
+    cache.invalidate_identity(uid)
+    return redirect("/view_all")
+
+# ========================
+# Edit Identity
+# ========================
+@bp.route("/edit/<uid>", methods=["GET","POST"])
+def edit(uid):
+    conn = get_db_connection()
+    person = profiles.load_person(conn, uid)
+    if not person:
+        return "Identity not found"
+
+    if request.method == "POST":
+        # Check if trying to edit Archived status (not allowed)
+        if person['status'] == 'Archived':
+            return render_template("edit.html", person=person, error="Cannot edit archived identities")
+        
+        changes = edits.diff_changes(person, request.form)
+        new_status = request.form.get('status')
+        old_status = person['status']
+        
+        # Validate status transition
+        if new_status and new_status != old_status:
+            if not is_valid_transition(old_status, new_status, person['status_changed_at']):
+                from_to = f"{old_status} → {new_status}"
+                if old_status == 'Inactive' and new_status == 'Archived':
+                    years_ago = (datetime.now() - datetime.fromisoformat(person['status_changed_at'])).days / 365
+                    return render_template("edit.html", person=person, 
+                                         error=f"Cannot transition {from_to}: Inactive status requires 5 years before archiving (current: {years_ago:.1f} years)")
+                else:
+                    return render_template("edit.html", person=person, 
+                                         error=f"Invalid status transition: {from_to} is not allowed")
+        
+        if changes:
+            # the version the form was rendered with; falls back to the row just read
+            version = request.form.get('version', person['version'], type=int)
+            try:
+                current_app.extensions['writer'].call(_update_identity, uid, changes, version)
+            except edits.EditConflict:
+                person = profiles.load_person(conn, uid)
+                if not person:
+                    return "Identity not found"
+                return render_template("edit.html", person=person,
+                                       error="This identity was changed by someone else while you were editing. "
+                                             "Review the current values and save again.")
+        # covers field edits and status transitions alike
+        cache.invalidate_identity(uid)
+        return redirect(f"/view/{uid}")
+
+    return render_template("edit.html", person=person)
+
+# ========================
+# Bulk Import
+# ========================
+@bp.route("/import", methods=["GET","POST"])
+def bulk_import():
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            return render_template("import.html", error="Please choose a file to import")
+        stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        # rejected rows go to disk once they pass 1 MB so memory stays flat
+        report = tempfile.SpooledTemporaryFile(max_size=1024 * 1024, mode="w+", newline="")
+        on_created = outbox.send_confirmation if request.form.get("send_emails") else None
+        try:
+            summary = importer.import_records(get_db_connection(), stream, importer.detect_format(upload.filename),
+                                              report, current_app.config['IMPORT_CHUNK_SIZE'], on_created)
+        except Exception as e:
+            return render_template("import.html", error=str(e))
+        if on_created:
+            _wake_mail_workers()
+        report.seek(0)
+        if request.form.get("report") == "csv":
+            return Response(report, mimetype="text/csv",
+                            headers={"Content-Disposition": "attachment; filename=import_errors.csv"})
+        errors = list(islice(csv.DictReader(report), 100))
+        return render_template("import.html", summary=summary, errors=errors)
+    return render_template("import.html")
+
+
+# ========================
+# Search Identity
+# ========================
+@bp.route("/search", methods=["GET","POST"])
+async def search():
+    # filters come from the query string (pagination links) or a posted form
+    source = request.form if request.method == "POST" else request.args
+    criteria = {name: source.get(name, "").strip() for name in SEARCH_FIELDS}
+    searched = request.method == "POST" or any(name in source for name in SEARCH_FIELDS)
+    page = max(request.args.get("page", 1, type=int), 1)
+    page_size = current_app.config['SEARCH_PAGE_SIZE']
+    results, total = [], 0
+    if searched:
+        # ranked FTS queries can be slow; they run on the gateway threads, bounded and with a timeout
+        results, total = await current_app.extensions['db_gateway'].run(
+            search_index.search_people, page=page, page_size=page_size, **criteria)
+    pages = (total + page_size - 1) // page_size
+    return render_template("search.html", results=results, total=total, page=page, pages=pages,
+                           criteria=criteria, searched=searched)
+
+# ========================
+# Statistics
+# ========================
+@bp.route("/stats")
+def stats_page():
+    return render_template("stats.html", stats=stats.load_stats(get_db_connection()))
+
+# ========================
+# Outbox metrics
+# ========================
+@bp.route("/metrics/outbox")
+def outbox_metrics():
+    conn = get_db_connection()
+    stats = current_app.extensions['outbox'].stats(conn)
+    return jsonify(stats)
+
+# ========================
+# Connection pool metrics
+# ========================
+@bp.route("/metrics/db")
+def db_metrics():
+    return jsonify(current_app.extensions['db_pool'].stats())
+
+# ========================
+# DB gateway metrics
+# ========================
+@bp.route("/metrics/gateway")
+def gateway_metrics():
+    return jsonify(current_app.extensions['db_gateway'].stats())
+
+# ========================
+# Writer metrics
+# ========================
+@bp.route("/metrics/writer")
+def writer_metrics():
+    return jsonify(current_app.extensions['writer'].stats())
+
+# ========================
+# Cache metrics
+# ========================
+@bp.route("/metrics/cache")
+def cache_metrics():
+    return jsonify(current_app.extensions['identity_cache'].stats())
+
+# ========================
+# Response cache metrics
+# ========================
+@bp.route("/metrics/responses")
+def response_metrics():
+    cache = current_app.extensions.get('response_cache')
+    return jsonify(cache.stats() if cache else {'enabled': False})
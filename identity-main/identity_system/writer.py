@@ -0,0 +1,221 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from db_gateway import GatewayOverloaded, GatewayTimeout, GatewayUnavailable
+from instrumentation import BUCKETS, Histogram, current_trace, traced_job
+
+logger = logging.getLogger(__name__)
+
+
+class WriterFailed(GatewayUnavailable):
+    """The writer thread died (e.g. it could not connect); queued writes fail at once instead of timing out"""
+
+# operations per group commit
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# ========================
+# Writer
+# ========================
+class WriteCoordinator:
+    """One thread per process that runs every queued write on its own connection.
+
+    Operations are `fn(conn, *args)` callables that write without committing.
+    The thread takes whatever is queued (at most `max_batch` operations,
+    waiting up to `max_delay` seconds for more while writes overlap) and
+    runs them all in one BEGIN IMMEDIATE transaction, each inside its own
+    SAVEPOINT: an operation that raises is rolled back alone and its caller
+    gets the exception, while the rest of the batch commits together with
+    one fsync. Request threads never contend for the write lock among
+    themselves.
+    """
+
+    def __init__(self, connect, max_batch=64, max_delay=0.002, queue_size=256, timeout=10.0):
+        self._connect = connect
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batch_size = Histogram('identity_writer_batch_size', 'Operations per group commit',
+                                    buckets=BATCH_BUCKETS)
+        self.commit_seconds = Histogram('identity_writer_commit_duration_seconds',
+                                        'BEGIN IMMEDIATE to COMMIT of one group', buckets=BUCKETS)
+        self.wait_seconds = Histogram('identity_writer_wait_duration_seconds',
+                                      'Submit to result for one operation', buckets=BUCKETS)
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.batches_failed = 0
+        self.restarts = 0
+
+    def start(self):
+        """Start the writer thread, or a new one if the last one died (no-op if running)"""
+        with self._lock:
+            if self._thread is not None and not self._thread.is_alive():
+                self._thread = None
+                self.restarts += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=10):
+        """Let queued operations finish, then stop the thread"""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join(timeout)
+                self._thread = None
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(conn, *args, **kwargs); returns a concurrent.futures.Future"""
+        self.start()
+        future = Future()
+        try:
+            self._queue.put_nowait((future, fn, args, kwargs, time.monotonic(), current_trace()))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise GatewayOverloaded(f"database busy: {self._queue.maxsize} writes already queued")
+        # the thread may have died between start() and put(); a new one picks the job up
+        self.start()
+        return future
+
+    def call(self, fn, *args, timeout=None, **kwargs):
+        """Run fn(conn, ...) in the next group commit and return its result (or raise its error).
+
+        A write still queued after `timeout` is withdrawn and GatewayTimeout
+        is raised; one already running is always waited for, so the caller
+        never mistakes a committed write for a failed one.
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise GatewayTimeout("write was not started in time; nothing was written")
+            return future.result()
+
+    def _run(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            logger.exception("DB writer could not connect")
+            self._fail_queued(e)
+            return
+        try:
+            stopping = False
+            last_size = 1
+            while not stopping:
+                job = self._queue.get()
+                if job is None:
+                    return
+                batch = [job]
+                # a lone writer is not kept waiting; the delay only applies once writes overlap
+                linger = self.max_delay if last_size > 1 or not self._queue.empty() else 0
+                deadline = time.monotonic() + linger
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stopping = True
+                        break
+                    batch.append(job)
+                self._commit(conn, batch)
+                last_size = len(batch)
+        except Exception as e:
+            logger.exception("DB writer failed")
+            self._fail_queued(e)
+        finally:
+            conn.close()
+
+    def _fail_queued(self, cause):
+        """Fail every waiting write at once; the next submit starts a new thread"""
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if job is not None and job[0].set_running_or_notify_cancel():
+                error = WriterFailed(f"database writer stopped: {cause}")
+                error.__cause__ = cause
+                job[0].set_exception(error)
+                with self._lock:
+                    self.failed += 1
+
+    def _commit(self, conn, batch):
+        batch = [job for job in batch if job[0].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        started = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for future, fn, args, kwargs, _, trace in batch:
+                conn.execute("SAVEPOINT op")
+                try:
+                    # each operation's statements and spans go to the request that queued it
+                    with traced_job(conn, trace) as job_conn:
+                        result = fn(job_conn, *args, **kwargs)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    outcomes.append((e, None))
+                else:
+                    outcomes.append((None, result))
+                conn.execute("RELEASE op")
+            conn.commit()
+        except Exception as e:
+            # BEGIN or COMMIT failed (e.g. the lock was held too long by another process): nothing was written
+            if conn.in_transaction:
+                conn.rollback()
+            outcomes = [(e, None)] * len(batch)
+            with self._lock:
+                self.batches_failed += 1
+        else:
+            self.commit_seconds.observe(time.perf_counter() - started)
+        self.batch_size.observe(len(batch))
+
+        now = time.monotonic()
+        for (future, _, _, _, submitted, _), (error, result) in zip(batch, outcomes):
+            self.wait_seconds.observe(now - submitted)
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        with self._lock:
+            failed = sum(1 for error, _ in outcomes if error is not None)
+            self.failed += failed
+            self.completed += len(outcomes) - failed
+
+    def series(self):
+        return self.batch_size, self.commit_seconds, self.wait_seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._thread is not None and self._thread.is_alive(),
+                'restarts': self.restarts,
+                'queued': self._queue.qsize(),
+                'queue_size': self._queue.maxsize,
+                'max_batch': self.max_batch,
+                'max_delay_ms': self.max_delay * 1000,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'batches_failed': self.batches_failed,
+                'batch_size': self.batch_size.snapshot(),
+                'commit_seconds': self.commit_seconds.snapshot(),
+                'wait_seconds': self.wait_seconds.snapshot(),
+            }
+
+# ========================
+# Setup
+# ========================
+def init_app(app, coordinator):
+    app.extensions['writer'] = coordinator
@@ -0,0 +1,6 @@
+"""WSGI entry point for production servers, e.g. `gunicorn -c gunicorn.conf.py` or `waitress-serve wsgi:app`"""
+import os
+
+from app import create_app
+
+app = create_app(os.getenv("IDENTITY_CONFIG", "production"))